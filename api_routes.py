@@ -9,20 +9,20 @@ import traceback
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import Blueprint, request, jsonify, current_app
-from linebot import LineBotApi, WebhookHandler
+from linebot import WebhookHandler
 from linebot.models import TextSendMessage
 from linebot.exceptions import LineBotApiError
 from models import db, User
+from services.log_service import LogService
+from services.line_client import get_line_bot_api
+from services.push_delivery import PushDelivery
 
 # 設置日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+LogService.setup()
 logger = logging.getLogger(__name__)
 
 # 初始化 LINE API
-line_bot_api = LineBotApi(os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', ''))
+line_bot_api = get_line_bot_api()
 handler = WebhookHandler(os.environ.get('LINE_CHANNEL_SECRET', ''))
 
 # JWT 密鑰
@@ -138,16 +138,16 @@ def create_task(current_user):
             }
         }
         
-        # 通過 LINE Bot 發送消息
-        try:
-            line_bot_api.push_message(
-                current_user.line_user_id,
-                TextSendMessage(text=json.dumps(task_data))
-            )
-            logger.info(f"已成功發送任務通知: {task_name} 給用戶 {current_user.line_user_id}")
-        except LineBotApiError as line_error:
-            logger.error(f"LINE API 錯誤: {str(line_error)}")
-            return jsonify({'message': f'無法發送消息: {str(line_error)}'}), 500
+        # 通過 LINE Bot 發送消息（排入批次推送佇列，發送失敗時記錄錯誤）
+        line_user_id = current_user.line_user_id
+        
+        def on_sent(future):
+            if future.exception():
+                logger.error(f"LINE API 錯誤: {str(future.exception())}")
+            else:
+                logger.info(f"已成功發送任務通知: {task_name} 給用戶 {line_user_id}")
+        
+        PushDelivery.send(line_user_id, TextSendMessage(text=json.dumps(task_data))).add_done_callback(on_sent)
         
         return jsonify({
             'message': '任務已創建',
@@ -5,14 +5,14 @@
 import os
 import logging
 from flask import Flask, request, abort
-from linebot import LineBotApi, WebhookHandler
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 
+from services.log_service import LogService
+from services.line_client import get_line_bot_api
+
 # 設置日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+LogService.setup()
 logger = logging.getLogger(__name__)
 
 # 獲取環境變數
@@ -24,14 +24,17 @@ if not channel_secret or not channel_access_token:
     raise ValueError("LINE API 憑證未設置")
 
 # 初始化 LINE API
-line_bot_api = LineBotApi(channel_access_token)
+line_bot_api = get_line_bot_api(channel_access_token)
 handler = WebhookHandler(channel_secret)
 
 # 導入訊息處理模組
 from message_handler import handle_message, handle_postback
+from services.webhook_service import WebhookService
+from ops_routes import register_ops_routes
 
 # 創建應用
 app = Flask(__name__)
+register_ops_routes(app)
 
 @app.route("/", methods=["GET"])
 def home():
@@ -43,11 +46,10 @@ def webhook():
     """LINE 的 Webhook 接收端點"""
     signature = request.headers.get("X-Line-Signature", "")
     body = request.get_data(as_text=True)
-    logger.info("收到 Webhook 請求")
-    logger.debug("請求內容: %s", body)
+    LogService.record_body(body)
     
     try:
-        handler.handle(body, signature)
+        WebhookService.handle_webhook(handler, body, signature, app=app)
     except InvalidSignatureError:
         logger.error("無效的簽名")
         abort(400)
@@ -33,6 +33,10 @@ def create_app(config_name='default'):
     from app.routes.line_webhook import webhook_bp
     app.register_blueprint(webhook_bp)  # 移除URL前綴，直接註冊到根路徑
     
+    # 註冊運維路由（負載狀態）
+    from ops_routes import register_ops_routes
+    register_ops_routes(app)
+    
     # 註冊錯誤處理器
     from app.error_handlers import register_error_handlers
     register_error_handlers(app)
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, abort, jsonify, current_app
-from linebot import LineBotApi, WebhookHandler
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage, TemplateSendMessage, ButtonsTemplate, 
@@ -15,6 +15,11 @@ import os
 from services.task_service import TaskService
 from services.finance_service import FinanceService
 from services.flex_message_service import FlexMessageService
+from services.webhook_service import WebhookService
+from services.log_service import LogService
+from services.line_client import get_line_bot_api
+from services.push_delivery import PushDelivery
+from services.profile_cache import get_profile_cache
 import urllib.parse
 
 # 創建藍圖
@@ -25,7 +30,7 @@ logger = logging.getLogger(__name__)
 
 # 使用預設值初始化，確保不為None
 handler = WebhookHandler(os.environ.get('LINE_CHANNEL_SECRET', 'default_secret'))
-line_bot_api = LineBotApi(os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', 'default_token'))
+line_bot_api = get_line_bot_api(os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', 'default_token'))
 
 @webhook_bp.before_app_request
 def initialize_line_bot():
@@ -40,14 +45,12 @@ def initialize_line_bot():
             return
         
         # 只有當密鑰與當前不同時才重新初始化
-        if channel_secret != getattr(handler, 'secret', None):
+        if channel_secret.encode('utf-8') != handler.parser.signature_validator.channel_secret:
             handler = WebhookHandler(channel_secret)
             logger.info("LINE WebhookHandler 已重新初始化")
             
-        # 只有當令牌與當前不同時才重新初始化
-        if channel_access_token != getattr(line_bot_api, 'channel_access_token', None):
-            line_bot_api = LineBotApi(channel_access_token)
-            logger.info("LINE Bot API 客戶端已重新初始化")
+        # 共用客戶端依令牌快取，令牌不變時返回同一個實例與連線池
+        line_bot_api = get_line_bot_api(channel_access_token)
             
     except Exception as e:
         logger.error(f"LINE Bot API 客戶端初始化失敗: {str(e)}")
@@ -65,16 +68,17 @@ def webhook():
     
     # 獲取請求體
     body = request.get_data(as_text=True)
-    logger.info('請求內容: %s', body)
+    LogService.record_body(body)
     
     try:
         # 驗證簽名
-        handler.handle(body, signature)
+        WebhookService.handle_webhook(handler, body, signature, app=current_app._get_current_object())
     except InvalidSignatureError:
         logger.error('無效的簽名')
         return '無效的簽名', 400
     except Exception as e:
         logger.error('處理 webhook 時發生錯誤: %s', str(e))
+        LogService.dump_recent_bodies('處理 webhook 時發生錯誤')
         return '處理請求時發生錯誤', 500
     
     return 'OK'
@@ -111,7 +115,7 @@ def handle_text_message_wrapper(event):
             try:
                 # 獲取用戶資料
                 logger.info(f"嘗試獲取用戶 {user_id} 的資料")
-                line_user = line_bot_api.get_profile(user_id)
+                line_user = get_profile_cache().get_profile(line_bot_api, user_id)
                 logger.info(f"成功獲取用戶資料: {line_user.display_name}")
                 
                 # 創建新用戶
@@ -388,13 +392,10 @@ def line_notify():
         if not user or not user.line_user_id:
             return jsonify({'error': '用戶不存在或未綁定 LINE'}), 404
         
-        # 發送 LINE 通知
-        line_bot_api.push_message(
-            user.line_user_id,
-            TextSendMessage(text=message)
-        )
+        # 排入批次推送佇列，與其他通知合併發送
+        PushDelivery.send(user.line_user_id, TextSendMessage(text=message))
         
-        return jsonify({'message': '通知發送成功'})
+        return jsonify({'message': '通知已排入發送佇列'}), 202
     
     except Exception as e:
         logger.error(f"發送 LINE 通知時出錯: {str(e)}")
@@ -0,0 +1,281 @@
+"""
+ASGI入口點
+以 asyncio 處理 LINE Webhook，事件處理與 wsgi.py 使用相同的 message_handler 路由。
+LINE API 呼叫使用共用連線池的非同步客戶端，阻塞的資料庫操作放到執行緒池執行，
+因此單一進程可同時處理大量對話，不受 gunicorn 工作執行緒數限制。
+
+啟動方式: uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from linebot import AsyncLineBotApi
+from linebot.aiohttp_async_http_client import AiohttpAsyncHttpClient
+from linebot.exceptions import InvalidSignatureError
+from linebot.models import (
+    MessageEvent, TextMessage, PostbackEvent,
+    TextSendMessage, FlexSendMessage
+)
+
+from message_handler import (
+    handler, create_app, process_message, process_postback,
+    get_reply_path, get_postback_path
+)
+from services.webhook_service import WebhookService
+from services.reply_deadline import ReplyDeadline
+from services.admission_control import ACCEPT, DEFER
+from services.log_service import LogService
+from services.profile_cache import get_profile_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLY = "我不太理解您的意思。您可以輸入「kimi」查看主選單，或「help」查看幫助。"
+ERROR_REPLY = "處理您的請求時發生錯誤，請稍後再試。"
+
+
+def get_source_id(event):
+    """取得事件來源 ID，用於同一來源的事件依序處理"""
+    source = event.source
+    if source is None:
+        return ''
+    return getattr(source, 'user_id', None) or getattr(source, 'sender_id', None) or ''
+
+
+class AsyncWebhookApp:
+    """LINE Webhook 的 ASGI 應用
+
+    收到請求後驗證簽名、過濾重送事件，將事件排入背景工作後立即回應 200。
+    同一用戶的事件依到達順序處理（user_states 流程依賴此順序），不同用戶並行處理。
+    """
+
+    def __init__(self, flask_app=None):
+        """初始化
+
+        Args:
+            flask_app: 執行阻塞處理時使用的 Flask 應用（提供應用上下文）
+        """
+        self.flask_app = flask_app or create_app()
+        self.session = None
+        self.line_bot_api = None
+        self.executor = None
+        self._chains = {}
+        self._tasks = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        """建立共用的 HTTP 連線池、非同步 LINE 客戶端與執行緒池"""
+        pool_size = int(os.environ.get('ASGI_HTTP_POOL_SIZE', '100'))
+        timeout = float(os.environ.get('ASGI_HTTP_TIMEOUT', '10'))
+        workers = int(os.environ.get('ASGI_EXECUTOR_WORKERS', '16'))
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        )
+        self.line_bot_api = AsyncLineBotApi(
+            os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', ''),
+            AiohttpAsyncHttpClient(self.session),
+            endpoint=os.environ.get('LINE_API_ENDPOINT', AsyncLineBotApi.DEFAULT_API_ENDPOINT),
+            data_endpoint=os.environ.get('LINE_API_DATA_ENDPOINT', AsyncLineBotApi.DEFAULT_API_DATA_ENDPOINT)
+        )
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-worker')
+        logger.info(f"ASGI 模式已啟動，連線池: {pool_size}，執行緒池: {workers}")
+
+    async def shutdown(self):
+        """等待處理中的事件完成後釋放資源"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=10)
+        if self.session is not None:
+            await self.session.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        logger.info("ASGI 模式已停止")
+
+    async def _http(self, scope, receive, send):
+        path = scope['path']
+        method = scope['method']
+
+        if path == '/webhook' and method == 'POST':
+            status, text = await self._webhook(scope, receive)
+            await self._respond(send, status, text)
+        elif path == '/' and method == 'GET':
+            await self._respond(send, 200, "Financial Bot Server is running!")
+        elif path == '/health' and method == 'GET':
+            body = json.dumps({'status': 'ok', 'pending': len(self._tasks)})
+            await self._respond(send, 200, body, content_type=b'application/json')
+        elif path == '/health/saturation' and method == 'GET':
+            stats = WebhookService.get_admission().stats()
+            status = 503 if stats['status'] == 'saturated' else 200
+            await self._respond(send, status, json.dumps(stats), content_type=b'application/json')
+        else:
+            await self._respond(send, 404, "Not Found")
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        return b''.join(chunks).decode('utf-8')
+
+    @staticmethod
+    async def _respond(send, status, text, content_type=b'text/plain; charset=utf-8'):
+        body = text.encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', content_type),
+                (b'content-length', str(len(body)).encode('ascii'))
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _webhook(self, scope, receive):
+        """驗證並排入事件，返回 (狀態碼, 回應內容)"""
+        headers = dict(scope.get('headers') or [])
+        signature = headers.get(b'x-line-signature', b'').decode('utf-8')
+        body = await self._read_body(receive)
+        received_at = time.time()
+        LogService.record_body(body)
+
+        try:
+            events = handler.parser.parse(body, signature)
+        except InvalidSignatureError:
+            logger.error("無效的簽名")
+            return 400, "Bad Request"
+        except (ValueError, KeyError) as e:
+            logger.error(f"無法解析 Webhook 請求: {str(e)}")
+            return 400, "Bad Request"
+
+        raw_events = json.loads(body).get('events', [])
+        ReplyDeadline.track(raw_events, received_at)
+        deduplicator = WebhookService.get_deduplicator()
+        admission = WebhookService.get_admission()
+        defer_seconds = float(os.environ.get('ADMISSION_DEFER_SECONDS', '30'))
+        for event, raw_event in zip(events, raw_events):
+            if deduplicator.is_duplicate(event.webhook_event_id):
+                logger.info(f"略過重複事件: {event.webhook_event_id}")
+                continue
+            decision = admission.admit(raw_event)
+            if decision == ACCEPT:
+                self._schedule(event)
+            elif decision == DEFER:
+                self._schedule(event, delay=defer_seconds)
+
+        return 200, "OK"
+
+    def _schedule(self, event, delay=0):
+        """將事件接在同一來源的上一個事件之後處理，延後的事件不阻擋之後的事件"""
+        if delay:
+            task = asyncio.ensure_future(self._run_after(None, event, delay))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+
+        key = get_source_id(event)
+        previous = self._chains.get(key)
+        task = asyncio.ensure_future(self._run_after(previous, event))
+        self._chains[key] = task
+        self._tasks.add(task)
+
+        def done(finished):
+            self._tasks.discard(finished)
+            if self._chains.get(key) is finished:
+                del self._chains[key]
+
+        task.add_done_callback(done)
+
+    async def _run_after(self, previous, event, delay=0):
+        if previous is not None:
+            await asyncio.wait([previous])
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            with WebhookService.get_admission().track():
+                await self.handle_event(event)
+        except Exception as e:
+            logger.error(f"處理事件時發生錯誤: {str(e)}", exc_info=True)
+
+    async def handle_event(self, event):
+        """處理單一事件，與 message_handler 的 handle_message / handle_postback 行為一致"""
+        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+            if event.message.text.lower() == "kimi test":
+                try:
+                    await self._reply_bot_info(event)
+                except Exception as e:
+                    logger.error(f"測試 LINE API 連接失敗: {str(e)}", exc_info=True)
+                    await self._reply_error(event)
+                return
+            path = get_reply_path(event)
+            await self._process_and_reply(event, process_message, DEFAULT_REPLY, path)
+        elif isinstance(event, PostbackEvent):
+            path = get_postback_path(event)
+            await self._process_and_reply(event, process_postback, None, path)
+
+    async def _process_and_reply(self, event, process, default_reply, path):
+        try:
+            response = await self.run_blocking(process, event)
+            if isinstance(response, FlexSendMessage):
+                message = response
+            else:
+                message = TextSendMessage(text=response or default_reply)
+            await ReplyDeadline.reply_async(self.line_bot_api, event, message, path)
+        except Exception as e:
+            logger.error(f"處理事件時發生錯誤: {str(e)}", exc_info=True)
+            LogService.dump_recent_bodies('處理事件時發生錯誤')
+            await self._reply_error(event)
+
+    async def _reply_error(self, event):
+        try:
+            await ReplyDeadline.reply_async(
+                self.line_bot_api, event, TextSendMessage(text=ERROR_REPLY), 'error'
+            )
+        except Exception as reply_error:
+            logger.error(f"發送錯誤訊息失敗: {str(reply_error)}")
+
+    async def _reply_bot_info(self, event):
+        """kimi test：以非同步客戶端測試 LINE API 連接"""
+        bot_info = await get_profile_cache().get_bot_info_async(self.line_bot_api)
+        response = f"API 連接正常!\nBot名稱: {bot_info.display_name}\n"
+        response += f"TOKEN前10字元: {os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', '')[:10]}...\n"
+        response += f"SECRET前10字元: {os.environ.get('LINE_CHANNEL_SECRET', '')[:10]}..."
+        await ReplyDeadline.reply_async(
+            self.line_bot_api, event, TextSendMessage(text=response), 'message:kimi'
+        )
+
+    async def run_blocking(self, func, *args):
+        """在執行緒池中（Flask 應用上下文內）執行阻塞函數"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call_in_context, func, args)
+
+    def _call_in_context(self, func, args):
+        with self.flask_app.app_context():
+            return func(*args)
+
+
+# 創建應用程式實例
+app = AsyncWebhookApp()
@@ -0,0 +1,58 @@
+"""
+記帳命令解析的吞吐量測試
+比較舊版解析函數（逐一嘗試多個正則表達式，tests/legacy_finance_parser）與 services/command_parser
+每秒可解析的訊息數；兩者的等價性由 tests/test_finance_parser_equivalence.py 檢查
+
+使用方式:
+    python benchmarks/bench_finance_parser.py --iterations 200000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.command_parser import parse_message_command  # noqa: E402
+from tests.legacy_finance_parser import legacy_parse_message  # noqa: E402
+
+
+def realistic_samples(count, seed):
+    """依常見訊息格式產生的樣本，作為吞吐量測試的訊息組成"""
+    rng = random.Random(seed)
+    categories = ['早餐', '午餐', '晚餐', '交通', '咖啡', '薪資', 'lunch', '星巴克']
+    notes = ['', ' 麥當勞', ' 公車', ' 和同事']
+    templates = [
+        lambda: f"{rng.choice(categories)}-{rng.randint(1, 2000)}",
+        lambda: f"{rng.choice(categories)}{rng.randint(1, 2000)}{rng.choice(notes)}",
+        lambda: f"{rng.choice(categories)}+{rng.randint(100, 50000)}{rng.choice(notes)}",
+        lambda: rng.choice(['今天', '昨天', '本週', '本月', '月報', '月報2024-3']),
+        lambda: rng.choice(['help', '記錄', '選單', '任務：交報告 提醒：明天下午3點', '你好', '謝謝']),
+    ]
+    return [rng.choice(templates)() for _ in range(count)]
+
+
+def throughput(parse, samples, iterations):
+    """每秒解析的訊息數"""
+    count = len(samples)
+    start = time.perf_counter()
+    for index in range(iterations):
+        parse(samples[index % count])
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='記帳命令解析的吞吐量測試')
+    parser.add_argument('--iterations', type=int, default=200000, help='吞吐量測試的解析次數')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    workload = realistic_samples(5000, args.seed)
+    legacy_rate = throughput(legacy_parse_message, workload, args.iterations)
+    new_rate = throughput(parse_message_command, workload, args.iterations)
+    print(f"吞吐量（每則訊息完整解析）: 舊版 {legacy_rate:,.0f}/s，新版 {new_rate:,.0f}/s，{new_rate / legacy_rate:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+模型後端的批次與快取測試
+以 stub_model_server 模擬本機模型伺服器，多個執行緒同時送出訊息，比較：
+    - 直接呼叫：每則訊息一次模型呼叫
+    - ModelClient：同時到達的訊息合併為一次呼叫，相同訊息共用結果
+    - 重複訊息：第二輪全部命中快取，不得再呼叫模型
+    - 逐則送出：沒有其他請求時，單獨一則訊息也在 batch_wait 後送出
+第二輪有任何模型呼叫、結果與第一輪不同或逐則送出未完成時以非零狀態結束
+
+使用方式:
+    python benchmarks/bench_model_backend.py --messages 200 --threads 32 --latency 0.05
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'linebot-ai'))
+
+from stub_model_server import start_server  # noqa: E402
+from src.services.model_backend import (  # noqa: E402
+    HttpModelBackend, ModelClient, load_prompt, render_prompt, parse_model_output
+)
+
+ITEMS = ['午餐', '早餐', '晚餐', '咖啡', '計程車', '捷運', '電影', '買書', '衣服', '飲料']
+OTHERS = ['提醒我明天開會', '記得下午3點打電話給媽媽', '買牛奶', '寫報告', '整理房間']
+
+
+def workload(count, seed):
+    """常見的記帳、提醒與任務訊息，約三成重複（例如「午餐120」）"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        if messages and rng.random() < 0.3:
+            messages.append(rng.choice(messages))
+        elif rng.random() < 0.8:
+            messages.append(f"{rng.choice(ITEMS)}{rng.choice([35, 50, 65, 120, 150, 200, 300])}")
+        else:
+            messages.append(rng.choice(OTHERS))
+    return messages
+
+
+def run_concurrently(function, messages, threads):
+    """以多個執行緒同時處理訊息，返回 (結果列表, 秒數)"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(function, messages))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模型後端的批次與快取測試')
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32, help='同時送出訊息的執行緒數')
+    parser.add_argument('--latency', type=float, default=0.05, help='每次模型呼叫的固定延遲（秒）')
+    parser.add_argument('--per-prompt', type=float, default=0.005, help='每個提示詞增加的延遲（秒）')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--batch-wait', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, per_prompt=args.per_prompt)
+    messages = workload(args.messages, args.seed)
+    print(f"訊息: {len(messages)} 則（不重複 {len(set(messages))} 則），{args.threads} 個執行緒同時送出")
+
+    # 直接呼叫：每則訊息一次模型呼叫
+    backend = HttpModelBackend(server.url, timeout=30)
+    template = load_prompt()
+    direct, direct_seconds = run_concurrently(
+        lambda text: parse_model_output(backend.complete_batch([render_prompt(template, text)])[0]),
+        messages, args.threads
+    )
+    direct_calls = server.calls
+    print(f"直接呼叫: {direct_seconds:.2f} 秒，模型呼叫 {direct_calls} 次")
+
+    # ModelClient：批次與快取
+    client = ModelClient(backend, max_batch=args.batch_size, batch_wait=args.batch_wait, timeout=30)
+    server.calls = 0
+    first, first_seconds = run_concurrently(client.analyze, messages, args.threads)
+    first_calls = server.calls
+    print(f"批次＋快取: {first_seconds:.2f} 秒，模型呼叫 {first_calls} 次"
+          f"（{direct_seconds / first_seconds:.1f}x）")
+
+    # 第二輪：全部命中快取
+    server.calls = 0
+    second, second_seconds = run_concurrently(client.analyze, messages, args.threads)
+    repeat_calls = server.calls
+    print(f"重複訊息: {second_seconds * 1000:.1f} 毫秒，模型呼叫 {repeat_calls} 次")
+
+    # 逐則送出：背景執行緒閒置後，單獨一則訊息也要在 batch_wait 後送出，不得等到逾時
+    server.calls = 0
+    single_texts = [f"單筆測試{index}" for index in range(5)]
+    _, single_seconds = run_concurrently(client.analyze, single_texts, 1)
+    single_calls = server.calls
+    print(f"逐則送出: 平均 {single_seconds / len(single_texts) * 1000:.1f} 毫秒，模型呼叫 {single_calls} 次")
+    print(f"統計: {client.stats()}")
+
+    mismatches = sum(1 for a, b, c in zip(direct, first, second) if not a == b == c)
+    if mismatches:
+        print(f"結果不一致: {mismatches} 則")
+    server.shutdown()
+    sys.exit(1 if repeat_calls or mismatches or single_calls != len(single_texts) else 0)
+
+
+if __name__ == '__main__':
+    main()
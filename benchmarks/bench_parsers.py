@@ -0,0 +1,152 @@
+"""
+命令解析器基準測試
+以 tests/parser_corpus.jsonl 中的繁體中文訊息，測量每個解析器的：
+    - 每秒解析的訊息數
+    - 每次解析的記憶體配置（tracemalloc 量測的峰值位元組數）
+解析結果是否符合預期由 tests/test_parser_corpus.py 檢查。
+結果可存為基準（baseline.json），之後的執行與基準比較，吞吐量明顯下降時以非零狀態結束
+
+使用方式:
+    python benchmarks/bench_parsers.py                    # 與 benchmarks/baseline.json 比較
+    python benchmarks/bench_parsers.py --save-baseline    # 更新基準
+    python benchmarks/bench_parsers.py --parser finance_transaction
+
+注意：載入 linebot-ai 的 message_processor 時會建立 linebot-ai/data/notes.json（與執行該應用相同）。
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'linebot-ai'))
+
+from tests.parser_corpus import CORPUS_PATH, load_corpus, load_parsers  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def throughput(parse, texts, min_seconds):
+    """每秒解析的訊息數：重複整個語料直到至少執行 min_seconds 秒"""
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        for text in texts:
+            try:
+                parse(text)
+            except Exception:
+                pass
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return rounds * len(texts) / elapsed
+
+
+def allocations(parse, texts):
+    """每次解析的平均記憶體配置（解析期間 tracemalloc 追蹤到的峰值位元組數）"""
+    # 先執行一次，排除 re 快取、lru_cache 等一次性的配置
+    for text in texts:
+        try:
+            parse(text)
+        except Exception:
+            pass
+
+    peak_total = 0
+    for text in texts:
+        tracemalloc.start()
+        try:
+            parse(text)
+        except Exception:
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_total += peak
+    return peak_total / len(texts)
+
+
+def run(parsers, corpus, min_seconds):
+    """對每個有語料的解析器執行配置量與吞吐量測試"""
+    results = {}
+    for name, parse in parsers.items():
+        items = corpus.get(name, [])
+        if not items:
+            continue
+        texts = [item['text'] for item in items]
+        peak_bytes = allocations(parse, texts)
+        results[name] = {
+            'messages': len(items),
+            'messages_per_second': round(throughput(parse, texts, min_seconds)),
+            'peak_bytes_per_parse': round(peak_bytes),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """與基準比較，返回退步的項目說明"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('parsers', {}).get(name)
+        if not base:
+            continue
+        if result['messages_per_second'] < base['messages_per_second'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: 吞吐量 {base['messages_per_second']:,}/s → {result['messages_per_second']:,}/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='命令解析器基準測試')
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--parser', action='append', help='只測試指定的解析器（可重複）')
+    parser.add_argument('--min-seconds', type=float, default=0.5, help='每個解析器的吞吐量測試時間')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='吞吐量低於基準多少比例視為退步')
+    parser.add_argument('--save-baseline', action='store_true', help='將結果存為新的基準')
+    args = parser.parse_args()
+
+    parsers = load_parsers()
+    if args.parser:
+        parsers = {name: parsers[name] for name in args.parser}
+    results = run(parsers, load_corpus(args.corpus), args.min_seconds)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print(f"{'解析器':<22}{'訊息數':>6}{'訊息/秒':>12}{'位元組/次':>10}{'基準 訊息/秒':>14}")
+    for name, result in results.items():
+        base = baseline.get('parsers', {}).get(name, {})
+        print(f"{name:<24}{result['messages']:>8}{result['messages_per_second']:>14,}"
+              f"{result['peak_bytes_per_parse']:>14,}"
+              f"{base.get('messages_per_second', 0):>16,}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"退步: {regression}")
+
+    if args.save_baseline:
+        # 只測試部分解析器時保留其他解析器的基準
+        parsers = dict(baseline.get('parsers', {}))
+        parsers.update(results)
+        baseline = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'parsers': parsers,
+        }
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"已更新基準: {args.baseline}")
+        return
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+時間表達式解析的吞吐量測試
+比較舊版任務提醒時間解析（每個時段分支重複 re.search，tests/legacy_time_parser）、
+services/time_parser 未命中快取與命中快取時每秒可解析的次數；
+兩者的等價性由 tests/test_time_parser_equivalence.py 檢查
+
+使用方式:
+    python benchmarks/bench_time_parser.py --iterations 200000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import time_parser  # noqa: E402
+from services.time_parser import resolve_time  # noqa: E402
+from tests.legacy_time_parser import legacy_resolve_time  # noqa: E402
+
+
+def call(function, *args):
+    """執行解析函數，例外以類型名稱表示以便比對"""
+    try:
+        return function(*args)
+    except Exception as e:
+        return type(e).__name__
+
+
+DAYS = ['', '今天', '明天', '後天', '大後天']
+PERIODS = ['', '早上', '上午', '凌晨', '下午', '傍晚', '晚上', '夜晚']
+CLOCKS = ['', '{h}點', '{h}時', '{h}點半', '{h}點{m}分', '{h}:{m:02d}', '{h}點{m}']
+
+
+def task_samples(count, seed):
+    """任務提醒的時間文字：相對日期 + 時段 + 時間的組合"""
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(count):
+        clock = rng.choice(CLOCKS).format(h=rng.randint(0, 23), m=rng.choice([0, 5, 15, 30, 45]))
+        samples.append(rng.choice(DAYS) + rng.choice(PERIODS) + clock)
+    samples += ['明天早上9點', '下午3點半', '14:30', '晚上12點', '今天', '', '下午12點', '晚上25點', '早上']
+    return samples
+
+
+def throughput(function, samples, iterations, now):
+    """每秒解析的次數（包含無效時間拋出例外的情況）"""
+    count = len(samples)
+    start = time.perf_counter()
+    for index in range(iterations):
+        call(function, samples[index % count], now)
+    return iterations / (time.perf_counter() - start)
+
+
+def uncached_resolve_time(text, now):
+    """每次都清除快取，測量未命中快取時的解析速度"""
+    time_parser._parse_normalized.cache_clear()
+    return resolve_time(text, now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='時間表達式解析的吞吐量測試')
+    parser.add_argument('--iterations', type=int, default=200000, help='吞吐量測試的解析次數')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    now = datetime(2024, 3, 15, 10, 20, 30)
+    # 實際訊息中重複的說法很多（明天早上9點等），吞吐量以 200 種常見說法輪流解析
+    workload = task_samples(200, args.seed + 1)
+    legacy_rate = throughput(legacy_resolve_time, workload, args.iterations, now)
+    cold_rate = throughput(uncached_resolve_time, workload, args.iterations // 10, now)
+    time_parser._parse_normalized.cache_clear()
+    warm_rate = throughput(resolve_time, workload, args.iterations, now)
+    print(f"吞吐量: 舊版 {legacy_rate:,.0f}/s，新版未命中快取 {cold_rate:,.0f}/s，"
+          f"新版命中快取 {warm_rate:,.0f}/s（{warm_rate / legacy_rate:.1f}x）")
+    print(f"快取: {time_parser.get_parse_cache_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""
+模擬 LINE Messaging API 服務
+用於離線壓力測試與延遲測試，支援 reply、push、multicast、用戶資料、Bot 資訊與圖文選單端點，
+可設定回應延遲分佈、注入 429/500 錯誤，並記錄收到的請求內容
+
+使用方式:
+    python benchmarks/fake_line_api.py --port 9000 --latency lognormal:3.5,0.5 --errors 429=0.02,500=0.01
+
+    # 讓 bot 改連到模擬服務
+    LINE_API_ENDPOINT=http://127.0.0.1:9000 LINE_API_DATA_ENDPOINT=http://127.0.0.1:9000 \\
+        gunicorn app:app --bind 127.0.0.1:8080
+
+管理端點:
+    GET  /__fake__/stats     各端點請求數、錯誤數與延遲
+    GET  /__fake__/requests  最近記錄的請求（?limit=100）
+    POST /__fake__/reset     清除記錄與統計
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import deque
+
+from aiohttp import web
+
+
+def parse_latency(spec):
+    """解析延遲分佈設定（毫秒），返回產生延遲秒數的函數
+
+    支援:
+        fixed:50
+        uniform:20,80
+        normal:50,15
+        lognormal:3.5,0.5   （ln 毫秒的平均值與標準差）
+        pareto:20,1.5       （最小值與形狀參數，模擬長尾）
+    """
+    if not spec:
+        return lambda: 0.0
+    name, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value]
+
+    if name == 'fixed':
+        return lambda: values[0] / 1000.0
+    if name == 'uniform':
+        return lambda: random.uniform(values[0], values[1]) / 1000.0
+    if name == 'normal':
+        return lambda: max(random.gauss(values[0], values[1]), 0.0) / 1000.0
+    if name == 'lognormal':
+        return lambda: random.lognormvariate(values[0], values[1]) / 1000.0
+    if name == 'pareto':
+        return lambda: values[0] * random.paretovariate(values[1]) / 1000.0
+    raise ValueError(f"不支援的延遲分佈: {spec}")
+
+
+def parse_errors(spec):
+    """解析錯誤注入設定，例如 "429=0.05,500=0.01"，返回 [(狀態碼, 機率), ...]"""
+    errors = []
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        status, rate = item.split('=', 1)
+        errors.append((int(status), float(rate)))
+    return errors
+
+
+class FakeLineApi:
+    """模擬 LINE Messaging API 的狀態與統計"""
+
+    def __init__(self, latency=None, errors=None, retry_after=1, record_limit=10000, record_path=None):
+        """初始化
+
+        Args:
+            latency: 產生延遲秒數的函數
+            errors: [(狀態碼, 機率), ...]
+            retry_after: 429 回應的 Retry-After 秒數
+            record_limit: 記憶體中保留的請求數
+            record_path: 將請求追加寫入的 JSONL 檔案
+        """
+        self.latency = latency or (lambda: 0.0)
+        self.errors = errors or []
+        self.retry_after = retry_after
+        self.record_path = record_path
+        self.records = deque(maxlen=record_limit)
+        self.reset()
+
+    def reset(self):
+        self.records.clear()
+        self.stats = {}
+        self.used_reply_tokens = set()
+        self.retry_keys = {}
+        self.rich_menus = {}
+        self.default_rich_menu = None
+        self.user_rich_menus = {}
+
+    def count(self, endpoint, status, elapsed):
+        stats = self.stats.setdefault(endpoint, {'requests': 0, 'errors': {}, 'latency_total': 0.0, 'latency_max': 0.0})
+        stats['requests'] += 1
+        if status >= 400:
+            stats['errors'][str(status)] = stats['errors'].get(str(status), 0) + 1
+        stats['latency_total'] += elapsed
+        stats['latency_max'] = max(stats['latency_max'], elapsed)
+
+    def record(self, endpoint, request, body):
+        item = {
+            'time': time.time(),
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'retry_key': request.headers.get('X-Line-Retry-Key'),
+            'body': body
+        }
+        self.records.append(item)
+        if self.record_path:
+            with open(self.record_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    def injected_error(self):
+        """依設定的機率返回要注入的錯誤狀態碼"""
+        roll = random.random()
+        for status, rate in self.errors:
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+
+def error_response(status, message, headers=None):
+    return web.json_response({'message': message}, status=status, headers=headers)
+
+
+def endpoint(name):
+    """包裝端點：驗證授權、套用延遲與錯誤注入、記錄請求與統計"""
+    def decorator(func):
+        async def wrapper(request):
+            api = request.app['fake']
+            start = time.monotonic()
+            body = None
+            if request.can_read_body and request.content_type == 'application/json':
+                body = await request.json()
+            elif request.can_read_body:
+                body = {'bytes': len(await request.read())}
+            api.record(name, request, body)
+
+            await asyncio.sleep(api.latency())
+            if not request.headers.get('Authorization', '').startswith('Bearer '):
+                response = error_response(401, 'Authentication failed. Confirm that the access token in the authorization header is valid.')
+            else:
+                status = api.injected_error()
+                if status == 429:
+                    response = error_response(429, 'The API rate limit has been exceeded. Try again later.',
+                                              headers={'Retry-After': str(api.retry_after)})
+                elif status is not None:
+                    response = error_response(status, 'An error occurred in the fake server.')
+                else:
+                    response = await func(request, api, body)
+
+            api.count(name, response.status, time.monotonic() - start)
+            response.headers['X-Line-Request-Id'] = str(uuid.uuid4())
+            return response
+        return wrapper
+    return decorator
+
+
+def accept_once(request, api):
+    """依 X-Line-Retry-Key 判斷是否為已接受過的請求"""
+    retry_key = request.headers.get('X-Line-Retry-Key')
+    if not retry_key:
+        return None
+    accepted = api.retry_keys.get(retry_key)
+    if accepted:
+        return error_response(409, 'The retry key is already accepted',
+                              headers={'X-Line-Accepted-Request-Id': accepted})
+    api.retry_keys[retry_key] = str(uuid.uuid4())
+    return None
+
+
+def validate_messages(body):
+    messages = (body or {}).get('messages') or []
+    if not messages or len(messages) > 5:
+        return error_response(400, 'The request body has 1 error(s)')
+    return None
+
+
+@endpoint('reply')
+async def reply(request, api, body):
+    error = validate_messages(body)
+    if error:
+        return error
+    token = (body or {}).get('replyToken')
+    if not token or token in api.used_reply_tokens:
+        return error_response(400, 'Invalid reply token')
+    api.used_reply_tokens.add(token)
+    return web.json_response({'sentMessages': [{'id': str(uuid.uuid4())} for _ in body['messages']]})
+
+
+@endpoint('push')
+async def push(request, api, body):
+    error = validate_messages(body) or accept_once(request, api)
+    if error:
+        return error
+    return web.json_response({'sentMessages': [{'id': str(uuid.uuid4())} for _ in body['messages']]})
+
+
+@endpoint('multicast')
+async def multicast(request, api, body):
+    recipients = (body or {}).get('to') or []
+    if len(recipients) > 500:
+        return error_response(400, 'Size must be between 1 and 500')
+    error = validate_messages(body) or accept_once(request, api)
+    if error:
+        return error
+    return web.json_response({})
+
+
+@endpoint('profile')
+async def profile(request, api, body):
+    user_id = request.match_info['user_id']
+    return web.json_response({
+        'userId': user_id,
+        'displayName': f"用戶{user_id[-4:]}",
+        'pictureUrl': 'https://profile.line-scdn.net/fake',
+        'statusMessage': ''
+    })
+
+
+@endpoint('bot_info')
+async def bot_info(request, api, body):
+    return web.json_response({
+        'userId': 'Ufakebot',
+        'basicId': '@fakebot',
+        'displayName': 'Fake Kimi',
+        'pictureUrl': 'https://profile.line-scdn.net/fakebot',
+        'chatMode': 'bot',
+        'markAsReadMode': 'auto'
+    })
+
+
+@endpoint('richmenu')
+async def create_rich_menu(request, api, body):
+    rich_menu_id = f"richmenu-{uuid.uuid4().hex}"
+    api.rich_menus[rich_menu_id] = dict(body or {}, richMenuId=rich_menu_id)
+    return web.json_response({'richMenuId': rich_menu_id})
+
+
+@endpoint('richmenu')
+async def list_rich_menus(request, api, body):
+    return web.json_response({'richmenus': list(api.rich_menus.values())})
+
+
+@endpoint('richmenu')
+async def get_rich_menu(request, api, body):
+    rich_menu = api.rich_menus.get(request.match_info['rich_menu_id'])
+    if rich_menu is None:
+        return error_response(404, 'Not found')
+    return web.json_response(rich_menu)
+
+
+@endpoint('richmenu')
+async def delete_rich_menu(request, api, body):
+    if api.rich_menus.pop(request.match_info['rich_menu_id'], None) is None:
+        return error_response(404, 'Not found')
+    return web.json_response({})
+
+
+@endpoint('richmenu')
+async def upload_rich_menu_image(request, api, body):
+    if request.match_info['rich_menu_id'] not in api.rich_menus:
+        return error_response(404, 'Not found')
+    return web.json_response({})
+
+
+@endpoint('richmenu')
+async def set_default_rich_menu(request, api, body):
+    api.default_rich_menu = request.match_info['rich_menu_id']
+    return web.json_response({})
+
+
+@endpoint('richmenu')
+async def link_rich_menu(request, api, body):
+    api.user_rich_menus[request.match_info['user_id']] = request.match_info['rich_menu_id']
+    return web.json_response({})
+
+
+async def fake_stats(request):
+    api = request.app['fake']
+    stats = {}
+    for name, item in api.stats.items():
+        stats[name] = dict(item)
+        stats[name]['latency_avg'] = round(item['latency_total'] / item['requests'], 4)
+        stats[name].pop('latency_total')
+    return web.json_response(stats)
+
+
+async def fake_requests(request):
+    limit = int(request.query.get('limit', '100'))
+    records = list(request.app['fake'].records)[-limit:]
+    return web.json_response(records)
+
+
+async def fake_reset(request):
+    request.app['fake'].reset()
+    return web.json_response({})
+
+
+def create_app(fake_api):
+    """建立模擬服務的 aiohttp 應用"""
+    app = web.Application()
+    app['fake'] = fake_api
+    app.router.add_post('/v2/bot/message/reply', reply)
+    app.router.add_post('/v2/bot/message/push', push)
+    app.router.add_post('/v2/bot/message/multicast', multicast)
+    app.router.add_get('/v2/bot/profile/{user_id}', profile)
+    app.router.add_get('/v2/bot/info', bot_info)
+    app.router.add_post('/v2/bot/richmenu', create_rich_menu)
+    app.router.add_get('/v2/bot/richmenu/list', list_rich_menus)
+    app.router.add_get('/v2/bot/richmenu/{rich_menu_id}', get_rich_menu)
+    app.router.add_delete('/v2/bot/richmenu/{rich_menu_id}', delete_rich_menu)
+    app.router.add_post('/v2/bot/richmenu/{rich_menu_id}/content', upload_rich_menu_image)
+    app.router.add_post('/v2/bot/user/all/richmenu/{rich_menu_id}', set_default_rich_menu)
+    app.router.add_post('/v2/bot/user/{user_id}/richmenu/{rich_menu_id}', link_rich_menu)
+    app.router.add_get('/__fake__/stats', fake_stats)
+    app.router.add_get('/__fake__/requests', fake_requests)
+    app.router.add_post('/__fake__/reset', fake_reset)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模擬 LINE Messaging API 服務')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', default='', help='延遲分佈，例如 fixed:50、uniform:20,80、lognormal:3.5,0.5')
+    parser.add_argument('--errors', default='', help='錯誤注入機率，例如 429=0.05,500=0.01')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 回應的 Retry-After 秒數')
+    parser.add_argument('--record', default=None, help='將請求追加寫入的 JSONL 檔案')
+    args = parser.parse_args()
+
+    fake_api = FakeLineApi(
+        latency=parse_latency(args.latency),
+        errors=parse_errors(args.errors),
+        retry_after=args.retry_after,
+        record_path=args.record
+    )
+    web.run_app(create_app(fake_api), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
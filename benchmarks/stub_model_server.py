@@ -0,0 +1,106 @@
+"""
+本機模型伺服器的替代品
+接受 linebot-ai model_backend 的批次請求（POST {"prompts": [...]}），
+以關鍵字分析產生 multi_parser 格式的 JSON 輸出，並模擬模型延遲：
+每次呼叫固定延遲加上每個提示詞的延遲（批次越大，平均每則越便宜），
+與單一模型實例相同，同一時間只執行一次呼叫
+
+使用方式:
+    python benchmarks/stub_model_server.py --port 8100 --latency 0.05 --per-prompt 0.005
+    AI_MODEL_URL=http://127.0.0.1:8100/ python linebot-ai/app.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'linebot-ai'))
+
+# 提示詞最後一行為「輸入: {input}」
+INPUT_MARKER = '輸入: '
+
+
+class StubModelServer(ThreadingHTTPServer):
+    """模擬延遲並記錄呼叫次數的模型伺服器"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency=0.05, per_prompt=0.005):
+        super().__init__(address, StubModelHandler)
+        self.latency = latency
+        self.per_prompt = per_prompt
+        self.calls = 0
+        self.prompts = 0
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def complete(self, prompts):
+        """以關鍵字分析模擬模型輸出"""
+        from src.services.ai_service import keyword_analysis
+
+        with self._lock:
+            self.calls += 1
+            self.prompts += len(prompts)
+        with self._model_lock:
+            time.sleep(self.latency + self.per_prompt * len(prompts))
+        outputs = []
+        for prompt in prompts:
+            text = prompt.rsplit(INPUT_MARKER, 1)[-1].strip()
+            outputs.append(json.dumps(keyword_analysis(text), ensure_ascii=False))
+        return outputs
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            prompts = json.loads(self.rfile.read(length).decode('utf-8'))['prompts']
+        except (ValueError, KeyError):
+            self.send_error(400, 'expected {"prompts": [...]}')
+            return
+        body = json.dumps({'outputs': self.server.complete(prompts)}, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, latency=0.05, per_prompt=0.005):
+    """在背景執行緒啟動伺服器（port 為 0 時使用任意可用的埠）"""
+    server = StubModelServer(('127.0.0.1', port), latency=latency, per_prompt=per_prompt)
+    threading.Thread(target=server.serve_forever, name='stub-model-server', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本機模型伺服器的替代品')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=0.05, help='每次呼叫的固定延遲（秒）')
+    parser.add_argument('--per-prompt', type=float, default=0.005, help='每個提示詞增加的延遲（秒）')
+    args = parser.parse_args()
+
+    server = StubModelServer(('127.0.0.1', args.port), latency=args.latency, per_prompt=args.per_prompt)
+    print(f"模型伺服器: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Webhook 壓力測試
+產生帶有正確簽名的 LINE Webhook 請求並以指定並行數發送，統計回應延遲與吞吐量；
+搭配 fake_line_api.py 可離線測試完整的 message_handler / FinanceService 流程
+
+使用方式:
+    python benchmarks/fake_line_api.py --port 9000 --latency normal:50,15 &
+    LINE_API_ENDPOINT=http://127.0.0.1:9000 LINE_CHANNEL_SECRET=test LINE_CHANNEL_ACCESS_TOKEN=test \\
+        gunicorn app:app --bind 127.0.0.1:8080 &
+    python benchmarks/webhook_load.py --url http://127.0.0.1:8080/webhook --secret test \\
+        --requests 2000 --concurrency 50 --users 200 --fake-api http://127.0.0.1:9000
+"""
+import hmac
+import json
+import time
+import uuid
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+
+import aiohttp
+
+# 預設的訊息組合（記帳指令為主）
+DEFAULT_MESSAGES = [
+    '午餐 120',
+    '晚餐-250',
+    '收入 5000',
+    '交通 60 捷運',
+    '今天支出',
+    '本月',
+    'help',
+    'kimi',
+]
+
+
+def sign(secret, body):
+    """產生 X-Line-Signature"""
+    digest = hmac.new(secret.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+
+def make_event(user_id, text):
+    """產生文字訊息事件"""
+    return {
+        'type': 'message',
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'source': {'type': 'user', 'userId': user_id},
+        'webhookEventId': uuid.uuid4().hex.upper(),
+        'deliveryContext': {'isRedelivery': False},
+        'replyToken': uuid.uuid4().hex,
+        'message': {'type': 'text', 'id': str(random.randint(10 ** 14, 10 ** 15)), 'text': text}
+    }
+
+
+def percentile(values, ratio):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(len(ordered) * ratio), len(ordered) - 1)
+    return ordered[index]
+
+
+async def run(args):
+    messages = DEFAULT_MESSAGES
+    if args.messages:
+        with open(args.messages, 'r', encoding='utf-8') as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    users = [f"U{index:032x}" for index in range(args.users)]
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+
+    async def worker(session):
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            events = [make_event(random.choice(users), random.choice(messages)) for _ in range(args.batch)]
+            body = json.dumps({'destination': 'Ufakebot', 'events': events}, ensure_ascii=False)
+            headers = {'Content-Type': 'application/json', 'X-Line-Signature': sign(args.secret, body)}
+            start = time.perf_counter()
+            try:
+                async with session.post(args.url, data=body.encode('utf-8'), headers=headers) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        if args.fake_api:
+            async with session.post(f"{args.fake_api}/__fake__/reset") as response:
+                await response.read()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(session) for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+
+        print(f"請求數: {len(latencies)}，事件數: {len(latencies) * args.batch}，耗時: {elapsed:.2f} 秒")
+        print(f"吞吐量: {len(latencies) / elapsed:.1f} req/s")
+        print(f"延遲 p50: {percentile(latencies, 0.5) * 1000:.1f} ms，"
+              f"p95: {percentile(latencies, 0.95) * 1000:.1f} ms，"
+              f"p99: {percentile(latencies, 0.99) * 1000:.1f} ms，"
+              f"max: {max(latencies) * 1000:.1f} ms")
+        print(f"狀態碼: {statuses}")
+
+        if args.fake_api:
+            # 非同步模式下事件在回應後才處理，稍等再讀取統計
+            await asyncio.sleep(args.settle)
+            async with session.get(f"{args.fake_api}/__fake__/stats") as response:
+                print(f"LINE API 呼叫: {json.dumps(await response.json(), ensure_ascii=False)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LINE Webhook 壓力測試')
+    parser.add_argument('--url', default='http://127.0.0.1:8080/webhook')
+    parser.add_argument('--secret', required=True, help='LINE Channel Secret（與受測服務相同）')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=1, help='每個請求的事件數')
+    parser.add_argument('--messages', default=None, help='訊息文字檔（每行一則）')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--fake-api', default=None, help='fake_line_api.py 的網址，用於重設與讀取統計')
+    parser.add_argument('--settle', type=float, default=2.0, help='讀取模擬服務統計前的等待秒數')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
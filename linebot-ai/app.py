@@ -7,22 +7,25 @@ import sys
 import logging
 import traceback
 from flask import Flask, request, abort, Response, jsonify
-from linebot import LineBotApi, WebhookHandler
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
 
-# 設置日誌記錄
-logging.basicConfig(
-    level=os.environ.get('LOG_LEVEL', 'INFO'),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
 # 確保 src 目錄在 Python 路徑中
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
+# 載入 src 套件時會將上層專案目錄加入 Python 路徑，以使用共用的 services 模組
+import src  # noqa: E402,F401
+from services.webhook_service import WebhookService
+from services.log_service import LogService
+from services.line_client import get_line_bot_api
+
+# 設置日誌記錄
+LogService.setup()
+logger = logging.getLogger(__name__)
+
 # 初始化 Flask 應用
 app = Flask(__name__)
 
@@ -37,7 +40,7 @@ if not channel_access_token or not channel_secret:
 
 # 初始化 LINE Bot API
 try:
-    line_bot_api = LineBotApi(channel_access_token)
+    line_bot_api = get_line_bot_api(channel_access_token)
     handler = WebhookHandler(channel_secret)
     logger.info("LINE Bot API 初始化成功")
 except Exception as e:
@@ -51,6 +54,17 @@ def health_check():
     """健康檢查端點"""
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """訊息分析各階段（規則解析、模型）的命中率與延遲"""
+    from src.services.ai_service import get_stage_stats
+    from src.services.model_backend import get_model_client
+    client = get_model_client()
+    return jsonify({
+        "classifier": get_stage_stats(),
+        "model": client.stats() if client is not None else None
+    }), 200
+
 @app.route('/', methods=['GET'])
 def home():
     """處理根路徑的 GET 請求"""
@@ -88,19 +102,20 @@ def webhook_post():
     # 獲取請求內容
     try:
         body = request.get_data(as_text=True)
-        logger.info(f"請求內容: {body}")
+        LogService.record_body(body)
     except Exception as e:
         logger.error(f"獲取請求內容時發生錯誤: {str(e)}")
         abort(400)
 
     try:
-        handler.handle(body, signature)
+        WebhookService.handle_webhook(handler, body, signature, app=app)
     except InvalidSignatureError:
         logger.error("無效的簽名")
         abort(400)
     except Exception as e:
         logger.error(f"處理 webhook 時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
+        LogService.dump_recent_bodies('處理 webhook 時發生錯誤')
         abort(500)
 
     return Response('OK', status=200)
@@ -0,0 +1,18 @@
+"""
+linebot-ai 應用套件
+多個模組使用上層專案共用的 services 套件（webhook 處理、LINE API 用戶端、快取、關鍵字分類器），
+載入本套件時將上層專案目錄加入 Python 路徑，各入口（app.py、api/、測試、效能測試）以相同方式找到共用模組；
+因此 linebot-ai 必須在完整的儲存庫中執行，不能只部署 linebot-ai 目錄
+"""
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.path.isfile(os.path.join(PROJECT_ROOT, 'services', '__init__.py')):
+    raise ImportError(
+        f"linebot-ai 需要上層專案共用的 services 套件，在 {PROJECT_ROOT} 中找不到；"
+        "請部署完整的儲存庫並從 linebot-ai 目錄啟動"
+    )
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
@@ -33,9 +33,34 @@ DEFAULT_RESPONSES: Dict[str, str] = {
 
 # 類別對應關鍵字
 CATEGORIES = {
-    'food': ['餐', '食', '飯', '麵', '咖啡', '飲料', '水', '茶'],
+    'food': ['餐', '食', '飯', '吃', '麵', '咖啡', '飲料', '水', '茶'],
     'transportation': ['車', '交通', '捷運', '公車', '計程車', '高鐵', '火車', 'uber'],
     'entertainment': ['電影', '遊戲', '娛樂', '玩', '唱歌', 'ktv', '旅遊'],
     'shopping': ['買', '購', '衣', '鞋', '包', '3c', '電子', '家電'],
     'other': []
-}
\ No newline at end of file
+}
+
+# 類別的顯示名稱
+CATEGORY_NAMES = {
+    'food': '食物',
+    'transportation': '交通',
+    'entertainment': '娛樂',
+    'shopping': '購物',
+    'other': '其他'
+}
+
+# 意圖對應關鍵字
+INTENT_KEYWORDS = {
+    'accounting': ['元', '塊', '錢', '$'],
+    'reminder': ['提醒', '記得', '通知']
+}
+
+# 本機模型伺服器設定（multi_parser 提示詞），未設定 AI_MODEL_URL 時使用關鍵字分析
+AI_MODEL_URL = os.environ.get('AI_MODEL_URL', '')
+AI_MODEL_TIMEOUT = float(os.environ.get('AI_MODEL_TIMEOUT', '10'))
+AI_MODEL_BATCH_SIZE = int(os.environ.get('AI_MODEL_BATCH_SIZE', '16'))
+AI_MODEL_BATCH_WAIT = float(os.environ.get('AI_MODEL_BATCH_WAIT', '0.02'))
+AI_MODEL_CACHE_SIZE = int(os.environ.get('AI_MODEL_CACHE_SIZE', '4096'))
+AI_MODEL_CACHE_TTL = float(os.environ.get('AI_MODEL_CACHE_TTL', '86400'))
+# 規則解析的信心分數低於此值時才交給模型判斷（0～1，設為 0 則不使用模型）
+AI_CONFIDENCE_THRESHOLD = float(os.environ.get('AI_CONFIDENCE_THRESHOLD', '0.8'))
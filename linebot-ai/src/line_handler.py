@@ -5,13 +5,16 @@ Manages interactions with the LINE Messaging API.
 import json
 import logging
 from typing import Dict, Any, List
-from linebot import LineBotApi, WebhookHandler
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage, 
     FlexSendMessage
 )
 
+from services.event_dispatcher import UserOrderedDispatcher
+from services.line_client import get_line_bot_api
+
 from .config import LINE_CHANNEL_SECRET, LINE_CHANNEL_ACCESS_TOKEN
 from .message_processor import MessageProcessor
 
@@ -19,9 +22,12 @@ from .message_processor import MessageProcessor
 logger = logging.getLogger(__name__)
 
 # Initialize LINE API clients
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+line_bot_api = get_line_bot_api(LINE_CHANNEL_ACCESS_TOKEN)
 webhook_handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
+# Events of the same user run in order, different users run concurrently
+event_dispatcher = UserOrderedDispatcher(lanes=4, name='line-handler')
+
 class LineHandler:
     """Handles LINE platform interactions."""
     
@@ -49,25 +55,33 @@ class LineHandler:
         """
         Process LINE webhook events.
         
+        Events are sharded by source user across the dispatcher lanes,
+        so one user's slow command does not block other users in the
+        same payload.
+        
         Args:
             events: List of LINE event objects
         """
-        for event in events:
-            try:
-                event_type = event.get("type")
+        event_dispatcher.dispatch(events, LineHandler._handle_event)
+    
+    @staticmethod
+    def _handle_event(event: Dict[str, Any]) -> None:
+        """Route a single LINE event to its handler."""
+        try:
+            event_type = event.get("type")
+            
+            # Handle message events
+            if event_type == "message":
+                LineHandler._handle_message_event(event)
                 
-                # Handle message events
-                if event_type == "message":
-                    LineHandler._handle_message_event(event)
-                    
-                # Handle follow/unfollow events
-                elif event_type == "follow":
-                    LineHandler._handle_follow_event(event)
-                elif event_type == "unfollow":
-                    LineHandler._handle_unfollow_event(event)
-                    
-            except Exception as e:
-                logger.error(f"Error handling event: {str(e)}", exc_info=True)
+            # Handle follow/unfollow events
+            elif event_type == "follow":
+                LineHandler._handle_follow_event(event)
+            elif event_type == "unfollow":
+                LineHandler._handle_unfollow_event(event)
+                
+        except Exception as e:
+            logger.error(f"Error handling event: {str(e)}", exc_info=True)
     
     @staticmethod
     def _handle_message_event(event: Dict[str, Any]) -> None:
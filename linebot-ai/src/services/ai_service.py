@@ -2,42 +2,354 @@
 AI Service module.
 Handles interactions with AI models and prompts.
 """
+import re
 import json
+import time
 import logging
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from services.keyword_automaton import KeywordClassifier, get_user_keyword_store
+from .model_backend import get_model_client
+from ..config import CATEGORIES, CATEGORY_NAMES, INTENT_KEYWORDS, AI_CONFIDENCE_THRESHOLD
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def analyze_message(text: str) -> str:
+
+def build_classifier() -> KeywordClassifier:
     """
-    Analyze user message using simplified mock analysis.
+    Build the keyword classifier from the intent and category keyword lists.
+
+    Per-user categories come from the keyword store shared with the finance bot, so a category
+    registered there (or by add_custom_category) is matched here too, across restarts and workers.
+
+    Returns:
+        A classifier whose labels are ('intent', name) and ('category', name)
+    """
+    entries = []
+    for intent, keywords in INTENT_KEYWORDS.items():
+        entries.extend((keyword, ('intent', intent), None) for keyword in keywords)
+    for category, keywords in CATEGORIES.items():
+        entries.extend((keyword, ('category', category), None) for keyword in keywords)
+    return KeywordClassifier(entries, store=get_user_keyword_store())
+
+
+# Built once at import; per-user categories are loaded from the shared store on demand
+classifier = build_classifier()
+
+
+def classify_message(text: str, user_id: Optional[str] = None) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    Score every intent and category whose keywords appear in the message, in a single scan.
+
+    Args:
+        text: The message text
+        user_id: Include this user's custom categories
+
+    Returns:
+        {'intent': [(name, score), ...], 'category': [(name, score), ...]}, highest score first
+    """
+    return classifier.classify(text, user_id)
+
+
+def add_custom_category(user_id: str, name: str, keywords: Iterable[str] = ()) -> None:
+    """
+    Register a user's custom category; only that user's keyword automaton is rebuilt.
+    The category is saved to the shared keyword store, so the finance bot and other workers see it too.
+
+    Args:
+        user_id: The LINE user ID
+        name: Category name, also used as a keyword
+        keywords: Additional keywords for the category
+    """
+    classifier.add_user_category(user_id, name, tuple(keywords))
+
+
+# Accounting: item then amount ("午餐120元", "捷運30塊", "搭計程車 250"), or amount then item ("$300 禮物")
+CURRENCY_UNIT = r'(?:元|塊錢|塊)'
+ITEM_AMOUNT_PATTERN = re.compile(
+    rf'(?P<item>[^\d$]*?)\s*(?P<dollar>\$)?(?P<amount>\d+(?:\.\d+)?)\s*(?P<unit>{CURRENCY_UNIT})?'
+)
+AMOUNT_ITEM_PATTERN = re.compile(
+    rf'(?P<dollar>\$)?(?P<amount>\d+(?:\.\d+)?)\s*(?P<unit>{CURRENCY_UNIT})?\s+(?P<item>[^\d]+)'
+)
+
+# Reminder: relative dates, periods of the day and clock times ("明天", "下午3點半", "14:30")
+TIME_PATTERN = re.compile(
+    r'(?:早上|上午|凌晨|中午|下午|傍晚|晚上|夜晚)?\d{1,2}(?:[:：]\d{2}|[點時](?:\d{1,2}分|半)?)'
+    r'|早上|上午|中午|下午|傍晚|晚上'
+)
+DATE_WORDS = ('今天', '明天', '後天')
+
+# Confidence of each deterministic result; the model is only asked below AI_CONFIDENCE_THRESHOLD
+CONFIDENCE_EXPLICIT = 0.95     # amount with a currency unit or "$", reminder keyword
+CONFIDENCE_KEYWORD = 0.9       # amount with a known category keyword, or a bare amount
+CONFIDENCE_GUESS = 0.6         # amount after an unknown item, time expression without a reminder keyword
+CONFIDENCE_DEFAULT = 0.5       # nothing matched, defaulted to a task
+
+
+class StageStats:
+    """
+    Per-stage counters and latency for the staged classifier, updated once per message.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name: str) -> Dict[str, Any]:
+        if name not in self.stages:
+            self.stages[name] = {'calls': 0, 'decided': 0, 'fallbacks': 0, 'errors': 0,
+                                 'seconds': 0.0, 'max_seconds': 0.0}
+        return self.stages[name]
+
+    def record(self, timings: List[Tuple[str, float]], decided: str, fallback: bool = False,
+               failed: Optional[str] = None) -> None:
+        """
+        Record one classified message.
+
+        Args:
+            timings: (stage, seconds) for every stage that ran
+            decided: The stage whose result was returned
+            fallback: The result was below the threshold (no model, or the model failed)
+            failed: The stage that raised, if any
+        """
+        with self._lock:
+            self.messages += 1
+            for name, seconds in timings:
+                stage = self._stage(name)
+                stage['calls'] += 1
+                stage['seconds'] += seconds
+                if seconds > stage['max_seconds']:
+                    stage['max_seconds'] = seconds
+            stage = self._stage(decided)
+            stage['decided'] += 1
+            stage['fallbacks'] += int(fallback)
+            if failed:
+                self._stage(failed)['errors'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns:
+            {'messages': n, 'stages': {name: {calls, decided, fallbacks, errors, hit_rate, avg_ms, max_ms}}};
+            hit_rate is the share of all messages the stage answered
+        """
+        with self._lock:
+            messages = self.messages
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+        for stage in stages.values():
+            seconds = stage.pop('seconds')
+            stage['hit_rate'] = round(stage['decided'] / messages, 4) if messages else 0.0
+            stage['avg_ms'] = round(seconds * 1000 / stage['calls'], 4) if stage['calls'] else 0.0
+            stage['max_ms'] = round(stage.pop('max_seconds') * 1000, 4)
+        return {'messages': messages, 'stages': stages}
+
+
+stage_stats = StageStats()
+
+
+def _category_of(item: str, user_id: Optional[str]) -> Tuple[str, bool]:
+    """The display name of the best matching category, and whether any category keyword matched."""
+    category = classifier.best(item, 'category', user_id)
+    if category is None:
+        return CATEGORY_NAMES['other'], False
+    return CATEGORY_NAMES.get(category, category), True
+
+
+def accounting_stage(text: str, user_id: Optional[str] = None) -> Optional[Tuple[Dict[str, Any], float]]:
+    """
+    Parse an expense entry such as "午餐120元", "捷運30塊", "150" or "$300 禮物".
+
+    Returns:
+        (result, confidence), or None when the message is not an item with an amount
+    """
+    stripped = text.strip()
+    match = ITEM_AMOUNT_PATTERN.fullmatch(stripped) or AMOUNT_ITEM_PATTERN.fullmatch(stripped)
+    if not match:
+        return None
+
+    amount_text = match.group('amount')
+    amount = float(amount_text) if '.' in amount_text else int(amount_text)
+    item = match.group('item').strip()
+    category, matched = _category_of(item, user_id)
+
+    if match.group('unit') or match.group('dollar'):
+        confidence = CONFIDENCE_EXPLICIT
+    elif matched or not item:
+        confidence = CONFIDENCE_KEYWORD
+    else:
+        confidence = CONFIDENCE_GUESS
+
+    result = {
+        "content": text,
+        "type": "accounting",
+        "details": {
+            "item": item or "消費",
+            "amount": amount,
+            "category": category
+        }
+    }
+    return result, confidence
+
+
+def reminder_stage(text: str, user_id: Optional[str] = None) -> Optional[Tuple[Dict[str, Any], float]]:
+    """
+    Recognize a reminder from its keywords ("提醒我", "記得", "通知") or, less surely, from a time expression.
+
+    Returns:
+        (result, confidence), or None when the message has neither
+    """
+    time_match = TIME_PATTERN.search(text)
+    if classifier.scores(text, user_id).get(('intent', 'reminder')):
+        confidence = CONFIDENCE_EXPLICIT
+    elif time_match or any(word in text for word in DATE_WORDS):
+        confidence = CONFIDENCE_GUESS
+    else:
+        return None
+
+    result = {
+        "content": text,
+        "type": "reminder",
+        "details": {
+            "event": text.replace("提醒我", "").strip(),
+            "time": time_match.group(0) if time_match else "",
+            "date": "今天" if "今天" in text else "明天" if "明天" in text else ""
+        }
+    }
+    return result, confidence
+
+
+def task_stage(text: str, user_id: Optional[str] = None) -> Optional[Tuple[Dict[str, Any], float]]:
+    """
+    Default every other message to a medium-priority task.
+
+    Returns:
+        (result, confidence)
+    """
+    result = {
+        "content": text,
+        "type": "task",
+        "details": {
+            "description": text,
+            "priority": "中"
+        }
+    }
+    return result, CONFIDENCE_DEFAULT
+
+
+# Deterministic stages, cheapest and most specific first
+RULE_STAGES = (
+    ('accounting', accounting_stage),
+    ('reminder', reminder_stage),
+    ('task', task_stage),
+)
+
+
+def classify_staged(text: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Classify a message with the deterministic stages, asking the model only when unsure.
+
+    Stages run in order and the first result at or above AI_CONFIDENCE_THRESHOLD is returned.
+    Otherwise the model backend (when configured) decides; without a model, or when the model
+    call fails, the most confident deterministic result is returned.
+
+    Args:
+        text: The message text
+        user_id: The sender, whose custom categories are also matched
+
+    Returns:
+        The analysis result ({'type', 'content', 'details'})
+    """
+    timings = []
+    best = None
+    best_stage = None
+    for name, stage in RULE_STAGES:
+        started = time.perf_counter()
+        candidate = stage(text, user_id)
+        timings.append((name, time.perf_counter() - started))
+        if candidate is None:
+            continue
+        if candidate[1] >= AI_CONFIDENCE_THRESHOLD:
+            stage_stats.record(timings, name)
+            return candidate[0]
+        if best is None or candidate[1] > best[1]:
+            best, best_stage = candidate, name
+
+    failed = None
+    client = get_model_client()
+    if client is not None:
+        started = time.perf_counter()
+        try:
+            result = client.analyze(text)
+            timings.append(('model', time.perf_counter() - started))
+            stage_stats.record(timings, 'model')
+            return result
+        except Exception as e:
+            timings.append(('model', time.perf_counter() - started))
+            failed = 'model'
+            logger.warning(f"Model analysis failed, using the {best_stage} stage result: {str(e)}")
+
+    stage_stats.record(timings, best_stage, fallback=True, failed=failed)
+    return best[0]
+
+
+def get_stage_stats() -> Dict[str, Any]:
+    """
+    Hit rate and latency of each classifier stage in this process.
+    """
+    return stage_stats.snapshot()
+
+
+def analyze_message(text: str, user_id: Optional[str] = None) -> str:
+    """
+    Analyze user message: deterministic parsers first, the multi_parser prompt on the
+    local model server only for messages they cannot classify confidently.
     
     Args:
         text: The message text to analyze
+        user_id: The sender, whose custom categories are also matched
         
     Returns:
         The AI analysis result as a JSON string
     """
+    try:
+        return json.dumps(classify_staged(text, user_id))
+    except Exception as e:
+        logger.error(f"Error in staged analysis: {str(e)}", exc_info=True)
+        return json.dumps(keyword_analysis(text, user_id))
+
+
+def keyword_analysis(text: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analyze user message using simplified mock analysis.
+    
+    Args:
+        text: The message text to analyze
+        user_id: The sender, whose custom categories are also matched
+        
+    Returns:
+        The analysis result ({'type', 'content', 'details'})
+    """
     try:
         # 簡單的關鍵詞分析代替AI分析
         result = {}
         result["content"] = text
+        scores = classify_message(text, user_id)
+        intents = dict(scores.get("intent", []))
         
         # 記帳類型判斷
-        if any(word in text for word in ["元", "塊", "錢", "$"]) or text.replace(".", "").isdigit():
+        if intents.get("accounting") or text.replace(".", "").isdigit():
             result["type"] = "accounting"
             # 提取金額
-            import re
             amount_match = re.search(r'(\d+)(?:元|塊|$)', text)
             amount = int(amount_match.group(1)) if amount_match else 0
             
-            # 簡單分類
-            category = "其他"
-            if any(word in text for word in ["餐", "飯", "吃"]):
-                category = "食物"
-            elif any(word in text for word in ["車", "捷運", "公車"]):
-                category = "交通"
+            # 分數最高的類別
+            categories = scores.get("category")
+            category = categories[0][0] if categories else "other"
+            category = CATEGORY_NAMES.get(category, category)
                 
             # 獲取項目名稱（去除金額）
             item = text.replace(str(amount), "").replace("元", "").strip()
@@ -51,7 +363,7 @@ def analyze_message(text: str) -> str:
             }
             
         # 提醒類型判斷
-        elif any(word in text for word in ["提醒", "記得", "通知"]):
+        elif intents.get("reminder"):
             result["type"] = "reminder"
             result["details"] = {
                 "event": text.replace("提醒我", "").strip(),
@@ -67,15 +379,14 @@ def analyze_message(text: str) -> str:
                 "priority": "中"
             }
             
-        return json.dumps(result)
+        return result
         
     except Exception as e:
         logger.error(f"Error in analysis: {str(e)}", exc_info=True)
         
         # Return a fallback result
-        fallback = {
+        return {
             "type": "unknown",
             "content": text,
             "details": {}
-        }
-        return json.dumps(fallback)
\ No newline at end of file
+        }
\ No newline at end of file
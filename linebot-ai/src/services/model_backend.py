@@ -0,0 +1,316 @@
+"""
+Model backend module.
+Runs the multi_parser prompt against a local model server: the prompt template is loaded once,
+concurrent requests are micro-batched into a single model call, and results are cached in an LRU
+keyed by the normalized message text so repeated messages never pay model latency twice.
+"""
+import re
+import abc
+import copy
+import json
+import time
+import logging
+import threading
+import unicodedata
+import urllib.request
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from services.ttl_cache import TTLCache, MISSING
+from ..config import (
+    get_prompt_path, AI_MODEL_URL, AI_MODEL_TIMEOUT, AI_MODEL_BATCH_SIZE,
+    AI_MODEL_BATCH_WAIT, AI_MODEL_CACHE_SIZE, AI_MODEL_CACHE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROMPT = 'multi_parser.prompt.txt'
+INPUT_PLACEHOLDER = '{input}'
+
+# The first JSON object in the model output (models often wrap it in prose or code fences)
+JSON_OBJECT_PATTERN = re.compile(r'\{.*\}', re.DOTALL)
+
+
+class ModelBackendError(Exception):
+    """The model server failed or returned an unusable result."""
+
+
+@lru_cache(maxsize=None)
+def load_prompt(prompt_name: str = DEFAULT_PROMPT) -> str:
+    """
+    Read a prompt template from the prompts directory, once per process.
+
+    Args:
+        prompt_name: File name inside the prompts directory
+
+    Returns:
+        The template text containing the {input} placeholder
+    """
+    with open(get_prompt_path(prompt_name), encoding='utf-8') as f:
+        return f.read()
+
+
+def render_prompt(template: str, text: str) -> str:
+    """
+    Fill the template's {input} placeholder (str.format would choke on JSON braces in the template).
+    """
+    return template.replace(INPUT_PLACEHOLDER, text)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Cache key for a message: NFKC (full-width digits and letters to half-width),
+    lowercase, and runs of whitespace collapsed.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', text or '').lower().split())
+
+
+def parse_model_output(output: str) -> Dict[str, Any]:
+    """
+    Extract the JSON result from a model completion.
+
+    Raises:
+        ModelBackendError: The output holds no JSON object or it lacks a type
+    """
+    match = JSON_OBJECT_PATTERN.search(output or '')
+    if not match:
+        raise ModelBackendError(f"model output is not JSON: {output!r:.200}")
+    try:
+        result = json.loads(match.group(0))
+    except ValueError as e:
+        raise ModelBackendError(f"model output is not valid JSON: {e}")
+    if not isinstance(result, dict) or 'type' not in result:
+        raise ModelBackendError(f"model output has no type: {result!r:.200}")
+    result.setdefault('details', {})
+    return result
+
+
+class ModelBackend(abc.ABC):
+    """
+    Inference backend interface: completes a batch of prompts in one model call.
+    """
+
+    @abc.abstractmethod
+    def complete_batch(self, prompts: List[str]) -> List[str]:
+        """
+        Args:
+            prompts: Fully rendered prompts
+
+        Returns:
+            One completion per prompt, in the same order
+        """
+
+
+class HttpModelBackend(ModelBackend):
+    """
+    Local model server over HTTP.
+
+    Request:  POST {"prompts": ["...", ...]}
+    Response: {"outputs": ["...", ...]}
+    """
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def complete_batch(self, prompts: List[str]) -> List[str]:
+        body = json.dumps({'prompts': prompts}, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(
+            self.url, data=body, headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            raise ModelBackendError(f"model server request failed: {e}")
+
+        outputs = payload.get('outputs') if isinstance(payload, dict) else None
+        if not isinstance(outputs, list) or len(outputs) != len(prompts):
+            raise ModelBackendError(f"model server returned {payload!r:.200} for {len(prompts)} prompts")
+        return outputs
+
+
+class ModelClient:
+    """
+    Prompt-based message analysis with an LRU result cache and micro-batching.
+
+    A cache hit returns immediately. Concurrent misses for the same normalized text share one
+    pending request; distinct misses queue up and a background thread sends them together once
+    max_batch requests are waiting or batch_wait seconds have passed since the first one.
+    """
+
+    def __init__(self, backend: ModelBackend, prompt_name: str = DEFAULT_PROMPT, max_batch: int = 16,
+                 batch_wait: float = 0.02, cache_size: int = 4096, cache_ttl: float = 86400,
+                 timeout: float = 15.0):
+        """
+        Args:
+            backend: The inference backend
+            prompt_name: Prompt template file in the prompts directory
+            max_batch: Most prompts sent in one model call
+            batch_wait: Longest time (seconds) the first queued request waits for others to join
+            cache_size: Most cached results
+            cache_ttl: Lifetime (seconds) of a cached result
+            timeout: Longest time (seconds) a caller waits for its result
+        """
+        self.backend = backend
+        self.template = load_prompt(prompt_name)
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.counts = {'hits': 0, 'misses': 0, 'coalesced': 0, 'batches': 0, 'batched': 0, 'errors': 0}
+        self.model_seconds = 0.0
+        self._cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+        self._inflight = {}
+        self._pending = []
+        self._first_at = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        """
+        Analyze a message with the prompt.
+
+        Args:
+            text: The message text
+
+        Returns:
+            The parsed result ({'type', 'content', 'details'}); content is always the given text
+
+        Raises:
+            ModelBackendError: The model call failed or its output was unusable
+        """
+        result = self.submit(text).result(self.timeout)
+        result = copy.deepcopy(result)
+        result['content'] = text
+        return result
+
+    def submit(self, text: str) -> Future:
+        """
+        Queue a message for analysis without waiting.
+
+        Returns:
+            A Future resolving to the cached result dict (do not mutate it)
+        """
+        key = normalize_text(text)
+        with self._condition:
+            # Results are cached before their in-flight entry is removed, so checking both under
+            # the lock guarantees a text is never sent to the model twice
+            value = self._cache.get(key, MISSING)
+            if value is not MISSING:
+                self.counts['hits'] += 1
+                future = Future()
+                future.set_result(value)
+                return future
+
+            self.counts['misses'] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counts['coalesced'] += 1
+                return future
+
+            future = Future()
+            self._inflight[key] = future
+            self._pending.append((key, render_prompt(self.template, text), future))
+            self._ensure_thread()
+            if self._first_at is None:
+                # Wake the idle batcher thread to start the batch window
+                self._first_at = time.time()
+                self._condition.notify()
+            elif len(self._pending) >= self.max_batch:
+                self._condition.notify()
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache and batching counters."""
+        with self._condition:
+            stats = dict(self.counts)
+            stats['pending'] = len(self._pending)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['avg_batch_size'] = round(stats['batched'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['model_seconds'] = round(self.model_seconds, 3)
+        stats['cached'] = len(self._cache)
+        return stats
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='model-batcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._first_at is not None:
+                        remaining = self._first_at + self.batch_wait - time.time()
+                        if remaining <= 0 or len(self._pending) >= self.max_batch:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                self._first_at = time.time() if self._pending else None
+
+            try:
+                self._complete(batch)
+            except Exception as e:
+                logger.error(f"Model batch failed: {str(e)}", exc_info=True)
+
+    def _complete(self, batch):
+        """Send one batch to the backend and resolve its futures."""
+        started = time.perf_counter()
+        try:
+            outputs = self.backend.complete_batch([prompt for _, prompt, _ in batch])
+        except Exception as e:
+            outputs = [e] * len(batch)
+        elapsed = time.perf_counter() - started
+
+        errors = 0
+        for (key, _, future), output in zip(batch, outputs):
+            try:
+                if isinstance(output, Exception):
+                    raise output
+                result = parse_model_output(output)
+                self._cache.set(key, result)
+            except Exception as e:
+                errors += 1
+                with self._condition:
+                    self._inflight.pop(key, None)
+                future.set_exception(e)
+                continue
+            with self._condition:
+                self._inflight.pop(key, None)
+            future.set_result(result)
+
+        with self._condition:
+            self.counts['batches'] += 1
+            self.counts['batched'] += len(batch)
+            self.counts['errors'] += errors
+            self.model_seconds += elapsed
+        if errors:
+            logger.warning(f"Model batch of {len(batch)} had {errors} failures")
+
+
+_model_client = None
+_model_client_lock = threading.Lock()
+
+
+def get_model_client() -> Optional[ModelClient]:
+    """
+    The process-wide model client, or None when AI_MODEL_URL is not configured.
+    """
+    global _model_client
+    if _model_client is None and AI_MODEL_URL:
+        with _model_client_lock:
+            if _model_client is None:
+                _model_client = ModelClient(
+                    HttpModelBackend(AI_MODEL_URL, timeout=AI_MODEL_TIMEOUT),
+                    max_batch=AI_MODEL_BATCH_SIZE,
+                    batch_wait=AI_MODEL_BATCH_WAIT,
+                    cache_size=AI_MODEL_CACHE_SIZE,
+                    cache_ttl=AI_MODEL_CACHE_TTL,
+                    timeout=AI_MODEL_TIMEOUT + AI_MODEL_BATCH_WAIT
+                )
+    return _model_client
@@ -6,7 +6,7 @@ import os
 import logging
 import urllib.parse
 from flask import Flask, request, abort
-from linebot import LineBotApi, WebhookHandler
+from linebot import WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage,
@@ -14,7 +14,6 @@ from linebot.models import (
     TextComponent, ButtonComponent, MessageAction,
     PostbackEvent, PostbackAction, URIAction
 )
-from datetime import datetime, timedelta
 import re
 import json
 import traceback
@@ -23,625 +22,356 @@ import traceback
 from services.finance_service import FinanceService
 from services.flex_message_service import FlexMessageService
 from services.task_service import TaskService
+from services.webhook_service import WebhookService
+from services.reply_deadline import ReplyDeadline, closed_path
+from ops_routes import register_ops_routes
+from services.log_service import LogService
+from services.line_client import get_line_bot_api
+from services.profile_cache import get_profile_cache
+from services.state_store import get_state_store
+from services.flow_engine import FlowEngine
+from services.command_parser import parse_message_commands, parse_amount_input
+from services.keyword_router import KeywordRouter, BEFORE_FLOW, AFTER_FLOW
+from services.time_parser import resolve_time
 
 # 設置日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+LogService.setup()
 logger = logging.getLogger(__name__)
 
 # 初始化 LINE Bot API
-line_bot_api = LineBotApi(os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', ''))
+line_bot_api = get_line_bot_api()
 handler = WebhookHandler(os.environ.get('LINE_CHANNEL_SECRET', ''))
 
-# 用於暫存用戶的輸入狀態
-user_states = {}
+# 用於暫存用戶的輸入狀態（STATE_STORE_BACKEND=sqlite 時多個工作進程共用）
+user_states = get_state_store()
 
-def process_message(event):
-    """處理收到的訊息"""
+# 多步驟對話流程，步驟處理函數以 @flows.step 註冊
+flows = FlowEngine(user_states)
+
+# 固定命令的關鍵字路由，處理函數以 @routes.route 註冊
+routes = KeywordRouter()
+
+# 對話流程的顯示名稱（流程逾時提示用）
+FLOW_NAMES = {
+    'amount': '輸入金額',
+    'keypad_input': '輸入金額',
+    'note': '輸入備註',
+    'custom_category': '新增類別',
+    'new_account': '新增帳戶',
+    'edit_amount': '修改金額',
+    'edit_note': '修改備註',
+    'task_details': '新增任務'
+}
+
+# Postback 的 action，其他值在統計中歸入 postback:other
+POSTBACK_ACTIONS = ('record', 'view_transactions', 'task_menu')
+
+def get_reply_path(event):
+    """取得訊息的處理路徑（回覆期限統計用）：流程步驟、路由名稱或記帳命令類型，其他訊息歸入 message:other"""
+    state = user_states.get(event.source.user_id)
+    if state and state.get('waiting_for'):
+        return closed_path('flow', state['waiting_for'], FLOW_NAMES)
+    text = event.message.text
+    route = routes.match(text, BEFORE_FLOW) or routes.match(text, AFTER_FLOW)
+    if route:
+        return f"message:{route.name}"
+    command, batch = parse_message_commands(text)
+    if batch:
+        return 'message:batch'
+    if command:
+        return f"message:{command.type}"
+    return 'message:other'
+
+@routes.route('api_test', keywords=['kimi test'])
+def handle_api_test(user_id, message_text):
+    """kimi test：檢查 LINE API 憑證與連線"""
+    logger.info(f"用戶 {user_id} 請求 API 測試")
     try:
-        user_id = event.source.user_id
-        message_text = event.message.text
-        logger.info(f"收到訊息: {message_text} 從用戶: {user_id}")
+        # 測試 LINE API 憑證
+        test_result = f"API 憑證測試:\n"
+        test_result += f"Channel Secret: {'已設定' if os.environ.get('LINE_CHANNEL_SECRET') else '未設定'}\n"
+        test_result += f"Channel Access Token: {'已設定' if os.environ.get('LINE_CHANNEL_ACCESS_TOKEN') else '未設定'}\n"
+        test_result += f"LIFF ID: {os.environ.get('LIFF_ID', '未設定')}"
         
-        # 檢查是否為 kimi test 命令
-        if message_text.lower() == "kimi test":
-            logger.info(f"用戶 {user_id} 請求 API 測試")
-            try:
-                # 測試 LINE API 憑證
-                test_result = f"API 憑證測試:\n"
-                test_result += f"Channel Secret: {'已設定' if os.environ.get('LINE_CHANNEL_SECRET') else '未設定'}\n"
-                test_result += f"Channel Access Token: {'已設定' if os.environ.get('LINE_CHANNEL_ACCESS_TOKEN') else '未設定'}\n"
-                test_result += f"LIFF ID: {os.environ.get('LIFF_ID', '未設定')}"
-                
-                # 嘗試獲取 bot 資訊以確認 API 連接正常
-                try:
-                    bot_info = line_bot_api.get_bot_info()
-                    test_result += f"\n\nBot 資訊獲取成功:\nBot名稱: {bot_info.display_name}\n"
-                    test_result += f"Bot頭像: {bot_info.picture_url}\n"
-                    test_result += "LINE Bot API 連接正常!"
-                except Exception as api_error:
-                    test_result += f"\n\nBot 資訊獲取失敗: {str(api_error)}"
-                
-                return test_result
-            except Exception as e:
-                return f"API 測試過程發生錯誤: {str(e)}"
+        # 嘗試獲取 bot 資訊以確認 API 連接正常
+        try:
+            bot_info = get_profile_cache().get_bot_info(line_bot_api)
+            test_result += f"\n\nBot 資訊獲取成功:\nBot名稱: {bot_info.display_name}\n"
+            test_result += f"Bot頭像: {bot_info.picture_url}\n"
+            test_result += "LINE Bot API 連接正常!"
+        except Exception as api_error:
+            test_result += f"\n\nBot 資訊獲取失敗: {str(api_error)}"
         
-        # 檢查是否為 kimi flex 命令 - 特殊檢查，不區分大小寫
-        lower_text = message_text.lower()
-        if lower_text == "kimi flex" or lower_text == "kimi主選單" or lower_text == "kimi 主選單" or lower_text == "主選單":
-            logger.info(f"用戶 {user_id} 請求主選單 (輸入: {message_text})")
-            # 直接使用字典格式創建 Flex 消息
-            try:
-                flex_message = FlexSendMessage(
-                    alt_text="Kimi 助手選單",
-                    contents={
-                        "type": "bubble",
-                        "body": {
+        return test_result
+    except Exception as e:
+        return f"API 測試過程發生錯誤: {str(e)}"
+
+@routes.route('main_menu', keywords=['kimi flex', 'kimi主選單', 'kimi 主選單', '主選單', 'kimi'])
+def handle_main_menu(user_id, message_text):
+    """顯示主選單（不區分大小寫）"""
+    logger.info(f"用戶 {user_id} 請求主選單 (輸入: {message_text})")
+    # 直接使用字典格式創建 Flex 消息
+    try:
+        flex_message = FlexSendMessage(
+            alt_text="Kimi 助手選單",
+            contents={
+                "type": "bubble",
+                "body": {
+                    "type": "box",
+                    "layout": "vertical",
+                    "backgroundColor": "#FFFBE6",
+                    "contents": [
+                        {
+                            "type": "text",
+                            "text": "Kimi 助手",
+                            "weight": "bold",
+                            "size": "xl",
+                            "align": "center",
+                            "color": "#595959"
+                        },
+                        {
+                            "type": "text",
+                            "text": "請選擇功能",
+                            "size": "md",
+                            "color": "#8C8C8C",
+                            "align": "center",
+                            "margin": "md"
+                        },
+                        {
+                            "type": "separator",
+                            "margin": "xl",
+                            "color": "#D9D9D9"
+                        },
+                        {
                             "type": "box",
-                            "layout": "vertical",
-                            "backgroundColor": "#FFFBE6",
+                            "layout": "horizontal",
+                            "margin": "md",
                             "contents": [
                                 {
-                                    "type": "text",
-                                    "text": "Kimi 助手",
-                                    "weight": "bold",
-                                    "size": "xl",
-                                    "align": "center",
-                                    "color": "#595959"
-                                },
-                                {
-                                    "type": "text",
-                                    "text": "請選擇功能",
-                                    "size": "md",
-                                    "color": "#8C8C8C",
-                                    "align": "center",
-                                    "margin": "md"
-                                },
-                                {
-                                    "type": "separator",
-                                    "margin": "xl",
-                                    "color": "#D9D9D9"
-                                },
-                                {
-                                    "type": "box",
-                                    "layout": "horizontal",
-                                    "margin": "md",
-                                    "contents": [
-                                        {
-                                            "type": "button",
-                                            "style": "primary",
-                                            "color": "#FFC940",
-                                            "action": {
-                                                "type": "postback",
-                                                "label": "記帳",
-                                                "displayText": "記帳",
-                                                "data": "action=record&type=expense"
-                                            },
-                                            "height": "sm",
-                                            "flex": 1
-                                        },
-                                        {
-                                            "type": "button",
-                                            "style": "primary",
-                                            "color": "#FAAD14",
-                                            "action": {
-                                                "type": "postback",
-                                                "label": "任務",
-                                                "displayText": "任務管理",
-                                                "data": "action=task_menu"
-                                            },
-                                            "height": "sm",
-                                            "margin": "md",
-                                            "flex": 1
-                                        }
-                                    ]
+                                    "type": "button",
+                                    "style": "primary",
+                                    "color": "#FFC940",
+                                    "action": {
+                                        "type": "postback",
+                                        "label": "記帳",
+                                        "displayText": "記帳",
+                                        "data": "action=record&type=expense"
+                                    },
+                                    "height": "sm",
+                                    "flex": 1
                                 },
                                 {
-                                    "type": "box",
-                                    "layout": "horizontal",
+                                    "type": "button",
+                                    "style": "primary",
+                                    "color": "#FAAD14",
+                                    "action": {
+                                        "type": "postback",
+                                        "label": "任務",
+                                        "displayText": "任務管理",
+                                        "data": "action=task_menu"
+                                    },
+                                    "height": "sm",
                                     "margin": "md",
-                                    "contents": [
-                                        {
-                                            "type": "button",
-                                            "style": "secondary",
-                                            "color": "#FFC940",
-                                            "action": {
-                                                "type": "postback",
-                                                "label": "記錄查詢",
-                                                "displayText": "查詢記錄",
-                                                "data": "action=view_transactions&period=today"
-                                            },
-                                            "height": "sm",
-                                            "flex": 1
-                                        },
-                                        {
-                                            "type": "button",
-                                            "style": "secondary",
-                                            "color": "#FAAD14",
-                                            "action": {
-                                                "type": "message",
-                                                "label": "月度報表",
-                                                "text": "月報"
-                                            },
-                                            "height": "sm",
-                                            "margin": "md",
-                                            "flex": 1
-                                        }
-                                    ]
+                                    "flex": 1
                                 }
                             ]
-                        }
-                    }
-                )
-                logger.info("成功創建內置 Flex 消息")
-                return flex_message
-            except Exception as e:
-                logger.error(f"創建 Flex 消息時出錯: {str(e)}")
-                # 失敗時返回純文本
-                return "主選單功能暫時無法使用，請稍後再試。"
-        
-        # 也檢查單獨的 kimi 命令
-        if lower_text == "kimi":
-            logger.info(f"用戶 {user_id} 請求主選單 (輸入: {message_text})")
-            # 使用與上面相同的 Flex 消息
-            try:
-                flex_message = FlexSendMessage(
-                    alt_text="Kimi 助手選單",
-                    contents={
-                        "type": "bubble",
-                        "body": {
+                        },
+                        {
                             "type": "box",
-                            "layout": "vertical",
-                            "backgroundColor": "#FFFBE6",
+                            "layout": "horizontal",
+                            "margin": "md",
                             "contents": [
                                 {
-                                    "type": "text",
-                                    "text": "Kimi 助手",
-                                    "weight": "bold",
-                                    "size": "xl",
-                                    "align": "center",
-                                    "color": "#595959"
+                                    "type": "button",
+                                    "style": "secondary",
+                                    "color": "#FFC940",
+                                    "action": {
+                                        "type": "postback",
+                                        "label": "記錄查詢",
+                                        "displayText": "查詢記錄",
+                                        "data": "action=view_transactions&period=today"
+                                    },
+                                    "height": "sm",
+                                    "flex": 1
                                 },
                                 {
-                                    "type": "text",
-                                    "text": "請選擇功能",
-                                    "size": "md",
-                                    "color": "#8C8C8C",
-                                    "align": "center",
-                                    "margin": "md"
-                                },
-                                {
-                                    "type": "separator",
-                                    "margin": "xl",
-                                    "color": "#D9D9D9"
-                                },
-                                {
-                                    "type": "box",
-                                    "layout": "horizontal",
-                                    "margin": "md",
-                                    "contents": [
-                                        {
-                                            "type": "button",
-                                            "style": "primary",
-                                            "color": "#FFC940",
-                                            "action": {
-                                                "type": "postback",
-                                                "label": "記帳",
-                                                "displayText": "記帳",
-                                                "data": "action=record&type=expense"
-                                            },
-                                            "height": "sm",
-                                            "flex": 1
-                                        },
-                                        {
-                                            "type": "button",
-                                            "style": "primary",
-                                            "color": "#FAAD14",
-                                            "action": {
-                                                "type": "postback",
-                                                "label": "任務",
-                                                "displayText": "任務管理",
-                                                "data": "action=task_menu"
-                                            },
-                                            "height": "sm",
-                                            "margin": "md",
-                                            "flex": 1
-                                        }
-                                    ]
-                                },
-                                {
-                                    "type": "box",
-                                    "layout": "horizontal",
+                                    "type": "button",
+                                    "style": "secondary",
+                                    "color": "#FAAD14",
+                                    "action": {
+                                        "type": "message",
+                                        "label": "月度報表",
+                                        "text": "月報"
+                                    },
+                                    "height": "sm",
                                     "margin": "md",
-                                    "contents": [
-                                        {
-                                            "type": "button",
-                                            "style": "secondary",
-                                            "color": "#FFC940",
-                                            "action": {
-                                                "type": "postback",
-                                                "label": "記錄查詢",
-                                                "displayText": "查詢記錄",
-                                                "data": "action=view_transactions&period=today"
-                                            },
-                                            "height": "sm",
-                                            "flex": 1
-                                        },
-                                        {
-                                            "type": "button",
-                                            "style": "secondary",
-                                            "color": "#FAAD14",
-                                            "action": {
-                                                "type": "message",
-                                                "label": "月度報表",
-                                                "text": "月報"
-                                            },
-                                            "height": "sm",
-                                            "margin": "md",
-                                            "flex": 1
-                                        }
-                                    ]
+                                    "flex": 1
                                 }
                             ]
                         }
-                    }
-                )
-                logger.info("成功創建內置 Flex 消息")
-                return flex_message
-            except Exception as e:
-                logger.error(f"創建 Flex 消息時出錯: {str(e)}")
-                # 失敗時返回純文本
-                return "主選單功能暫時無法使用，請稍後再試。"
+                    ]
+                }
+            }
+        )
+        logger.info("成功創建內置 Flex 消息")
+        return flex_message
+    except Exception as e:
+        logger.error(f"創建 Flex 消息時出錯: {str(e)}")
+        # 失敗時返回純文本
+        return "主選單功能暫時無法使用，請稍後再試。"
+
+@routes.route('liff_task', prefixes=['{"type":"task"', '{"type": "task"'])
+def handle_liff_task(user_id, message_text):
+    """從 LIFF 應用發送的任務數據（JSON 格式），無法解析時返回 None 交給後續處理"""
+    try:
+        task_data = json.loads(message_text)
+        if task_data.get('type') == 'task':
+            return process_task_from_liff(user_id, task_data)
+    except json.JSONDecodeError:
+        logger.warning(f"無法解析 JSON: {message_text}")
+    return None
+
+@routes.route('help', keywords=['help', '幫助', '說明'], tier=AFTER_FLOW)
+def handle_help_route(user_id, message_text):
+    """處理特殊命令"""
+    return handle_help_command(user_id)
+
+@routes.route('initialize', keywords=['初始化', 'init'], tier=AFTER_FLOW)
+def handle_initialize(user_id, message_text):
+    """處理初始化命令"""
+    return FinanceService.initialize_user(user_id)
+
+@routes.route('records', keywords=['記錄', '編輯記錄', '查看記錄'], tier=AFTER_FLOW)
+def handle_records(user_id, message_text):
+    """處理記錄查詢命令"""
+    return FlexMessageService.create_transaction_period_selection()
+
+def process_message(event):
+    """處理收到的訊息"""
+    try:
+        user_id = event.source.user_id
+        message_text = event.message.text
+        logger.info(f"收到訊息: {message_text} 從用戶: {user_id}")
+        
+        # 固定命令（主選單、API 測試、LIFF 任務資料）直接查表處理
+        route = routes.match(message_text, BEFORE_FLOW)
+        if route:
+            response = routes.serve(route, user_id, message_text)
+            if response is not None:
+                return response
         
-        # 檢查是否為 JSON 格式（可能是從 LIFF 應用發送的任務數據）
-        if message_text.startswith('{"type":"task"') or message_text.startswith('{"type": "task"'):
-            try:
-                task_data = json.loads(message_text)
-                if task_data.get('type') == 'task':
-                    return process_task_from_liff(user_id, task_data)
-            except json.JSONDecodeError:
-                logger.warning(f"無法解析 JSON: {message_text}")
+        # 一次解析快速支出與記帳命令（多行訊息為多筆記帳時 command 為 None）
+        command, batch = parse_message_commands(message_text)
         
         # 檢查是否是快速支出命令（例如：早餐-500）
-        quick_expense = FinanceService.parse_quick_expense_command(message_text)
-        if quick_expense:
-            logger.info(f"檢測到快速支出命令: {quick_expense}")
+        if command and command.type == 'quick_expense':
+            logger.info(f"檢測到快速支出命令: {command}")
+            routes.record('quick_expense')
             # 直接處理快速支出流程，在選類別時自動帶入備註
             return FinanceService.prepare_quick_expense(
                 user_id=user_id,
-                amount=quick_expense['amount'],
-                category_keyword=quick_expense['category_keyword'],
-                note=quick_expense['note']  # 將類別名稱作為備註
+                amount=command.amount,
+                category_keyword=command.category,
+                note=command.note  # 將類別名稱作為備註
             )
         
         # 檢查用戶是否處於特定狀態（例如等待輸入金額）
-        if user_id in user_states:
-            state = user_states[user_id]
-            if state.get('waiting_for') == 'amount':
-                # 用戶正在輸入金額
-                try:
-                    # 檢查輸入是否包含文字作為備註
-                    # 例如: "早餐500" 中的 "早餐" 將作為備註
-                    text_note_match = re.match(r'^([^\d]+)(\d[\d,.]+)$', message_text)
-                    if text_note_match:
-                        note = text_note_match.group(1).strip()
-                        amount_str = text_note_match.group(2).replace(',', '')
-                        amount = float(amount_str)
-                        logger.info(f"用戶 {user_id} 輸入金額: {amount}，自動帶入備註: '{note}'")
-                        return handle_amount_input(user_id, amount, state, note)
-                    else:
-                        amount = float(message_text)  # 使用 float 而不是 int 來支持小數金額
-                        logger.info(f"用戶 {user_id} 輸入金額: {amount}")
-                        return handle_amount_input(user_id, amount, state)
-                except ValueError:
-                    # 嘗試檢查是否包含逗號或其他非數字字符
-                    try:
-                        # 移除逗號、空格等字符
-                        cleaned_text = message_text.replace(',', '').replace(' ', '')
-                        # 再檢查一次是否有文字備註
-                        text_note_match = re.match(r'^([^\d]+)(\d[\d,.]+)$', cleaned_text)
-                        if text_note_match:
-                            note = text_note_match.group(1).strip()
-                            amount_str = text_note_match.group(2)
-                            amount = float(amount_str)
-                            logger.info(f"用戶 {user_id} 輸入經過清理的金額: {amount}，自動帶入備註: {note}")
-                            return handle_amount_input(user_id, amount, state, note)
-                        else:
-                            amount = float(cleaned_text)
-                            logger.info(f"用戶 {user_id} 輸入經過清理的金額: {amount}")
-                            return handle_amount_input(user_id, amount, state)
-                    except ValueError:
-                        return "請輸入有效的數字金額，例如: 100 或 1,234.56 或 早餐500"
-            elif state.get('waiting_for') == 'note':
-                # 用戶正在輸入備註
-                return handle_note_input(user_id, message_text, state)
-            elif state.get('waiting_for') == 'custom_category':
-                # 用戶正在輸入自定義類別
-                return handle_custom_category(user_id, message_text, state)
-            elif state.get('waiting_for') == 'new_account':
-                # 用戶正在輸入新帳戶名稱
-                return handle_new_account(user_id, message_text, state)
-            elif state.get('waiting_for') == 'keypad_input':
-                # 用戶已在使用數字鍵盤，直接將輸入作為完整金額
-                try:
-                    amount = int(message_text)
-                    transaction_type = state.get('type')
-                    category = state.get('category')
-                    # 清除用戶狀態
-                    del user_states[user_id]
-                    # 繼續到帳戶選擇
-                    return FlexMessageService.create_account_selection(user_id, transaction_type, category, amount)
-                except ValueError:
-                    return "請輸入有效的數字金額。"
-            elif state.get('waiting_for') == 'edit_amount':
-                # 用戶正在編輯交易金額
-                try:
-                    transaction_id = state.get('transaction_id')
-                    new_amount = float(message_text)
-                    
-                    # 更新交易記錄
-                    result = FinanceService.update_transaction(
-                        user_id=user_id,
-                        transaction_id=transaction_id,
-                        amount=new_amount
-                    )
-                    
-                    # 清除用戶狀態
-                    del user_states[user_id]
-                    
-                    # 返回詳情頁面
-                    transaction_detail, error = FinanceService.get_transaction_detail(user_id, transaction_id)
-                    if error:
-                        return error
-                    
-                    return FlexMessageService.create_transaction_detail(transaction_detail)
-                except ValueError:
-                    return "請輸入有效的數字金額，例如: 100 或 1,234.56"
-            elif state.get('waiting_for') == 'edit_note':
-                # 用戶正在編輯交易備註
-                transaction_id = state.get('transaction_id')
-                new_note = message_text
-                
-                # 更新交易記錄
-                result = FinanceService.update_transaction(
-                    user_id=user_id,
-                    transaction_id=transaction_id,
-                    note=new_note
-                )
-                
-                # 清除用戶狀態
-                del user_states[user_id]
-                
-                # 返回詳情頁面
-                transaction_detail, error = FinanceService.get_transaction_detail(user_id, transaction_id)
-                if error:
-                    return error
-                
-                return FlexMessageService.create_transaction_detail(transaction_detail)
-            elif state.get('waiting_for') == 'task_details':
-                # 用戶正在輸入任務詳情
-                
-                # 解析任務內容和提醒時間
-                task_info = {}
-                try:
-                    # 支持兩種格式：「任務:xxx 提醒:xxx」和「@xxx !xxx」
-                    task_match = re.search(r'(任務[:：]|@)(.+?)(?:\s+(提醒[:：]|!)|$)', message_text)
-                    reminder_match = re.search(r'(提醒[:：]|!)(.+)', message_text)
-                    
-                    if task_match:
-                        task_info['name'] = task_match.group(2).strip()
-                    else:
-                        task_info['name'] = message_text.strip()
-                    
-                    if reminder_match:
-                        task_info['reminder_time'] = reminder_match.group(2).strip()
-                    else:
-                        task_info['reminder_time'] = '明天早上9點'
-                    
-                    logger.info(f"解析任務: {task_info['name']}, 提醒時間: {task_info['reminder_time']}")
-                    
-                    # 嘗試解析時間
-                    now = datetime.datetime.now()
-                    reminder_time = now + datetime.timedelta(days=1)  # 默認為明天
-                    hour = 9  # 默認為早上9點
-                    minute = 0
-                    
-                    # 簡單處理一些常見的時間表達
-                    time_text = task_info['reminder_time']
-                    
-                    # 處理日期部分
-                    if '今天' in time_text:
-                        reminder_time = now
-                    elif '明天' in time_text:
-                        reminder_time = now + datetime.timedelta(days=1)
-                    elif '後天' in time_text:
-                        reminder_time = now + datetime.timedelta(days=2)
-                    
-                    # 處理時間部分
-                    if '早上' in time_text or '上午' in time_text or '凌晨' in time_text:
-                        # 處理具體時間，如「早上8點」、「早上9點半」
-                        hour_match = re.search(r'([0-9]+)[點時:]', time_text)
-                        if hour_match:
-                            hour = int(hour_match.group(1))
-                            # 如果是凌晨，保持小時數不變
-                            if '凌晨' in time_text:
-                                pass  # 凌晨時間保持不變
-                            elif hour >= 1 and hour <= 12:
-                                # 如果是12點，特殊處理為中午12點
-                                if hour == 12:
-                                    hour = 12
-                                # 如果是1-5點，可能是指凌晨時間
-                                elif hour >= 1 and hour <= 5:
-                                    pass  # 保持小時數不變，表示凌晨
-                                else:
-                                    # 其他早上時間保持不變
-                                    pass
-                        else:
-                            hour = 9  # 默認早上9點
-                        
-                        # 檢查是否有分鐘
-                        minute_match = re.search(r'([0-9]+)分', time_text)
-                        if minute_match:
-                            minute = int(minute_match.group(1))
-                        elif '半' in time_text:
-                            minute = 30
-                    
-                    elif '下午' in time_text or '傍晚' in time_text:
-                        hour_match = re.search(r'([0-9]+)[點時:]', time_text)
-                        if hour_match:
-                            hour = int(hour_match.group(1))
-                            # 將下午的時間轉換為24小時制
-                            if hour >= 1 and hour <= 12:
-                                # 如果是12點，就是中午12點
-                                if hour == 12:
-                                    hour = 12
-                                else:
-                                    hour += 12  # 其他時間加12
-                        else:
-                            hour = 15  # 默認下午3點
-                        
-                        # 檢查是否有分鐘
-                        minute_match = re.search(r'([0-9]+)分', time_text)
-                        if minute_match:
-                            minute = int(minute_match.group(1))
-                        elif '半' in time_text:
-                            minute = 30
-                    
-                    elif '晚上' in time_text or '夜晚' in time_text:
-                        hour_match = re.search(r'([0-9]+)[點時:]', time_text)
-                        if hour_match:
-                            hour = int(hour_match.group(1))
-                            # 將晚上的時間轉換為24小時制
-                            if hour >= 1 and hour <= 12:
-                                # 如果是12點，就是午夜0點
-                                if hour == 12:
-                                    hour = 0
-                                else:
-                                    hour += 12  # 其他時間加12
-                        else:
-                            hour = 20  # 默認晚上8點
-                        
-                        # 檢查是否有分鐘
-                        minute_match = re.search(r'([0-9]+)分', time_text)
-                        if minute_match:
-                            minute = int(minute_match.group(1))
-                        elif '半' in time_text:
-                            minute = 30
-                    
-                    else:
-                        # 嘗試直接解析具體時間，如「9點」、「14:30」
-                        hour_minute_match = re.search(r'(\d+):(\d+)', time_text)
-                        if hour_minute_match:
-                            hour = int(hour_minute_match.group(1))
-                            minute = int(hour_minute_match.group(2))
-                        else:
-                            hour_match = re.search(r'([0-9]+)[點時:]', time_text)
-                            if hour_match:
-                                hour = int(hour_match.group(1))
-                                # 上下文判斷：如果沒有明確指定上午/下午，根據數字大小判斷
-                                if hour >= 0 and hour <= 5:  # 凌晨
-                                    pass  # 已經是24小時制
-                                elif hour >= 6 and hour <= 12:  # 早上
-                                    pass  # 已經是正確的早上時間
-                                elif hour >= 13 and hour <= 23:  # 下午/晚上
-                                    pass  # 已經是24小時制
-                                
-                                # 檢查是否有分鐘
-                                minute_match = re.search(r'([0-9]+)分', time_text)
-                                if minute_match:
-                                    minute = int(minute_match.group(1))
-                                elif '半' in time_text:
-                                    minute = 30
-                    
-                    # 設置提醒時間的小時和分鐘
-                    reminder_time = reminder_time.replace(hour=hour, minute=minute, second=0, microsecond=0)
-                    logger.info(f"設置提醒時間: {reminder_time.strftime('%Y-%m-%d %H:%M')}, 原始時間文本: {time_text}, 解析結果: 日期={reminder_time.date()}, 時間={hour}:{minute}")
-                    
-                    # 創建提醒
-                    from models import db, Reminder
-                    import datetime
-                    
-                    # 創建新任務
-                    new_reminder = Reminder(
-                        user_id=user_id,
-                        content=task_info['name'],
-                        reminder_time=reminder_time,
-                        repeat_type='none',
-                        is_completed=False
-                    )
-                    
-                    db.session.add(new_reminder)
-                    db.session.commit()
-                    
-                    # 構建任務摘要
-                    task_summary = f"✅ 已創建新任務\n\n📌 {task_info['name']}\n⏰ {reminder_time.strftime('%Y-%m-%d %H:%M')}"
-                    
-                    # 清除用戶狀態
-                    del user_states[user_id]
-                    
-                    return task_summary
-                    
-                except Exception as e:
-                    logger.error(f"處理任務詳情時出錯: {str(e)}")
-                    return "處理任務時出錯，請使用格式：「@買牛奶 !明天早上9點」或「任務:買牛奶 提醒:明天早上9點」"
-        
-        # 處理特殊命令
-        if message_text.lower() in ['help', '幫助', '說明']:
-            return handle_help_command(user_id)
+        state = user_states.get(user_id)
+        # 沒有進行中的流程時，取出先前逾時的流程（無法理解訊息時提示用戶）
+        expired_state = None if state else user_states.pop_expired(user_id)
+        # 用戶處於多步驟流程中（例如等待輸入金額）時交給流程引擎處理
+        flow_response = flows.handle(user_id, message_text, state)
+        if flow_response is not None:
+            routes.record('flow')
+            return flow_response
         
-        # 處理初始化命令
-        if message_text.lower() in ['初始化', 'init']:
-            return FinanceService.initialize_user(user_id)
-        
-        # 處理記錄查詢命令
-        if message_text.lower() in ['記錄', '編輯記錄', '查看記錄']:
-            return FlexMessageService.create_transaction_period_selection()
+        # help、初始化、記錄查詢等命令
+        route = routes.match(message_text, AFTER_FLOW)
+        if route:
+            return routes.serve(route, user_id, message_text)
         
         # 嘗試處理財務相關命令
-        finance_response = FinanceService.process_finance_command(message_text, user_id)
+        finance_response = FinanceService.execute_command(command, user_id)
         if finance_response:
+            routes.record(f"finance:{command.type}")
             return finance_response
         
+        # 一則訊息多筆記帳（每行一筆），一次寫入並回覆彙總
+        if batch:
+            logger.info(f"檢測到批次記帳: {len(batch)} 筆")
+            routes.record('finance:batch')
+            return FinanceService.add_transactions_batch(user_id, batch)
+        
+        # 用戶回來接續已逾時的流程
+        if expired_state and expired_state.get('waiting_for') in FLOW_NAMES:
+            flow_name = FLOW_NAMES[expired_state['waiting_for']]
+            logger.info(f"用戶 {user_id} 的流程已逾時: {expired_state['waiting_for']}")
+            routes.record('flow_expired')
+            return f"⏰ 「{flow_name}」的操作已逾時，請重新開始。\n輸入「help」查看使用說明。"
+        
         # 如果沒有匹配的命令格式，返回幫助信息
+        routes.record('unrecognized')
         return "抱歉，我無法理解您的命令。請嘗試使用以下格式：\n" + get_help_text()
     
     except Exception as e:
         logger.error(f"處理訊息時發生錯誤: {str(e)}")
         return "處理您的請求時發生錯誤，請稍後再試。"
 
-def handle_amount_input(user_id, amount, state, note=None):
-    """處理用戶輸入的金額"""
-    transaction_type = state.get('type')
-    category = state.get('category')
+@flows.step('transaction', 'amount')
+def handle_amount_step(ctx):
+    """用戶正在輸入金額"""
+    try:
+        amount, note = parse_amount_input(ctx.text)
+    except ValueError:
+        # 移除逗號、空格等字符後再試一次
+        try:
+            amount, note = parse_amount_input(ctx.text.replace(',', '').replace(' ', ''))
+        except ValueError:
+            return ctx.retry("請輸入有效的數字金額，例如: 100 或 1,234.56 或 早餐500")
     
-    # 如果有備註，保存到狀態中
     if note:
-        user_states[user_id] = {
-            'type': transaction_type,
-            'category': category,
-            'amount': amount,
-            'note': note
-        }
+        logger.info(f"用戶 {ctx.user_id} 輸入金額: {amount}，自動帶入備註: '{note}'")
     else:
-        # 清除用戶狀態
-        if user_id in user_states:
-            del user_states[user_id]
+        logger.info(f"用戶 {ctx.user_id} 輸入金額: {amount}")
+    return handle_amount_input(ctx, amount, note)
+
+def handle_amount_input(ctx, amount, note=None):
+    """處理用戶輸入的金額"""
+    transaction_type = ctx.state.get('type')
+    category = ctx.state.get('category')
+    
+    # 繼續到帳戶選擇
+    response = FlexMessageService.create_account_selection(ctx.user_id, transaction_type, category, amount, note)
+    
+    # 如果有備註，保存到狀態中供選擇帳戶後使用
+    if note:
+        return ctx.hold(response, type=transaction_type, category=category, amount=amount, note=note)
+    return ctx.done(response)
+
+@flows.step('transaction', 'keypad_input')
+def handle_keypad_input(ctx):
+    """用戶已在使用數字鍵盤，直接將輸入作為完整金額"""
+    try:
+        amount = int(ctx.text)
+    except ValueError:
+        return ctx.retry("請輸入有效的數字金額。")
     
     # 繼續到帳戶選擇
-    return FlexMessageService.create_account_selection(user_id, transaction_type, category, amount, note)
+    return ctx.done(FlexMessageService.create_account_selection(
+        ctx.user_id, ctx.state.get('type'), ctx.state.get('category'), amount
+    ))
 
-def handle_note_input(user_id, note, state):
+@flows.step('transaction', 'note')
+def handle_note_input(ctx):
     """處理用戶輸入的備註"""
+    state = ctx.state
+    user_id = ctx.user_id
+    note = ctx.text
     transaction_type = state.get('type')
     category = state.get('category')
     amount = state.get('amount')
     account = state.get('account')
     
-    # 清除用戶狀態
-    del user_states[user_id]
-    
     # 添加交易記錄
     is_expense = transaction_type == 'expense'
     logger.info(f"添加交易記錄: 用戶:{user_id}, 類型:{transaction_type}, 類別:{category}, 金額:{amount}, 帳戶:{account}, 備註:{note}")
@@ -655,46 +385,126 @@ def handle_note_input(user_id, note, state):
     )
     
     # 返回確認訊息
-    return FlexMessageService.create_confirmation(transaction_type, category, amount, account, note)
+    return ctx.done(FlexMessageService.create_confirmation(transaction_type, category, amount, account, note))
 
-def handle_custom_category(user_id, category_name, state):
+@flows.step('transaction', 'custom_category')
+def handle_custom_category(ctx):
     """處理用戶輸入的自定義類別"""
-    transaction_type = state.get('type')
-    is_expense = transaction_type == 'expense'
+    category_name = ctx.text
+    is_expense = ctx.state.get('type') == 'expense'
     
     # 簡化：只記錄操作，不真正寫入資料庫
-    logger.info(f"用戶 {user_id} 創建自定義類別: {category_name}, 類型: {'支出' if is_expense else '收入'}")
-    
-    # 清除用戶狀態
-    if user_id in user_states:
-        del user_states[user_id]
+    logger.info(f"用戶 {ctx.user_id} 創建自定義類別: {category_name}, 類型: {'支出' if is_expense else '收入'}")
+    if is_expense:
+        # 之後的快速支出可依此類別名稱排序類別（保存在與 linebot-ai 訊息分析共用的關鍵字檔案）
+        FinanceService.add_custom_category_keyword(ctx.user_id, category_name)
     
     # 向用戶返回提示訊息
-    return f"已添加類別: {category_name}，請輸入金額"
+    return ctx.done(f"已添加類別: {category_name}，請輸入金額")
 
-def handle_new_account(user_id, account_name, state):
+@flows.step('account', 'new_account')
+def handle_new_account(ctx):
     """處理用戶輸入的新帳戶名稱"""
+    account_name = ctx.text
     # 簡化：只記錄操作，不真正寫入資料庫
-    logger.info(f"用戶 {user_id} 創建新帳戶: {account_name}")
+    logger.info(f"用戶 {ctx.user_id} 創建新帳戶: {account_name}")
     
     # 檢查狀態類型
-    if state.get('type') == 'transfer':
+    if ctx.state.get('type') == 'transfer':
         # 如果是轉帳，返回文字提示
-        if user_id in user_states:
-            del user_states[user_id]
-        return f"已創建新帳戶: {account_name}，請選擇轉帳來源和目標帳戶"
-    else:
-        # 繼續交易流程
-        transaction_type = state.get('type')
-        category = state.get('category')
-        amount = state.get('amount')
-        
-        # 清除用戶狀態
-        if user_id in user_states:
-            del user_states[user_id]
-        
-        # 向用戶返回提示訊息
-        return f"已創建新帳戶: {account_name}"
+        return ctx.done(f"已創建新帳戶: {account_name}，請選擇轉帳來源和目標帳戶")
+    
+    # 向用戶返回提示訊息
+    return ctx.done(f"已創建新帳戶: {account_name}")
+
+def show_transaction_detail(user_id, transaction_id):
+    """返回交易詳情頁面"""
+    transaction_detail, error = FinanceService.get_transaction_detail(user_id, transaction_id)
+    if error:
+        return error
+    return FlexMessageService.create_transaction_detail(transaction_detail)
+
+@flows.step('edit_transaction', 'edit_amount')
+def handle_edit_amount(ctx):
+    """用戶正在編輯交易金額"""
+    try:
+        new_amount = float(ctx.text)
+    except ValueError:
+        return ctx.retry("請輸入有效的數字金額，例如: 100 或 1,234.56")
+    
+    # 更新交易記錄
+    transaction_id = ctx.state.get('transaction_id')
+    FinanceService.update_transaction(
+        user_id=ctx.user_id,
+        transaction_id=transaction_id,
+        amount=new_amount
+    )
+    return ctx.done(show_transaction_detail(ctx.user_id, transaction_id))
+
+@flows.step('edit_transaction', 'edit_note')
+def handle_edit_note(ctx):
+    """用戶正在編輯交易備註"""
+    transaction_id = ctx.state.get('transaction_id')
+    FinanceService.update_transaction(
+        user_id=ctx.user_id,
+        transaction_id=transaction_id,
+        note=ctx.text
+    )
+    return ctx.done(show_transaction_detail(ctx.user_id, transaction_id))
+
+# 任務詳情的兩種格式：「任務:xxx 提醒:xxx」和「@xxx !xxx」
+TASK_NAME_PATTERN = re.compile(r'(任務[:：]|@)(.+?)(?:\s+(提醒[:：]|!)|$)')
+TASK_REMINDER_PATTERN = re.compile(r'(提醒[:：]|!)(.+)')
+
+@flows.step('task', 'task_details')
+def handle_task_details(ctx):
+    """用戶正在輸入任務詳情，解析任務內容和提醒時間後建立提醒"""
+    task_info = {}
+    try:
+        # 支持兩種格式：「任務:xxx 提醒:xxx」和「@xxx !xxx」
+        task_match = TASK_NAME_PATTERN.search(ctx.text)
+        reminder_match = TASK_REMINDER_PATTERN.search(ctx.text)
+
+        if task_match:
+            task_info['name'] = task_match.group(2).strip()
+        else:
+            task_info['name'] = ctx.text.strip()
+
+        if reminder_match:
+            task_info['reminder_time'] = reminder_match.group(2).strip()
+        else:
+            task_info['reminder_time'] = '明天早上9點'
+
+        logger.info(f"解析任務: {task_info['name']}, 提醒時間: {task_info['reminder_time']}")
+
+        # 解析提醒時間，未指定日期時為明天
+        time_text = task_info['reminder_time']
+        reminder_time = resolve_time(time_text)
+        logger.info(f"設置提醒時間: {reminder_time.strftime('%Y-%m-%d %H:%M')}, 原始時間文本: {time_text}")
+
+        # 創建提醒
+        from models import db, Reminder
+
+        # 創建新任務
+        new_reminder = Reminder(
+            user_id=ctx.user_id,
+            content=task_info['name'],
+            reminder_time=reminder_time,
+            repeat_type='none',
+            is_completed=False
+        )
+
+        db.session.add(new_reminder)
+        db.session.commit()
+
+        # 構建任務摘要
+        task_summary = f"✅ 已創建新任務\n\n📌 {task_info['name']}\n⏰ {reminder_time.strftime('%Y-%m-%d %H:%M')}"
+
+        return ctx.done(task_summary)
+
+    except Exception as e:
+        logger.error(f"處理任務詳情時出錯: {str(e)}")
+        return ctx.retry("處理任務時出錯，請使用格式：「@買牛奶 !明天早上9點」或「任務:買牛奶 提醒:明天早上9點」")
 
 def handle_help_command(user_id):
     """處理幫助命令，返回使用說明"""
@@ -708,6 +518,7 @@ def get_help_text():
         "記錄支出：早餐50 或 午餐120 麥當勞",
         "記錄收入：收入5000 或 薪資+33000",
         "快速支出：早餐-50 (自動帶入類別選擇)",
+        "多筆記帳：每行一筆，例如 早餐50 換行 午餐120",
         "查詢記錄：今天 或 本週 或 本月",
         "查看統計：月報 或 月報2023-5",
         "記錄修改：輸入「記錄」查看並修改交易",
@@ -891,89 +702,106 @@ def handle_message(event):
     try:
         user_id = event.source.user_id
         message_text = event.message.text
-        logger.info(f"收到訊息: '{message_text}' 從用戶: {user_id}")
+        path = get_reply_path(event)
         
         # 測試命令
         if message_text.lower() == "kimi test":
             # 測試 LINE API 連接
-            bot_info = line_bot_api.get_bot_info()
+            bot_info = get_profile_cache().get_bot_info(line_bot_api)
             response = f"API 連接正常!\nBot名稱: {bot_info.display_name}\n"
             response += f"TOKEN前10字元: {os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', '')[:10]}...\n"
             response += f"SECRET前10字元: {os.environ.get('LINE_CHANNEL_SECRET', '')[:10]}..."
             
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=response))
+            ReplyDeadline.reply(line_bot_api, event, TextSendMessage(text=response), path)
             return
         
         # 其他訊息處理
         response = process_message(event)
         
         if isinstance(response, FlexSendMessage):
-            line_bot_api.reply_message(event.reply_token, response)
+            ReplyDeadline.reply(line_bot_api, event, response, path)
         elif response:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=response))
+            ReplyDeadline.reply(line_bot_api, event, TextSendMessage(text=response), path)
         else:
             # 默認回應
-            line_bot_api.reply_message(
-                event.reply_token, 
-                TextSendMessage(text="我不太理解您的意思。您可以輸入「kimi」查看主選單，或「help」查看幫助。")
+            ReplyDeadline.reply(
+                line_bot_api,
+                event,
+                TextSendMessage(text="我不太理解您的意思。您可以輸入「kimi」查看主選單，或「help」查看幫助。"),
+                path
             )
     
     except Exception as e:
         logger.error(f"處理訊息時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
+        LogService.dump_recent_bodies('處理訊息時發生錯誤')
         try:
-            line_bot_api.reply_message(
-                event.reply_token, 
-                TextSendMessage(text=f"處理您的請求時發生錯誤，請稍後再試。")
+            ReplyDeadline.reply(
+                line_bot_api,
+                event,
+                TextSendMessage(text=f"處理您的請求時發生錯誤，請稍後再試。"),
+                'message:error'
             )
         except Exception as reply_error:
             logger.error(f"發送錯誤訊息失敗: {str(reply_error)}")
 
+def get_postback_path(event):
+    """取得 Postback 的處理路徑（回覆期限統計用）"""
+    params = urllib.parse.parse_qs(event.postback.data)
+    return closed_path('postback', params.get('action', [''])[0], POSTBACK_ACTIONS)
+
+def process_postback(event):
+    """處理收到的 Postback，返回回應內容"""
+    user_id = event.source.user_id
+    data = event.postback.data
+    logger.info(f"收到 Postback: {data} 從用戶: {user_id}")
+    
+    # 解析 postback 數據
+    params = {}
+    for param in data.split('&'):
+        if '=' in param:
+            key, value = param.split('=', 1)
+            params[key] = value
+    
+    action = params.get('action', '')
+    
+    # 根據 action 處理不同的 postback
+    if action == 'record':
+        record_type = params.get('type', 'expense')
+        if record_type == 'expense':
+            return "請輸入支出金額和分類，例如：「100 午餐」"
+        return "請輸入收入金額和分類，例如：「1000 薪資」"
+    elif action == 'view_transactions':
+        period = params.get('period', 'today')
+        return FinanceService.get_transactions(user_id, period)
+    elif action == 'task_menu':
+        return TaskService.show_task_menu(user_id)
+    
+    return f"未知的操作: {action}"
+
 @handler.add(PostbackEvent)
 def handle_postback(event):
     """處理 LINE 平台的 Postback 事件"""
     try:
-        user_id = event.source.user_id
-        data = event.postback.data
-        logger.info(f"收到 Postback: {data} 從用戶: {user_id}")
-        
-        # 解析 postback 數據
-        params = {}
-        for param in data.split('&'):
-            if '=' in param:
-                key, value = param.split('=', 1)
-                params[key] = value
-        
-        action = params.get('action', '')
-        
-        # 根據 action 處理不同的 postback
-        if action == 'record':
-            record_type = params.get('type', 'expense')
-            if record_type == 'expense':
-                response = "請輸入支出金額和分類，例如：「100 午餐」"
-            else:
-                response = "請輸入收入金額和分類，例如：「1000 薪資」"
-        elif action == 'view_transactions':
-            period = params.get('period', 'today')
-            response = FinanceService.get_transactions(user_id, period)
-        elif action == 'task_menu':
-            response = TaskService.show_task_menu(user_id)
-        else:
-            response = f"未知的操作: {action}"
+        response = process_postback(event)
+        path = get_postback_path(event)
         
         # 發送回應
         if isinstance(response, FlexSendMessage):
-            line_bot_api.reply_message(event.reply_token, response)
+            ReplyDeadline.reply(line_bot_api, event, response, path)
         else:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=response))
+            ReplyDeadline.reply(line_bot_api, event, TextSendMessage(text=response), path)
     
     except Exception as e:
         logger.error(f"處理 Postback 時發生錯誤: {str(e)}")
         logger.error(traceback.format_exc())
+        LogService.dump_recent_bodies('處理 Postback 時發生錯誤')
         try:
-            line_bot_api.reply_message(
-                event.reply_token, 
-                TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。")
+            ReplyDeadline.reply(
+                line_bot_api,
+                event,
+                TextSendMessage(text="處理您的請求時發生錯誤，請稍後再試。"),
+                'postback:error'
             )
         except Exception as reply_error:
             logger.error(f"發送錯誤訊息失敗: {str(reply_error)}")
@@ -981,6 +809,7 @@ def handle_postback(event):
 def create_app(test_config=None):
     """創建 Flask 應用"""
     app = Flask(__name__, instance_relative_config=True)
+    register_ops_routes(app)
     
     @app.route("/", methods=["GET"])
     def home():
@@ -992,10 +821,10 @@ def create_app(test_config=None):
         """LINE 的 Webhook 接收端點"""
         signature = request.headers.get("X-Line-Signature", "")
         body = request.get_data(as_text=True)
-        logger.info("收到 Webhook 請求：%s", body)
+        LogService.record_body(body)
         
         try:
-            handler.handle(body, signature)
+            WebhookService.handle_webhook(handler, body, signature, app=app)
         except InvalidSignatureError:
             logger.error("無效的簽名")
             abort(400)
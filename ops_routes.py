@@ -0,0 +1,89 @@
+"""
+運維路由模塊 - 提供負載與健康狀態接口
+"""
+import logging
+from flask import Blueprint, jsonify
+
+from services.webhook_service import WebhookService
+from services.line_client import LineClient
+from services.push_delivery import PushDelivery
+from services.profile_cache import get_profile_cache
+from services.outbound_sender import get_outbound_sender
+from services.line_circuit import get_line_circuit
+from services.reply_deadline import ReplyDeadline
+from services.state_store import get_state_store
+from services.flow_engine import get_flow_stats
+from services.keyword_router import get_route_stats
+from services.time_parser import get_parse_cache_stats
+from services.finance_service import category_classifier
+
+logger = logging.getLogger(__name__)
+
+# 創建藍圖
+ops = Blueprint('ops', __name__)
+
+@ops.route('/health', methods=['GET'])
+def health():
+    """存活檢查，進程能處理請求即返回 200（平台的健康檢查使用此接口，負載高時不會被移出分流）"""
+    return jsonify({'status': 'ok'})
+
+@ops.route('/health/saturation', methods=['GET'])
+def saturation():
+    """負載狀態，已達上限時返回 503，供監控或有多個實例的負載平衡器暫停分流；同樣的數據也在 /metrics 的 admission"""
+    stats = WebhookService.get_admission().stats()
+    status_code = 503 if stats['status'] == 'saturated' else 200
+    return jsonify(stats), status_code
+
+@ops.route('/health/line-client', methods=['GET'])
+def line_client():
+    """LINE API 連線池的連線重用統計"""
+    return jsonify(LineClient.stats())
+
+@ops.route('/health/push-delivery', methods=['GET'])
+def push_delivery():
+    """批次推送統計"""
+    return jsonify(PushDelivery.stats())
+
+@ops.route('/health/profile-cache', methods=['GET'])
+def profile_cache():
+    """用戶資料快取命中統計"""
+    return jsonify(get_profile_cache().stats())
+
+@ops.route('/health/outbound', methods=['GET'])
+def outbound():
+    """LINE API 外發請求的限流與重試統計"""
+    return jsonify(get_outbound_sender().stats())
+
+@ops.route('/health/state-store', methods=['GET'])
+def state_store():
+    """對話狀態數量、記憶體用量與逾時、淘汰統計"""
+    return jsonify(get_state_store().stats())
+
+@ops.route('/health/flows', methods=['GET'])
+def flows():
+    """對話流程各步驟的處理耗時、停留時間與放棄率"""
+    return jsonify(get_flow_stats())
+
+@ops.route('/metrics', methods=['GET'])
+def metrics():
+    """運維指標總覽：LINE API 熔斷狀態與各端點延遲分佈、外發限流、推送、快取、對話狀態與流程、訊息路由、時間解析快取、類別關鍵字、負載"""
+    return jsonify({
+        'line_api': get_line_circuit().stats(),
+        'outbound': get_outbound_sender().stats(),
+        'line_client': LineClient.stats(),
+        'push_delivery': PushDelivery.stats(),
+        'reply_deadline': ReplyDeadline.stats(),
+        'profile_cache': get_profile_cache().stats(),
+        'state_store': get_state_store().stats(),
+        'flows': get_flow_stats(),
+        'routes': get_route_stats(),
+        'time_parser': get_parse_cache_stats(),
+        'category_keywords': category_classifier.stats(),
+        'admission': WebhookService.get_admission().stats(),
+        'affinity': WebhookService.affinity_stats()
+    })
+
+def register_ops_routes(app):
+    """註冊運維路由到 Flask 應用"""
+    app.register_blueprint(ops)
+    logger.info("運維路由已註冊")
@@ -0,0 +1,179 @@
+"""
+准入控制模組
+依處理中的事件數與佇列深度計算負載，過載時優先延後或丟棄低價值事件，
+保留記帳指令與 Postback
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 事件優先級
+PRIORITY_HIGH = 'high'      # Postback、文字訊息（記帳等寫入操作）
+PRIORITY_NORMAL = 'normal'  # 貼圖、圖片等非文字訊息
+PRIORITY_LOW = 'low'        # 追蹤/封鎖等記錄用事件、診斷指令
+
+# 准入結果
+ACCEPT = 'accept'
+DEFER = 'defer'
+DROP = 'drop'
+
+# 只做記錄、不影響用戶資料的事件類型
+LOW_VALUE_EVENT_TYPES = (
+    'follow', 'unfollow', 'join', 'leave', 'memberJoined', 'memberLeft',
+    'unsend', 'videoPlayComplete', 'beacon', 'things'
+)
+
+# 診斷用指令
+LOW_VALUE_TEXTS = ('kimi test',)
+
+
+def classify_event(event):
+    """判斷事件優先級
+
+    Args:
+        event: 事件的 JSON 字典
+
+    Returns:
+        str: PRIORITY_HIGH / PRIORITY_NORMAL / PRIORITY_LOW
+    """
+    event_type = event.get('type')
+    if event_type == 'postback':
+        return PRIORITY_HIGH
+    if event_type == 'message':
+        message = event.get('message') or {}
+        if message.get('type') != 'text':
+            return PRIORITY_NORMAL
+        if (message.get('text') or '').strip().lower() in LOW_VALUE_TEXTS:
+            return PRIORITY_LOW
+        return PRIORITY_HIGH
+    if event_type in LOW_VALUE_EVENT_TYPES:
+        return PRIORITY_LOW
+    return PRIORITY_NORMAL
+
+
+class AdmissionController:
+    """Webhook 事件准入控制器
+
+    負載 = max(處理中事件數 / 上限, 佇列深度 / 上限)。
+    負載達 defer_threshold 時延後低優先級事件；
+    負載達 1 時丟棄低優先級事件並延後一般事件，高優先級事件一律接受。
+    """
+
+    def __init__(self, max_in_flight=20, max_queue_depth=200, defer_threshold=0.8,
+                 queue_depth=None, depth_ttl=1.0):
+        """初始化
+
+        Args:
+            max_in_flight: 處理中事件數上限
+            max_queue_depth: 佇列深度上限
+            defer_threshold: 開始延後低優先級事件的負載
+            queue_depth: 返回目前佇列深度的函數，None 表示不計入佇列
+            depth_ttl: 佇列深度的快取時間（秒），避免每個請求都查詢佇列
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.defer_threshold = defer_threshold
+        self.queue_depth_fn = queue_depth
+        self.depth_ttl = depth_ttl
+        self.in_flight = 0
+        self.counts = {ACCEPT: 0, DEFER: 0, DROP: 0}
+        self._depth = 0
+        self._depth_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def queue_depth(self):
+        """目前佇列深度（快取 depth_ttl 秒）"""
+        if self.queue_depth_fn is None:
+            return 0
+        now = time.time()
+        if now - self._depth_checked_at >= self.depth_ttl:
+            try:
+                self._depth = self.queue_depth_fn()
+            except Exception as e:
+                logger.error(f"查詢佇列深度失敗: {str(e)}")
+            self._depth_checked_at = now
+        return self._depth
+
+    def saturation(self):
+        """目前負載，1 表示已達上限"""
+        return max(
+            self.in_flight / float(self.max_in_flight),
+            self.queue_depth() / float(self.max_queue_depth)
+        )
+
+    def admit(self, event):
+        """決定事件的處理方式
+
+        Args:
+            event: 事件的 JSON 字典
+
+        Returns:
+            str: ACCEPT / DEFER / DROP
+        """
+        priority = classify_event(event)
+        saturation = self.saturation()
+
+        decision = ACCEPT
+        if priority == PRIORITY_LOW:
+            if saturation >= 1:
+                decision = DROP
+            elif saturation >= self.defer_threshold:
+                decision = DEFER
+        elif priority == PRIORITY_NORMAL and saturation >= 1:
+            decision = DEFER
+
+        with self._lock:
+            self.counts[decision] += 1
+        if decision != ACCEPT:
+            logger.warning(f"負載 {saturation:.2f}，{decision} {priority} 事件: {event.get('type')}")
+        return decision
+
+    def partition(self, events):
+        """將一批事件分為立即處理與延後處理，丟棄的事件不返回
+
+        Returns:
+            tuple: (立即處理的事件列表, 延後處理的事件列表)
+        """
+        accepted, deferred = [], []
+        for event in events:
+            decision = self.admit(event)
+            if decision == ACCEPT:
+                accepted.append(event)
+            elif decision == DEFER:
+                deferred.append(event)
+        return accepted, deferred
+
+    @contextmanager
+    def track(self):
+        """標記一個事件處理中"""
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self):
+        """負載狀態"""
+        saturation = self.saturation()
+        if saturation >= 1:
+            status = 'saturated'
+        elif saturation >= self.defer_threshold:
+            status = 'busy'
+        else:
+            status = 'ok'
+        return {
+            'status': status,
+            'saturation': round(saturation, 4),
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queue_depth': self.queue_depth(),
+            'max_queue_depth': self.max_queue_depth,
+            'accepted': self.counts[ACCEPT],
+            'deferred': self.counts[DEFER],
+            'dropped': self.counts[DROP]
+        }
@@ -0,0 +1,305 @@
+"""
+用戶親和路由模組
+收到 Webhook 的工作進程驗證並解析事件後，依用戶 ID 的一致性雜湊把事件轉給固定的工作進程處理，
+讓同一用戶的事件總是落在同一個進程：進程內的快取與對話狀態保持有效，用戶事件也依序處理。
+工作進程之間以本機 Unix socket 傳遞事件。
+"""
+import os
+import json
+import glob
+import time
+import socket
+import atexit
+import bisect
+import hashlib
+import logging
+import threading
+
+from services.event_queue import get_event_user_id
+
+logger = logging.getLogger(__name__)
+
+SOCKET_PREFIX = 'worker-'
+SOCKET_SUFFIX = '.sock'
+
+
+def ring_hash(value):
+    """一致性雜湊使用的 32 位元雜湊值"""
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:8], 16)
+
+
+class HashRing:
+    """一致性雜湊環，成員增減時只有少部分用戶改變歸屬"""
+
+    def __init__(self, nodes=(), replicas=100):
+        """初始化
+
+        Args:
+            nodes: 成員列表
+            replicas: 每個成員在環上的虛擬節點數
+        """
+        self.replicas = replicas
+        self.nodes = sorted(nodes)
+        points = []
+        for node in self.nodes:
+            for index in range(replicas):
+                points.append((ring_hash(f"{node}#{index}"), node))
+        points.sort()
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        """取得鍵所屬的成員，環為空時返回 None"""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(key or '')) % len(self._hashes)
+        return self._owners[index]
+
+
+def socket_pid(path):
+    """從 socket 檔名取得工作進程 ID"""
+    name = os.path.basename(path)
+    try:
+        return int(name[len(SOCKET_PREFIX):-len(SOCKET_SUFFIX)])
+    except ValueError:
+        return None
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DeliveryUnconfirmed(Exception):
+    """訊息已送到對方工作進程，但未收到處理確認"""
+
+
+class PeerConnection:
+    """到另一個工作進程的持久連線"""
+
+    def __init__(self, path, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        """發送一則訊息並等待對方確認
+
+        只有在訊息送出前失敗（連線失敗或沿用的連線已失效）時重新連線一次；
+        訊息送出後對方可能已經開始處理，等待確認失敗時不再重送。
+
+        Raises:
+            OSError: 連線或傳送失敗，對方未收到訊息
+            DeliveryUnconfirmed: 訊息已送出但未收到確認
+        """
+        data = (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(data)
+                    break
+                except OSError:
+                    # 送出一半的訊息沒有換行結尾，對方解析失敗會直接丟棄，重送不會重複處理
+                    self.close()
+                    if attempt:
+                        raise
+            try:
+                ack = self._file.readline()
+            except OSError as e:
+                self.close()
+                raise DeliveryUnconfirmed(str(e))
+            if ack.strip() != b'ok':
+                self.close()
+                raise DeliveryUnconfirmed('對方工作進程未確認收到事件')
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._sock = sock
+        self._file = sock.makefile('rb')
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+
+class AffinityRouter:
+    """依用戶將事件轉給固定工作進程的路由器
+
+    每個工作進程在 socket_dir 建立 worker-<pid>.sock 接收其他進程轉來的事件，
+    目錄中存活的 socket 即為雜湊環的成員：目錄有變動（進程建立或移除 socket）時立即重新掃描，
+    另外定期掃描以移除異常結束的進程。
+    對方未收到事件時改在本進程處理，避免事件遺失；事件已送出但未收到確認時不再處理，避免重複處理。
+    """
+
+    def __init__(self, socket_dir, handle_events, refresh_interval=5, replicas=100):
+        """初始化
+
+        Args:
+            socket_dir: 放置各工作進程 socket 的本機目錄
+            handle_events: 處理本進程負責事件的函數，參數為 (events, destination)，不應阻塞
+            refresh_interval: 重新掃描成員的間隔（秒）
+            replicas: 每個工作進程在環上的虛擬節點數
+        """
+        self.socket_dir = socket_dir
+        self.handle_events = handle_events
+        self.refresh_interval = refresh_interval
+        self.replicas = replicas
+        self.path = os.path.join(socket_dir, f"{SOCKET_PREFIX}{os.getpid()}{SOCKET_SUFFIX}")
+        self.counts = {'local': 0, 'forwarded': 0, 'received': 0, 'fallback': 0, 'unconfirmed': 0}
+        self._ring = HashRing((), replicas)
+        self._refreshed_at = 0.0
+        self._dir_mtime = None
+        self._peers = {}
+        self._server = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """建立本進程的 socket 並開始接收轉送的事件"""
+        os.makedirs(self.socket_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen(64)
+        self._server = server
+        threading.Thread(target=self._accept_loop, name='affinity-accept', daemon=True).start()
+        atexit.register(self.stop)
+        self.refresh(force=True)
+        logger.info(f"用戶親和路由已啟動: {self.path}，目前 {len(self._ring.nodes)} 個工作進程")
+
+    def stop(self):
+        """關閉 socket 並移除檔案，其他進程下次掃描時將本進程移出雜湊環"""
+        if self._server is not None:
+            try:
+                self._server.close()
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self._server = None
+        for peer in list(self._peers.values()):
+            peer.close()
+
+    def refresh(self, force=False):
+        """重新掃描存活的工作進程，移除已結束進程留下的 socket 檔案"""
+        now = time.monotonic()
+        try:
+            dir_mtime = os.stat(self.socket_dir).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        if not force and dir_mtime == self._dir_mtime and now - self._refreshed_at < self.refresh_interval:
+            return
+        members = []
+        for path in glob.glob(os.path.join(self.socket_dir, f"{SOCKET_PREFIX}*{SOCKET_SUFFIX}")):
+            pid = socket_pid(path)
+            if pid is None:
+                continue
+            if is_process_alive(pid):
+                members.append(path)
+            else:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+        with self._lock:
+            self._refreshed_at = now
+            self._dir_mtime = dir_mtime
+            if sorted(members) != self._ring.nodes:
+                self._ring = HashRing(members, self.replicas)
+                for path in list(self._peers):
+                    if path not in members:
+                        self._peers.pop(path).close()
+                logger.info(f"用戶親和路由成員更新，共 {len(members)} 個工作進程")
+
+    def owner_of(self, user_id):
+        """取得負責用戶的工作進程 socket 路徑"""
+        self.refresh()
+        return self._ring.node_for(user_id) or self.path
+
+    def route(self, events, destination=None):
+        """將事件依用戶轉給負責的工作進程
+
+        Args:
+            events: 事件 JSON 字典列表
+            destination: Webhook 的 destination 欄位
+        """
+        groups = {}
+        for event in events:
+            groups.setdefault(self.owner_of(get_event_user_id(event)), []).append(event)
+
+        for owner, owned in groups.items():
+            if owner == self.path:
+                self._count('local', len(owned))
+                self.handle_events(owned, destination)
+                continue
+            try:
+                self._peer(owner).send({'destination': destination, 'events': owned})
+                self._count('forwarded', len(owned))
+            except DeliveryUnconfirmed as e:
+                # 對方可能已在處理，改在本進程處理會讓事件被處理兩次
+                logger.warning(f"已轉送事件到 {owner} 但未收到確認，不再重送: {str(e)}")
+                self._count('unconfirmed', len(owned))
+                self.refresh(force=True)
+            except OSError as e:
+                logger.warning(f"轉送事件到 {owner} 失敗，改在本進程處理: {str(e)}")
+                self._count('fallback', len(owned))
+                self.refresh(force=True)
+                self.handle_events(owned, destination)
+
+    def _peer(self, path):
+        with self._lock:
+            peer = self._peers.get(path)
+            if peer is None:
+                peer = PeerConnection(path)
+                self._peers[path] = peer
+            return peer
+
+    def _count(self, name, amount):
+        with self._lock:
+            self.counts[name] += amount
+
+    def _accept_loop(self):
+        while self._server is not None:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), name='affinity-peer', daemon=True).start()
+
+    def _serve(self, conn):
+        """處理一個來自其他工作進程的連線：每行一批事件，交給本進程處理後回覆確認"""
+        with conn, conn.makefile('rb') as reader:
+            for line in reader:
+                try:
+                    message = json.loads(line)
+                    events = message.get('events') or []
+                    self._count('received', len(events))
+                    self.handle_events(events, message.get('destination'))
+                    conn.sendall(b'ok\n')
+                except (ValueError, OSError) as e:
+                    logger.error(f"接收轉送事件失敗: {str(e)}")
+                    return
+
+    def stats(self):
+        """路由統計與目前的成員數"""
+        with self._lock:
+            stats = dict(self.counts)
+        stats['workers'] = len(self._ring.nodes)
+        stats['socket'] = self.path
+        return stats
@@ -0,0 +1,197 @@
+"""
+命令解析模組
+以預先編譯的單一語法一次比對訊息，判斷是否為記帳命令（快速支出、支出、收入、查詢、月報），
+並返回命令物件，取代逐一嘗試多個正則表達式的解析方式
+"""
+import re
+from collections import namedtuple
+
+# 類別名稱：中文或英文字母
+CATEGORY = r'[\u4e00-\u9fa5a-zA-Z]+'
+
+# 記帳命令語法，依序為：
+#   類別[-+]金額 備註   例如：早餐-50、午餐120 麥當勞、薪資+33000
+#     「-」且沒有備註為快速支出，「+」為收入，其餘為支出
+#     （「收入5000」會被解析為類別「收入」的支出，與原本的解析結果相同）
+#   查詢               今天、昨天、本週、本月
+#   月報               月報、月報2023-5
+FINANCE_GRAMMAR = (
+    rf'(?P<category>{CATEGORY})(?P<sign>[-+]?)(?P<amount>\d+)(?:\s+(?P<note>.+))?$'
+    r'|(?P<period>今天|昨天|本週|本月)$'
+    r'|月報(?:(?P<year>\d{4})-(?P<month>\d{1,2}))?$'
+)
+
+# 訊息層級的快速支出：任意關鍵字-金額（金額可含逗號），例如：早餐-500、星巴克－1,200
+QUICK_EXPENSE_GRAMMAR = r'(?P<keyword>.+?)[-－](?P<quick_amount>[0-9,]+)$'
+
+FINANCE_PATTERN = re.compile(FINANCE_GRAMMAR)
+QUICK_EXPENSE_PATTERN = re.compile(QUICK_EXPENSE_GRAMMAR)
+MESSAGE_PATTERN = re.compile(f'{QUICK_EXPENSE_GRAMMAR}|{FINANCE_GRAMMAR}')
+AMOUNT_NOTE_PATTERN = re.compile(r'([^\d]+)(\d[\d,.]+)$')
+
+PERIODS = {
+    '今天': 'today',
+    '昨天': 'yesterday',
+    '本週': 'week',
+    '本月': 'month'
+}
+
+# 各類命令轉為字典時包含的欄位（與原本 parse_transaction_command 的返回格式相同）
+COMMAND_FIELDS = {
+    'quick_expense': ('category', 'amount'),
+    'expense': ('category', 'amount', 'note'),
+    'income': ('category', 'amount', 'note'),
+    'query': ('period',),
+    'monthly': ('year', 'month')
+}
+
+
+class Command(namedtuple('Command', ['type', 'category', 'amount', 'note', 'period', 'year', 'month'],
+                         defaults=(None, None, None, None, None, None))):
+    """解析後的命令"""
+
+    __slots__ = ()
+
+    def as_dict(self):
+        """轉為字典格式"""
+        command = {'type': self.type}
+        for field in COMMAND_FIELDS[self.type]:
+            command[field] = getattr(self, field)
+        return command
+
+
+def _finance_command(match):
+    """由記帳語法的比對結果建立命令"""
+    groups = match.groupdict()
+    if groups['category'] is not None:
+        amount = int(groups['amount'])
+        note = groups['note']
+        if groups['sign'] == '+':
+            return Command('income', category=groups['category'], amount=amount, note=note)
+        if groups['sign'] == '-' and note is None:
+            return Command('quick_expense', category=groups['category'], amount=amount)
+        return Command('expense', category=groups['category'], amount=amount, note=note)
+    if groups['period'] is not None:
+        return Command('query', period=PERIODS[groups['period']])
+    year = int(groups['year']) if groups['year'] else None
+    month = int(groups['month']) if groups['month'] else None
+    return Command('monthly', year=year, month=month)
+
+
+def parse_finance_command(text):
+    """解析記帳命令
+
+    Args:
+        text: 用戶輸入的文字
+
+    Returns:
+        Command: 解析結果，不是記帳命令時返回 None
+    """
+    match = FINANCE_PATTERN.match(text)
+    return _finance_command(match) if match else None
+
+
+def _quick_expense_command(match):
+    """由快速支出語法的比對結果建立命令，金額無效時返回 None"""
+    try:
+        amount = float(match.group('quick_amount').replace(',', ''))
+    except ValueError:
+        return None
+    keyword = match.group('keyword').strip()
+    return Command('quick_expense', category=keyword, amount=amount, note=keyword)
+
+
+def parse_quick_expense(text):
+    """解析快速支出（關鍵字-金額），例如「早餐-500」
+
+    Returns:
+        Command: 以關鍵字作為類別與備註的快速支出，不符合時返回 None
+    """
+    match = QUICK_EXPENSE_PATTERN.match(text)
+    return _quick_expense_command(match) if match else None
+
+
+def parse_message_command(text):
+    """一次比對解析用戶訊息
+
+    快速支出（關鍵字-金額）優先，其次為記帳命令；快速支出以關鍵字作為類別與備註。
+
+    Args:
+        text: 用戶輸入的文字
+
+    Returns:
+        Command: 解析結果，不是任何命令時返回 None
+    """
+    match = MESSAGE_PATTERN.match(text)
+    if not match:
+        return None
+    if match.group('keyword') is None:
+        return _finance_command(match)
+    # 金額只有逗號時不是快速支出，改以記帳語法解析
+    return _quick_expense_command(match) or parse_finance_command(text)
+
+
+def parse_amount_input(text):
+    """解析金額輸入，文字開頭的部分作為備註（例如「早餐500」）
+
+    Returns:
+        tuple: (金額, 備註或 None)
+
+    Raises:
+        ValueError: 不是有效的金額
+    """
+    match = AMOUNT_NOTE_PATTERN.match(text)
+    if match:
+        return float(match.group(2).replace(',', '')), match.group(1).strip()
+    return float(text), None  # 使用 float 而不是 int 來支持小數金額
+
+
+# 批次記帳：一則訊息最多的筆數，以及可以批次記錄的命令類型
+MAX_BATCH_ENTRIES = 50
+BATCH_TYPES = ('expense', 'income', 'quick_expense')
+
+
+def parse_batch(text):
+    """解析一則訊息中的多筆記帳，每行一筆，例如「早餐50\\n午餐120\\n咖啡65」
+
+    每一行都必須是支出、收入或快速支出，只要有一行無法解析就不視為批次記帳；
+    快速支出（關鍵字-金額）在批次中直接記為支出，關鍵字作為類別與備註。
+
+    Args:
+        text: 用戶輸入的文字
+
+    Returns:
+        list: Command 列表（至少兩筆），不是批次記帳時返回 None
+    """
+    lines = [line.strip() for line in (text or '').splitlines()]
+    lines = [line for line in lines if line]
+    if not 2 <= len(lines) <= MAX_BATCH_ENTRIES:
+        return None
+
+    commands = []
+    for line in lines:
+        command = parse_message_command(line)
+        if not command or command.type not in BATCH_TYPES:
+            return None
+        if command.type == 'quick_expense':
+            command = command._replace(type='expense')
+        commands.append(command)
+    return commands
+
+
+def parse_message_commands(text):
+    """解析用戶訊息中的記帳命令，多行訊息先嘗試批次記帳
+
+    單一命令的備註可以跨行（「早餐50\\n午餐120」會被解析為備註「午餐120」的一筆支出），
+    因此多筆記帳必須在單一命令之前解析。
+
+    Args:
+        text: 用戶輸入的文字
+
+    Returns:
+        tuple: (Command 或 None, 批次記帳的 Command 列表或 None)，最多只有一個不是 None
+    """
+    batch = parse_batch(text)
+    if batch:
+        return None, batch
+    return parse_message_command(text), None
@@ -0,0 +1,169 @@
+"""
+事件去重模組
+依 webhookEventId 略過 LINE 重送的事件，避免重複記帳與重複呼叫 LINE API
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class EventDeduplicator:
+    """Webhook 事件去重器
+
+    先查詢本進程的 LRU+TTL 快取，未命中時再查詢（可選的）SQLite 檔案，
+    讓同一台機器上的多個 gunicorn 工作進程共用已處理的事件 ID。
+    """
+
+    def __init__(self, max_size=10000, ttl=3600, db_path=None):
+        """初始化
+
+        Args:
+            max_size: 本進程快取的最大事件數
+            ttl: 事件 ID 保留時間（秒）
+            db_path: SQLite 檔案路徑，None 表示只使用本進程快取
+        """
+        self.ttl = ttl
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = self._connect()
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS seen_events ('
+                    ' event_id TEXT PRIMARY KEY,'
+                    ' seen_at REAL NOT NULL)'
+                )
+            finally:
+                conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def is_duplicate(self, event_id):
+        """檢查事件是否已處理過，未處理過則記錄下來
+
+        記錄在處理前寫入，處理期間 LINE 重送的同一事件也會被略過；
+        處理或排入佇列失敗時需呼叫 forget 或 release 取消記錄。
+
+        Args:
+            event_id: webhookEventId
+
+        Returns:
+            bool: 是否為重複事件
+        """
+        if not event_id:
+            return False
+
+        duplicate = not self._cache.add(event_id)
+        if not duplicate and self.db_path:
+            duplicate = self._check_shared(event_id)
+
+        with self._lock:
+            if duplicate:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return duplicate
+
+    def forget(self, event_id):
+        """取消事件的已處理記錄，處理失敗時呼叫，讓 LINE 重送的事件可以重新處理
+
+        Args:
+            event_id: webhookEventId
+        """
+        if not event_id:
+            return
+        self._cache.delete(event_id)
+        if self.db_path:
+            conn = self._connect()
+            try:
+                conn.execute('DELETE FROM seen_events WHERE event_id = ?', (event_id,))
+            except sqlite3.Error as e:
+                logger.error(f"刪除共用去重記錄失敗: {str(e)}")
+            finally:
+                conn.close()
+
+    def release(self, events):
+        """取消多個事件的已處理記錄
+
+        Args:
+            events: 事件 JSON 字典列表
+        """
+        for event in events:
+            self.forget(event.get('webhookEventId'))
+
+    def _check_shared(self, event_id):
+        """查詢並記錄到共用的 SQLite 檔案"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO seen_events (event_id, seen_at) VALUES (?, ?)',
+                (event_id, now)
+            )
+            if cursor.rowcount == 1:
+                self._purge_expired(conn, now)
+                return False
+
+            # 已存在但已過期的記錄視為新事件
+            cursor = conn.execute(
+                'UPDATE seen_events SET seen_at = ? WHERE event_id = ? AND seen_at < ?',
+                (now, event_id, now - self.ttl)
+            )
+            return cursor.rowcount == 0
+        except sqlite3.Error as e:
+            logger.error(f"查詢共用去重記錄失敗: {str(e)}")
+            return False
+        finally:
+            conn.close()
+
+    def _purge_expired(self, conn, now):
+        """每寫入一定數量後清除過期記錄"""
+        with self._lock:
+            self._writes += 1
+            if self._writes % 500:
+                return
+        conn.execute('DELETE FROM seen_events WHERE seen_at < ?', (now - self.ttl,))
+
+    def filter_events(self, events):
+        """過濾掉重複事件
+
+        Args:
+            events: 事件 JSON 字典列表
+
+        Returns:
+            list: 未處理過的事件
+        """
+        fresh = []
+        for event in events:
+            if self.is_duplicate(event.get('webhookEventId')):
+                redelivery = (event.get('deliveryContext') or {}).get('isRedelivery')
+                logger.info(f"略過重複事件: {event.get('webhookEventId')} (重送: {redelivery})")
+            else:
+                fresh.append(event)
+        return fresh
+
+    def stats(self):
+        """命中統計"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'cached': len(self._cache)
+        }
@@ -0,0 +1,89 @@
+"""
+事件分派模組
+依用戶將同一批 Webhook 事件分派到多條處理通道，
+同一用戶的事件依序處理，不同用戶的事件並行處理
+"""
+import zlib
+import queue
+import logging
+import threading
+from concurrent.futures import Future, wait as wait_futures
+
+from services.event_queue import get_event_user_id
+
+logger = logging.getLogger(__name__)
+
+
+class UserOrderedDispatcher:
+    """依用戶分片的事件分派器
+
+    每條通道由單一執行緒依序處理，事件以用戶 ID 的雜湊值決定通道，
+    因此同一用戶的事件保持順序（user_states 流程依賴此順序）。
+    """
+
+    def __init__(self, lanes=4, name='dispatch'):
+        """初始化
+
+        Args:
+            lanes: 處理通道數
+            name: 執行緒名稱前綴
+        """
+        self.lanes = lanes
+        self._queues = []
+        for index in range(lanes):
+            lane_queue = queue.Queue()
+            thread = threading.Thread(
+                target=self._run,
+                args=(lane_queue,),
+                name=f"{name}-lane-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._queues.append(lane_queue)
+
+    def lane_for(self, key):
+        """計算用戶對應的通道"""
+        return zlib.crc32((key or '').encode('utf-8')) % self.lanes
+
+    def submit(self, key, func, *args):
+        """將工作放入用戶對應的通道
+
+        Args:
+            key: 分片鍵（通常為用戶 ID）
+            func: 處理函數
+            args: 處理函數參數
+
+        Returns:
+            Future: 工作結果
+        """
+        future = Future()
+        self._queues[self.lane_for(key)].put((future, func, args))
+        return future
+
+    def dispatch(self, events, func, wait=True):
+        """分派一批事件
+
+        Args:
+            events: 事件 JSON 字典列表
+            func: 處理單一事件的函數
+            wait: 是否等待全部事件處理完成
+
+        Returns:
+            list: 每個事件的 Future
+        """
+        futures = [self.submit(get_event_user_id(event), func, event) for event in events]
+        if wait:
+            wait_futures(futures)
+        return futures
+
+    @staticmethod
+    def _run(lane_queue):
+        while True:
+            future, func, args = lane_queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                logger.error(f"分派通道執行工作失敗: {str(e)}", exc_info=True)
+                future.set_exception(e)
@@ -0,0 +1,306 @@
+"""
+Webhook 事件佇列模組
+將已驗證的 LINE 事件寫入本地 SQLite 佇列，由背景工作執行緒處理
+"""
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import sqlite3
+import logging
+import threading
+
+from services.reply_deadline import deadline_for
+
+logger = logging.getLogger(__name__)
+
+# 預設佇列檔案位置（與資料庫同放在 data 目錄）
+DEFAULT_QUEUE_PATH = os.path.join('data', 'webhook_queue.db')
+
+
+def get_event_user_id(event):
+    """取得事件來源的用戶 ID，群組或聊天室事件缺少用戶時改用群組 ID"""
+    source = event.get('source') or {}
+    return source.get('userId') or source.get('groupId') or source.get('roomId') or ''
+
+
+def sign_body(handler, body):
+    """使用 handler 的 Channel Secret 為請求內容產生簽名"""
+    channel_secret = handler.parser.signature_validator.channel_secret
+    digest = hmac.new(channel_secret, body.encode('utf-8'), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+
+def dispatch_event(handler, event, destination=None):
+    """將單一事件交給 WebhookHandler 已註冊的處理函數
+
+    Args:
+        handler: WebhookHandler 實例
+        event: 事件的 JSON 字典
+        destination: Webhook 的 destination 欄位
+    """
+    body = json.dumps({'destination': destination, 'events': [event]}, ensure_ascii=False)
+    handler.handle(body, sign_body(handler, body))
+
+
+class QueuedEvent:
+    """從佇列取出的事件"""
+
+    def __init__(self, id, event, destination, received_at, attempts):
+        self.id = id
+        self.event = event
+        self.destination = destination
+        self.received_at = received_at
+        self.attempts = attempts
+
+
+class SQLiteEventQueue:
+    """以 SQLite 檔案儲存的持久化事件佇列
+
+    多個 gunicorn 工作進程可共用同一個檔案，取出事件時以租約標記，
+    處理中的進程當機後事件會在租約到期後重新被取出。
+    同一用戶只會取出最早一筆未完成的事件，因此用戶事件依序處理。
+    被延後（尚未處理過且未到可取出時間）的事件不會阻擋同一用戶之後的事件。
+    不同用戶之間優先取出 reply token 即將到期的事件，已過期（只能改用 push）
+    與沒有 reply token 的事件排在後面。
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=60, max_attempts=3, retry_delay=5,
+                 deadline_margin=5):
+        """初始化
+
+        Args:
+            path: SQLite 檔案路徑
+            lease_seconds: 事件被取出後的租約時間（秒）
+            max_attempts: 最大處理次數，超過後標記為失敗
+            retry_delay: 處理失敗後重新排入的延遲（秒）
+            deadline_margin: 剩餘時間低於此值（秒）的 reply token 視為已過期
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.deadline_margin = deadline_margin
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS webhook_events ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' user_id TEXT,'
+                ' destination TEXT,'
+                ' event TEXT NOT NULL,'
+                ' status TEXT NOT NULL DEFAULT \'pending\','
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' received_at REAL NOT NULL,'
+                ' available_at REAL NOT NULL,'
+                ' lease_until REAL,'
+                ' deadline REAL)'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(webhook_events)')]
+            if 'deadline' not in columns:
+                conn.execute('ALTER TABLE webhook_events ADD COLUMN deadline REAL')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_webhook_events_status '
+                'ON webhook_events (status, available_at)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_webhook_events_user '
+                'ON webhook_events (user_id, id)'
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def put(self, events, destination=None, received_at=None, delay=0):
+        """將事件寫入佇列
+
+        Args:
+            events: 事件 JSON 字典列表
+            destination: Webhook 的 destination 欄位
+            received_at: 收到請求的時間戳記，預設為現在
+            delay: 延後多少秒才可被取出
+
+        Returns:
+            int: 寫入的事件數
+        """
+        now = received_at or time.time()
+        rows = [
+            (get_event_user_id(event), destination, json.dumps(event, ensure_ascii=False),
+             now, now + delay, deadline_for(event, now))
+            for event in events
+        ]
+        if not rows:
+            return 0
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO webhook_events '
+                '(user_id, destination, event, received_at, available_at, deadline) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        return len(rows)
+
+    def claim(self):
+        """取出下一個待處理事件並加上租約
+
+        Returns:
+            QueuedEvent 或 None（佇列為空）
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, event, destination, received_at, attempts FROM webhook_events e '
+                'WHERE ((status = \'pending\' AND available_at <= ?) '
+                'OR (status = \'processing\' AND lease_until < ?)) '
+                'AND NOT EXISTS (SELECT 1 FROM webhook_events p WHERE p.user_id = e.user_id '
+                'AND p.id < e.id AND p.status IN (\'pending\', \'processing\') '
+                'AND NOT (p.attempts = 0 AND p.available_at > ?)) '
+                'ORDER BY CASE WHEN deadline IS NULL THEN 2 WHEN deadline > ? THEN 0 ELSE 1 END, '
+                'deadline, id LIMIT 1',
+                (now, now, now, now + self.deadline_margin)
+            ).fetchone()
+
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+
+            conn.execute(
+                'UPDATE webhook_events SET status = \'processing\', lease_until = ?, '
+                'attempts = attempts + 1 WHERE id = ?',
+                (now + self.lease_seconds, row[0])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        return QueuedEvent(row[0], json.loads(row[1]), row[2], row[3], row[4] + 1)
+
+    def ack(self, event_id):
+        """事件處理完成，從佇列移除"""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM webhook_events WHERE id = ?', (event_id,))
+        finally:
+            conn.close()
+
+    def nack(self, queued_event):
+        """事件處理失敗，重新排入或標記為失敗"""
+        conn = self._connect()
+        try:
+            if queued_event.attempts >= self.max_attempts:
+                conn.execute(
+                    'UPDATE webhook_events SET status = \'failed\', lease_until = NULL WHERE id = ?',
+                    (queued_event.id,)
+                )
+                logger.error(f"事件 {queued_event.id} 已達最大處理次數，標記為失敗")
+            else:
+                conn.execute(
+                    'UPDATE webhook_events SET status = \'pending\', lease_until = NULL, '
+                    'available_at = ? WHERE id = ?',
+                    (time.time() + self.retry_delay * queued_event.attempts, queued_event.id)
+                )
+        finally:
+            conn.close()
+
+    def qsize(self):
+        """待處理與處理中的事件數"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT COUNT(*) FROM webhook_events WHERE status IN (\'pending\', \'processing\')'
+            ).fetchone()
+            return row[0]
+        finally:
+            conn.close()
+
+
+class EventWorkerPool:
+    """從事件佇列取出事件並交給處理函數的背景執行緒池"""
+
+    def __init__(self, queue, dispatch, workers=4, poll_interval=0.5):
+        """初始化
+
+        Args:
+            queue: SQLiteEventQueue 實例
+            dispatch: 處理函數，接收 QueuedEvent
+            workers: 工作執行緒數
+            poll_interval: 佇列為空時的輪詢間隔（秒）
+        """
+        self.queue = queue
+        self.dispatch = dispatch
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """啟動工作執行緒"""
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run,
+                name=f"webhook-worker-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Webhook 事件工作執行緒已啟動，數量: {self.workers}")
+
+    def stop(self, timeout=5):
+        """停止工作執行緒"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """通知工作執行緒有新事件"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                queued_event = self.queue.claim()
+            except Exception as e:
+                logger.error(f"從事件佇列取出事件失敗: {str(e)}")
+                queued_event = None
+
+            if queued_event is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self.dispatch(queued_event)
+                self.queue.ack(queued_event.id)
+            except Exception as e:
+                logger.error(f"處理佇列事件 {queued_event.id} 失敗: {str(e)}", exc_info=True)
+                self.queue.nack(queued_event)
@@ -3,9 +3,11 @@
 處理記帳相關功能
 """
 from datetime import datetime, timedelta
-import re
 import logging
 from models import db, Transaction, Category, Account
+from services.command_parser import parse_finance_command, parse_quick_expense
+from services.time_parser import period_start, PERIOD_LABELS
+from services.keyword_automaton import KeywordClassifier, get_user_keyword_store
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +31,25 @@ DEFAULT_INCOME_CATEGORIES = [
     {"name": "其他收入", "icon": "💴"}
 ]
 
+# 支出類別的關鍵字（類別名稱本身也是關鍵字），快速支出時用來把最可能的類別排在前面
+EXPENSE_CATEGORY_KEYWORDS = {
+    "餐飲": ["餐", "飯", "吃", "麵", "咖啡", "飲料", "茶", "便當", "宵夜"],
+    "交通": ["車", "捷運", "公車", "計程車", "高鐵", "火車", "uber", "加油", "停車"],
+    "購物": ["買", "衣", "鞋", "包", "超市", "全聯", "3c", "家電"],
+    "娛樂": ["電影", "遊戲", "唱歌", "ktv", "旅遊"],
+    "住房": ["房租", "水費", "電費", "瓦斯", "管理費"],
+    "醫療": ["醫", "藥", "診所", "牙"],
+    "教育": ["書", "課", "學費", "補習"]
+}
+
+# 支出類別分類器（用戶新增自訂類別時只重建該用戶的部分；自訂類別保存在與 linebot-ai 共用的檔案）
+category_classifier = KeywordClassifier(
+    ((keyword, ('category', name), None)
+     for name, keywords in EXPENSE_CATEGORY_KEYWORDS.items()
+     for keyword in [name] + keywords),
+    store=get_user_keyword_store()
+)
+
 class FinanceService:
     @staticmethod
     def initialize_user(user_id):
@@ -100,24 +121,8 @@ class FinanceService:
             if not default_account:
                 FinanceService.initialize_user(user_id)
             
-            # 查找分類
-            category = Category.query.filter_by(user_id=user_id, name=category_name, is_expense=is_expense).first()
-            
-            # 如果找不到指定分類，使用默認分類
-            if not category:
-                default_category_name = "其他" if is_expense else "其他收入"
-                category = Category.query.filter_by(user_id=user_id, name=default_category_name, is_expense=is_expense).first()
-                
-                if not category:
-                    # 如果連默認分類都沒有，創建一個
-                    icon = "📝" if is_expense else "💴"
-                    category = Category(
-                        user_id=user_id,
-                        name=default_category_name,
-                        icon=icon,
-                        is_expense=is_expense
-                    )
-                    db.session.add(category)
+            # 查找分類（與批次記帳相同：同名分類、關鍵字最符合的分類、默認分類）
+            category = FinanceService.resolve_category(user_id, category_name, is_expense)
             
             # 查找賬戶
             account = Account.query.filter_by(user_id=user_id, name=account_name).first()
@@ -129,14 +134,9 @@ class FinanceService:
             utc_now = datetime.utcnow()
             
             # 記錄 note 的處理過程，確保它被正確儲存
-            if note == "無" or note == "无":
-                note = None  # 如果用戶輸入「無」，則將備註設為空
-                
+            note = FinanceService._transaction_note(category_name, category, note)
             if note:
                 logger.info(f"處理備註文字: '{note}', 長度: {len(note)}")
-                if len(note) > 200:  # 如果備註太長，截取前200個字符
-                    note = note[:200]
-                    logger.info(f"備註過長，已截斷至: '{note}'")
                     
             # 創建交易記錄
             transaction = Transaction(
@@ -173,33 +173,138 @@ class FinanceService:
             db.session.rollback()
             return f"記錄失敗，請稍後再試。錯誤: {str(e)}"
 
+    @staticmethod
+    def add_transactions_batch(user_id, commands, account_name="默認"):
+        """一次添加多筆交易記錄（例如「早餐50\\n午餐120\\n咖啡65」）
+
+        類別與賬戶各查詢一次，所有交易在同一個 session 中寫入，
+        每個賬戶只更新一次餘額，最後只提交一次；任何一筆失敗時全部回滾。
+
+        Args:
+            user_id: LINE 用戶 ID
+            commands: command_parser.parse_batch 解析出的支出、收入命令
+            account_name: 記錄的賬戶名稱
+
+        Returns:
+            str: 彙總的確認訊息
+        """
+        try:
+            # 確保用戶已初始化
+            accounts = {account.name: account for account in Account.query.filter_by(user_id=user_id).all()}
+            if "默認" not in accounts:
+                FinanceService.initialize_user(user_id)
+                accounts = {account.name: account for account in Account.query.filter_by(user_id=user_id).all()}
+            account = accounts.get(account_name) or accounts["默認"]
+
+            categories = {}
+            for category in Category.query.filter_by(user_id=user_id).all():
+                categories.setdefault((category.name, category.is_expense), category)
+
+            utc_now = datetime.utcnow()
+            balance_change = 0
+            lines = []
+            for command in commands:
+                is_expense = command.type != 'income'
+                category = FinanceService.resolve_category(user_id, command.category, is_expense, categories)
+                note = FinanceService._transaction_note(command.category, category, command.note)
+
+                db.session.add(Transaction(
+                    user_id=user_id,
+                    amount=command.amount,
+                    category=category,
+                    account=account,
+                    transaction_date=utc_now,
+                    note=note,
+                    is_expense=is_expense
+                ))
+                balance_change += -command.amount if is_expense else command.amount
+
+                transaction_type = "支出" if is_expense else "收入"
+                line = f"{category.icon} {category.name} ${command.amount}（{transaction_type}）"
+                if note:
+                    line += f"，備註：{note}"
+                lines.append(line)
+
+            # 每個賬戶只更新一次餘額
+            account.balance += balance_change
+            db.session.commit()
+            logger.info(f"用戶 {user_id} 批次記錄 {len(commands)} 筆交易已提交到數據庫")
+
+            total_expense = sum(command.amount for command in commands if command.type != 'income')
+            total_income = sum(command.amount for command in commands if command.type == 'income')
+            message_parts = [f"已記錄 {len(commands)} 筆交易："]
+            message_parts.extend(lines)
+            message_parts.append("----------")
+            if total_expense:
+                message_parts.append(f"總支出：${total_expense}")
+            if total_income:
+                message_parts.append(f"總收入：${total_income}")
+            return "\n".join(message_parts)
+
+        except Exception as e:
+            logger.error(f"批次添加交易記錄失敗: {str(e)}")
+            db.session.rollback()
+            return f"記錄失敗，所有項目都未記錄，請稍後再試。錯誤: {str(e)}"
+
+    @staticmethod
+    def resolve_category(user_id, name, is_expense, categories=None):
+        """交易的類別：同名的分類，其次為關鍵字分數最高的支出分類，最後使用默認分類
+
+        單筆與批次記帳共用，同一行文字不論單獨送出或在多筆中送出都記到相同的類別。
+
+        Args:
+            categories: (名稱, 是否支出) -> Category，省略時查詢用戶的所有分類；新建的默認分類會加入其中
+        """
+        if categories is None:
+            categories = {}
+            for category in Category.query.filter_by(user_id=user_id).all():
+                categories.setdefault((category.name, category.is_expense), category)
+
+        category = categories.get((name, is_expense))
+        if category:
+            return category
+
+        if is_expense and name:
+            for category_name, _ in category_classifier.classify(name, user_id).get('category', []):
+                category = categories.get((category_name, True))
+                if category:
+                    return category
+
+        default_category_name = "其他" if is_expense else "其他收入"
+        category = categories.get((default_category_name, is_expense))
+        if not category:
+            # 如果連默認分類都沒有，創建一個
+            category = Category(
+                user_id=user_id,
+                name=default_category_name,
+                icon="📝" if is_expense else "💴",
+                is_expense=is_expense
+            )
+            db.session.add(category)
+            categories[(default_category_name, is_expense)] = category
+        return category
+
+    @staticmethod
+    def _transaction_note(name, category, note):
+        """交易備註：「無」表示沒有備註；類別名稱不是用戶的分類時（例如「早餐」記到「餐飲」），
+        保留原本的文字作為備註；最多 200 個字"""
+        if note == "無" or note == "无":
+            note = None
+        if not note and name and name != category.name:
+            note = name
+        if note and len(note) > 200:
+            note = note[:200]
+        return note
+
     @staticmethod
     def get_transactions(user_id, period="today"):
         """獲取用戶的交易記錄"""
         try:
-            # 設置時間範圍，使用 UTC 時間
-            utc_now = datetime.utcnow()
-            # 轉換為台灣時間進行顯示，但查詢條件仍使用 UTC
-            taiwan_now = utc_now + timedelta(hours=8)
-            
-            if period == "today":
-                # 創建台灣時間當天的0點，然後轉換回 UTC 時間
-                start_date = datetime(taiwan_now.year, taiwan_now.month, taiwan_now.day) - timedelta(hours=8)
-                period_text = "今天"
-            elif period == "yesterday":
-                yesterday = taiwan_now - timedelta(days=1)
-                start_date = datetime(yesterday.year, yesterday.month, yesterday.day) - timedelta(hours=8)
-                period_text = "昨天"
-            elif period == "week":
-                # 獲取本週一的日期 (台灣時間)
-                monday = taiwan_now - timedelta(days=taiwan_now.weekday())
-                start_date = datetime(monday.year, monday.month, monday.day) - timedelta(hours=8)
-                period_text = "本週"
-            elif period == "month":
-                start_date = datetime(taiwan_now.year, taiwan_now.month, 1) - timedelta(hours=8)
-                period_text = "本月"
-            else:
+            # 以台灣時間計算範圍起點，查詢條件使用 UTC 時間
+            start_date = period_start(period)
+            if start_date is None:
                 return "無效的時間範圍，請使用：今天、昨天、本週、本月"
+            period_text = PERIOD_LABELS[period]
             
             # 查詢交易記錄
             transactions = Transaction.query.filter(
@@ -330,116 +435,8 @@ class FinanceService:
     @staticmethod
     def parse_transaction_command(text):
         """解析用戶輸入的命令"""
-        # 支出格式：類別-金額+備註(可選) 或 類別+金額+備註(可選)
-        # 例如：早餐-50 或 午餐120 麥當勞
-        expense_pattern1 = r'^([\u4e00-\u9fa5a-zA-Z]+)-(\d+)(?:\s+(.+))?$'
-        expense_pattern2 = r'^([\u4e00-\u9fa5a-zA-Z]+)(\d+)(?:\s+(.+))?$'
-        
-        expense_match1 = re.match(expense_pattern1, text)
-        expense_match2 = re.match(expense_pattern2, text)
-        
-        # 收入格式：類別+金額 或 收入+金額+備註(可選)
-        # 例如：薪資+33000 或 收入5000 薪資
-        income_pattern1 = r'^([\u4e00-\u9fa5a-zA-Z]+)\+(\d+)(?:\s+(.+))?$'
-        income_pattern2 = r'^收入(\d+)(?:\s+(.+))?$'
-        
-        income_match1 = re.match(income_pattern1, text)
-        income_match2 = re.match(income_pattern2, text)
-        
-        # 查詢格式：今天 或 昨天 或 本週 或 本月
-        query_pattern = r'^(今天|昨天|本週|本月)$'
-        query_match = re.match(query_pattern, text)
-        
-        # 月報格式：月報 或 月報+年份-月份
-        # 例如：月報 或 月報2023-5
-        monthly_pattern = r'^月報(?:(\d{4})-(\d{1,2}))?$'
-        monthly_match = re.match(monthly_pattern, text)
-        
-        # 快速支出格式：類別-金額
-        # 例如：早餐-500
-        quick_expense_pattern = r'^([\u4e00-\u9fa5a-zA-Z]+)-(\d+)$'
-        quick_expense_match = re.match(quick_expense_pattern, text)
-        
-        if quick_expense_match:
-            category = quick_expense_match.group(1)
-            amount = int(quick_expense_match.group(2))
-            
-            return {
-                'type': 'quick_expense',
-                'category': category,
-                'amount': amount
-            }
-        
-        if expense_match1:
-            category = expense_match1.group(1)
-            amount = int(expense_match1.group(2))
-            note = expense_match1.group(3)
-            
-            return {
-                'type': 'expense',
-                'category': category,
-                'amount': amount,
-                'note': note
-            }
-        
-        elif expense_match2:
-            category = expense_match2.group(1)
-            amount = int(expense_match2.group(2))
-            note = expense_match2.group(3)
-            
-            return {
-                'type': 'expense',
-                'category': category,
-                'amount': amount,
-                'note': note
-            }
-        
-        elif income_match1:
-            category = income_match1.group(1)
-            amount = int(income_match1.group(2))
-            note = income_match1.group(3)
-            
-            return {
-                'type': 'income',
-                'category': category,
-                'amount': amount,
-                'note': note
-            }
-        
-        elif income_match2:
-            amount = int(income_match2.group(1))
-            note = income_match2.group(2)
-            
-            return {
-                'type': 'income',
-                'amount': amount,
-                'note': note
-            }
-        
-        elif query_match:
-            period_mapping = {
-                '今天': 'today',
-                '昨天': 'yesterday',
-                '本週': 'week',
-                '本月': 'month'
-            }
-            
-            return {
-                'type': 'query',
-                'period': period_mapping[query_match.group(1)]
-            }
-        
-        elif monthly_match:
-            year = int(monthly_match.group(1)) if monthly_match.group(1) else None
-            month = int(monthly_match.group(2)) if monthly_match.group(2) else None
-            
-            return {
-                'type': 'monthly',
-                'year': year,
-                'month': month
-            }
-        
-        return None
+        command = parse_finance_command(text)
+        return command.as_dict() if command else None
 
     @staticmethod
     def prepare_quick_expense(user_id, amount, category_keyword, note=None):
@@ -465,6 +462,9 @@ class FinanceService:
                     )
                     categories.append(category)
             
+            # 依關鍵字把最可能的類別排在前面
+            categories = FinanceService.rank_categories(user_id, category_keyword, categories)
+            
             # 準備跳轉到 Flex 訊息服務
             from services.flex_message_service import FlexMessageService
             return FlexMessageService.create_category_selection_for_quick_expense(
@@ -479,55 +479,76 @@ class FinanceService:
             logger.error(f"準備快速支出失敗: {str(e)}")
             return f"處理快速支出請求時出錯。錯誤: {str(e)}"
 
+    @staticmethod
+    def rank_categories(user_id, keyword, categories):
+        """依關鍵字與類別的符合分數排序類別，分數相同時保持原順序"""
+        scores = dict(category_classifier.classify(keyword, user_id).get('category', []))
+        if not scores:
+            return categories
+        return sorted(categories, key=lambda category: -scores.get(category.name, 0))
+
+    @staticmethod
+    def add_custom_category_keyword(user_id, category_name):
+        """用戶新增自訂支出類別後，將類別名稱加入該用戶的關鍵字"""
+        category_classifier.add_user_category(user_id, category_name)
+
     @staticmethod
     def process_finance_command(text, user_id):
         """處理財務相關命令"""
-        command = FinanceService.parse_transaction_command(text)
-        
+        return FinanceService.execute_command(parse_finance_command(text), user_id)
+
+    @staticmethod
+    def execute_command(command, user_id):
+        """執行已解析的財務命令
+
+        Args:
+            command: command_parser 解析出的 Command，None 表示不是財務命令
+            user_id: LINE 用戶 ID
+        """
         if not command:
             return None
             
-        if command['type'] == 'quick_expense':
+        if command.type == 'quick_expense':
             return FinanceService.prepare_quick_expense(
                 user_id=user_id,
-                amount=command['amount'],
-                category_keyword=command['category'],
-                note=command.get('note')
+                amount=command.amount,
+                category_keyword=command.category,
+                note=command.note
             )
         
-        if command['type'] == 'expense':
+        if command.type == 'expense':
             return FinanceService.add_transaction(
                 user_id=user_id,
-                amount=command['amount'],
-                category_name=command['category'],
-                note=command['note'],
+                amount=command.amount,
+                category_name=command.category,
+                note=command.note,
                 is_expense=True
             )
         
-        elif command['type'] == 'income':
-            category_name = command.get('category', '其他收入')  # 如果沒有指定類別，使用"其他收入"
+        elif command.type == 'income':
+            category_name = command.category or '其他收入'  # 如果沒有指定類別，使用"其他收入"
             return FinanceService.add_transaction(
                 user_id=user_id,
-                amount=command['amount'],
+                amount=command.amount,
                 category_name=category_name,
-                note=command['note'],
+                note=command.note,
                 is_expense=False
             )
         
-        elif command['type'] == 'query':
-            return FinanceService.get_transactions(user_id, command['period'])
+        elif command.type == 'query':
+            return FinanceService.get_transactions(user_id, command.period)
         
-        elif command['type'] == 'monthly':
+        elif command.type == 'monthly':
             from message_handler import create_monthly_report_flex
-            report_data = FinanceService.get_monthly_summary(user_id, command['year'], command['month'])
+            report_data = FinanceService.get_monthly_summary(user_id, command.year, command.month)
             
             if isinstance(report_data, str):  # 處理錯誤訊息
                 return report_data
             
             # 獲取年月
             now = datetime.utcnow()
-            year = command['year'] or now.year
-            month = command['month'] or now.month
+            year = command.year or now.year
+            month = command.month or now.month
             
             # 創建 Flex 訊息
             return create_monthly_report_flex(report_data, year, month)
@@ -537,51 +558,24 @@ class FinanceService:
     @staticmethod
     def parse_quick_expense_command(text):
         """解析快速支出命令，例如 '早餐-500'"""
-        pattern = r'^(.+?)[\\-－]([0-9,]+)$'
-        match = re.match(pattern, text)
-        
-        if match:
-            category_keyword = match.group(1).strip()
-            amount_str = match.group(2).replace(',', '')
-            try:
-                amount = float(amount_str)
-                return {
-                    'category_keyword': category_keyword,
-                    'amount': amount,
-                    'note': category_keyword  # 保存類別關鍵字作為備註
-                }
-            except ValueError:
-                return None
-        
+        command = parse_quick_expense(text)
+        if command:
+            return {
+                'category_keyword': command.category,
+                'amount': command.amount,
+                'note': command.note  # 保存類別關鍵字作為備註
+            }
         return None
 
     @staticmethod
     def get_editable_transactions(user_id, period="today"):
         """獲取用戶可編輯的交易記錄，以列表形式呈現"""
         try:
-            # 設置時間範圍，使用 UTC 時間
-            utc_now = datetime.utcnow()
-            # 轉換為台灣時間進行顯示，但查詢條件仍使用 UTC
-            taiwan_now = utc_now + timedelta(hours=8)
-            
-            if period == "today":
-                # 創建台灣時間當天的0點，然後轉換回 UTC 時間
-                start_date = datetime(taiwan_now.year, taiwan_now.month, taiwan_now.day) - timedelta(hours=8)
-                period_text = "今天"
-            elif period == "yesterday":
-                yesterday = taiwan_now - timedelta(days=1)
-                start_date = datetime(yesterday.year, yesterday.month, yesterday.day) - timedelta(hours=8)
-                period_text = "昨天"
-            elif period == "week":
-                # 獲取本週一的日期 (台灣時間)
-                monday = taiwan_now - timedelta(days=taiwan_now.weekday())
-                start_date = datetime(monday.year, monday.month, monday.day) - timedelta(hours=8)
-                period_text = "本週"
-            elif period == "month":
-                start_date = datetime(taiwan_now.year, taiwan_now.month, 1) - timedelta(hours=8)
-                period_text = "本月"
-            else:
+            # 以台灣時間計算範圍起點，查詢條件使用 UTC 時間
+            start_date = period_start(period)
+            if start_date is None:
                 return None, "無效的時間範圍，請使用：今天、昨天、本週、本月"
+            period_text = PERIOD_LABELS[period]
             
             # 查詢交易記錄
             transactions = Transaction.query.filter(
@@ -0,0 +1,212 @@
+"""
+對話流程引擎
+多步驟對話（輸入金額、備註、修改交易、新增任務等）以 (流程, 步驟) 註冊處理函數，
+依用戶狀態的 waiting_for 直接查表分派；處理函數返回下一步，由引擎更新或清除狀態，
+並記錄每個步驟的處理耗時、用戶停留時間與放棄（逾時）次數
+"""
+import time
+import logging
+import threading
+
+from services.line_circuit import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# 狀態中記錄進入目前步驟時間的欄位
+STEP_AT_KEY = '_step_at'
+
+DONE = 'done'
+NEXT = 'next'
+RETRY = 'retry'
+HOLD = 'hold'
+
+# 本進程建立的流程引擎（運維統計用）
+_engines = []
+
+
+class Transition:
+    """步驟處理結果：回應內容與狀態的變化"""
+
+    def __init__(self, action, response, state=None, step=None):
+        self.action = action
+        self.response = response
+        self.state = state
+        self.step = step
+
+
+class FlowContext:
+    """傳給步驟處理函數的上下文"""
+
+    def __init__(self, user_id, text, state):
+        self.user_id = user_id
+        self.text = text
+        self.state = state
+
+    def done(self, response):
+        """流程完成，清除狀態"""
+        return Transition(DONE, response)
+
+    def next(self, step, response, **data):
+        """進入同一流程的下一個步驟，data 併入狀態"""
+        state = dict(self.state)
+        state.update(data)
+        return Transition(NEXT, response, state, step)
+
+    def retry(self, response):
+        """輸入無效，停留在目前步驟等待重新輸入"""
+        return Transition(RETRY, response)
+
+    def hold(self, response, **data):
+        """離開文字輸入步驟，但保留資料給後續操作（例如選擇帳戶的 Postback）使用"""
+        return Transition(HOLD, response, data)
+
+
+class FlowStep:
+    """已註冊的步驟"""
+
+    def __init__(self, flow, step, handler, ttl=None):
+        self.flow = flow
+        self.step = step
+        self.handler = handler
+        self.ttl = ttl
+        self.latency = LatencyHistogram()
+        self.counts = {'entered': 0, 'handled': 0, 'completed': 0, 'retried': 0, 'errors': 0, 'abandoned': 0}
+        self.dwell_total = 0.0
+        self.dwell_max = 0.0
+        self.dwell_count = 0
+
+
+class FlowEngine:
+    """對話流程引擎"""
+
+    def __init__(self, store):
+        """初始化
+
+        Args:
+            store: StateStore 實例，狀態逾時或被淘汰時通知引擎記錄放棄次數
+        """
+        self.store = store
+        self._steps = {}
+        self._flows_by_step = {}
+        self._lock = threading.Lock()
+        store.on_expire = self._on_expire
+        _engines.append(self)
+
+    def step(self, flow, step, ttl=None):
+        """註冊步驟處理函數的裝飾器
+
+        Args:
+            flow: 流程名稱
+            step: 步驟名稱（狀態中的 waiting_for）
+            ttl: 停留在此步驟的閒置存活時間（秒），預設使用狀態儲存的設定
+
+        處理函數接收 FlowContext，返回 ctx.done()、ctx.next()、ctx.retry() 或 ctx.hold() 的結果。
+        """
+        def decorator(handler):
+            self._steps[(flow, step)] = FlowStep(flow, step, handler, ttl)
+            self._flows_by_step.setdefault(step, flow)
+            return handler
+        return decorator
+
+    def find(self, state):
+        """取得狀態對應的步驟，沒有進行中的步驟時返回 None"""
+        if not state or not state.get('waiting_for'):
+            return None
+        step = state['waiting_for']
+        flow = state.get('flow') or self._flows_by_step.get(step)
+        return self._steps.get((flow, step))
+
+    def start(self, user_id, flow, step, **data):
+        """讓用戶進入流程的指定步驟"""
+        flow_step = self._steps[(flow, step)]
+        state = dict(data, flow=flow, waiting_for=step)
+        self._enter(user_id, flow_step, state)
+
+    def handle(self, user_id, text, state=None):
+        """將用戶輸入交給目前步驟處理
+
+        Args:
+            user_id: LINE 用戶 ID
+            text: 用戶輸入的文字
+            state: 已讀取的用戶狀態，None 時從狀態儲存讀取
+
+        Returns:
+            回應內容；用戶不在任何已註冊的步驟中時返回 None
+        """
+        if state is None:
+            state = self.store.get(user_id)
+        flow_step = self.find(state)
+        if flow_step is None:
+            return None
+
+        step_at = state.get(STEP_AT_KEY)
+        start = time.monotonic()
+        try:
+            transition = flow_step.handler(FlowContext(user_id, text, state))
+        except Exception:
+            self._count(flow_step, 'errors')
+            raise
+        finally:
+            flow_step.latency.observe(time.monotonic() - start)
+        self._count(flow_step, 'handled')
+
+        if transition.action == RETRY:
+            self._count(flow_step, 'retried')
+            return transition.response
+
+        self._count(flow_step, 'completed')
+        if step_at:
+            self._record_dwell(flow_step, time.time() - step_at)
+
+        if transition.action == NEXT:
+            self._enter(user_id, self._steps[(flow_step.flow, transition.step)], transition.state)
+        elif transition.action == HOLD:
+            self.store.set(user_id, transition.state)
+        else:
+            self.store.delete(user_id)
+        return transition.response
+
+    def _enter(self, user_id, flow_step, state):
+        state = dict(state, flow=flow_step.flow, waiting_for=flow_step.step)
+        state[STEP_AT_KEY] = time.time()
+        self.store.set(user_id, state, ttl=flow_step.ttl)
+        self._count(flow_step, 'entered')
+
+    def _on_expire(self, key, state, reason):
+        """狀態逾時或被淘汰時記錄所在步驟的放棄次數"""
+        flow_step = self.find(state)
+        if flow_step is not None:
+            self._count(flow_step, 'abandoned')
+
+    def _count(self, flow_step, name):
+        with self._lock:
+            flow_step.counts[name] += 1
+
+    def _record_dwell(self, flow_step, seconds):
+        with self._lock:
+            flow_step.dwell_total += seconds
+            flow_step.dwell_max = max(flow_step.dwell_max, seconds)
+            flow_step.dwell_count += 1
+
+    def stats(self):
+        """各步驟的處理耗時、用戶停留時間與放棄率，依放棄次數排序"""
+        stats = {}
+        for (flow, step), flow_step in self._steps.items():
+            with self._lock:
+                item = dict(flow_step.counts)
+                dwell_count = flow_step.dwell_count
+                item['dwell_avg'] = round(flow_step.dwell_total / dwell_count, 2) if dwell_count else 0.0
+                item['dwell_max'] = round(flow_step.dwell_max, 2)
+            finished = item['completed'] + item['abandoned']
+            item['abandon_rate'] = round(item['abandoned'] / finished, 4) if finished else 0.0
+            item['latency'] = flow_step.latency.snapshot()
+            stats[f"{flow}:{step}"] = item
+        return dict(sorted(stats.items(), key=lambda entry: entry[1]['abandoned'], reverse=True))
+
+
+def get_flow_stats():
+    """本進程所有流程引擎的步驟統計"""
+    stats = {}
+    for engine in _engines:
+        stats.update(engine.stats())
+    return stats
@@ -0,0 +1,347 @@
+"""
+關鍵字自動機模組
+以 Aho-Corasick 自動機一次掃描訊息找出所有關鍵字，依權重累計各標籤（意圖、類別）的分數，
+取代對每個關鍵字逐一執行 `word in text` 的比對；
+用戶自訂的類別放在各自的小型自動機中，新增時只重建該用戶的部分；
+自訂關鍵字保存在共用的 SQLite 檔案，重新啟動、其他工作進程與 linebot-ai 應用都能讀到
+"""
+import os
+import sqlite3
+import logging
+import threading
+from collections import deque, OrderedDict
+
+from services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 預設自訂關鍵字檔案位置（與資料庫同放在 data 目錄）
+DEFAULT_USER_KEYWORDS_PATH = os.path.join('data', 'user_keywords.db')
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多關鍵字比對自動機（不區分大小寫）"""
+
+    def __init__(self, entries=()):
+        """建立自動機
+
+        Args:
+            entries: (關鍵字, 標籤, 權重) 的列表，權重為 None 時使用關鍵字長度（越長越明確）
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self.size = 0
+        for keyword, label, weight in entries:
+            self._insert(keyword, label, weight)
+        self._link()
+
+    def _insert(self, keyword, label, weight):
+        keyword = keyword.lower()
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((keyword, label, len(keyword) if weight is None else weight))
+        self.size += 1
+
+    def _link(self):
+        """以廣度優先建立失敗連結，並把失敗節點的輸出併入（比對時不需再沿失敗連結收集）"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text):
+        """一次掃描找出所有關鍵字（包含重疊的）
+
+        Returns:
+            list: (結束位置, 關鍵字, 標籤, 權重) 的列表
+        """
+        matches = []
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        node = 0
+        for index, char in enumerate((text or '').lower()):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword, label, weight in output[node]:
+                matches.append((index, keyword, label, weight))
+        return matches
+
+    def scores(self, text, into=None):
+        """各標籤的分數（符合的關鍵字權重總和）
+
+        Args:
+            text: 訊息文字
+            into: 累加到既有的分數字典
+
+        Returns:
+            dict: 標籤 -> 分數
+        """
+        scores = {} if into is None else into
+        for _, _, label, weight in self.find_all(text):
+            scores[label] = scores.get(label, 0) + weight
+        return scores
+
+
+class UserKeywordStore:
+    """用戶自訂關鍵字的 SQLite 儲存
+
+    多個工作進程與應用（記帳的 message_handler、linebot-ai）可共用同一個檔案；
+    第一次讀寫時才建立檔案與資料表。
+    """
+
+    def __init__(self, path=DEFAULT_USER_KEYWORDS_PATH):
+        """初始化
+
+        Args:
+            path: SQLite 檔案路徑
+        """
+        self.path = path
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+                    try:
+                        conn.execute('PRAGMA journal_mode=WAL')
+                        conn.execute(
+                            'CREATE TABLE IF NOT EXISTS user_keywords ('
+                            ' user_id TEXT NOT NULL,'
+                            ' keyword TEXT NOT NULL,'
+                            ' kind TEXT NOT NULL,'
+                            ' name TEXT NOT NULL,'
+                            ' weight REAL,'
+                            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                            ' UNIQUE (user_id, keyword, kind, name))'
+                        )
+                    finally:
+                        conn.close()
+                    self._ready = True
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def add(self, user_id, entries):
+        """保存用戶的關鍵字，已存在的關鍵字略過
+
+        Args:
+            user_id: LINE 用戶 ID
+            entries: (關鍵字, (種類, 名稱), 權重) 的列表
+        """
+        conn = self._connect()
+        try:
+            conn.executemany(
+                'INSERT OR IGNORE INTO user_keywords (user_id, keyword, kind, name, weight) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(user_id, keyword, kind, name, weight) for keyword, (kind, name), weight in entries]
+            )
+        finally:
+            conn.close()
+
+    def load(self, user_id):
+        """讀取用戶的關鍵字（依新增順序）
+
+        Returns:
+            list: (關鍵字, (種類, 名稱), 權重) 的列表
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT keyword, kind, name, weight FROM user_keywords WHERE user_id = ? ORDER BY id',
+                (user_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [(keyword, (kind, name), weight) for keyword, kind, name, weight in rows]
+
+
+class KeywordClassifier:
+    """共用關鍵字加上用戶自訂關鍵字的分類器
+
+    標籤為 (種類, 名稱)，例如 ('intent', 'accounting')、('category', 'food')。
+    共用的自動機建立一次；用戶自訂的關鍵字各自建立小型自動機，新增時只重建該用戶的部分。
+    有 store 時自訂關鍵字寫入共用檔案，每個用戶的關鍵字最多 reload_seconds 秒重新讀取一次，
+    其他工作進程新增的關鍵字在這段時間內生效。
+    本進程最多保留 max_users 個用戶的關鍵字與自動機，超過時淘汰最久未使用的用戶，下次使用時再從共用檔案讀取；
+    沒有 store 時被淘汰用戶的自訂關鍵字會遺失。
+    """
+
+    def __init__(self, entries=(), store=None, reload_seconds=30, max_users=10000):
+        """初始化
+
+        Args:
+            entries: 共用的 (關鍵字, 標籤, 權重) 列表
+            store: UserKeywordStore 實例，None 時自訂關鍵字只保存在本進程記憶體
+            reload_seconds: 重新讀取用戶自訂關鍵字的間隔（秒）
+            max_users: 本進程保留自訂關鍵字與自動機的用戶數上限
+        """
+        self._entries = list(entries)
+        self._base = KeywordAutomaton(self._entries)
+        self._order = self._label_order(self._entries)
+        # 用戶 ID -> (關鍵字列表, 自動機)，依最近使用排序；沒有自訂關鍵字的用戶自動機為 None
+        self._users = OrderedDict()
+        self.max_users = max_users
+        self.store = store
+        self._loaded = TTLCache(max_size=max_users, ttl=reload_seconds)
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def add_keywords(self, entries):
+        """新增共用關鍵字並重建共用的自動機"""
+        with self._lock:
+            self._entries.extend(entries)
+            self._base = KeywordAutomaton(self._entries)
+            self._order = self._label_order(self._entries)
+            self.rebuilds += 1
+
+    def add_user_keywords(self, user_id, entries):
+        """新增用戶自訂的關鍵字，只重建該用戶的自動機
+
+        Args:
+            user_id: LINE 用戶 ID
+            entries: (關鍵字, 標籤, 權重) 的列表
+        """
+        entries = list(entries)
+        if self.store is not None:
+            try:
+                self.store.add(user_id, entries)
+                # 一併載入其他工作進程新增的關鍵字
+                entries = self.store.load(user_id)
+                self._rebuild_user(user_id, entries)
+                self._loaded.set(user_id, True)
+                logger.info(f"用戶 {user_id} 的自訂關鍵字已保存，共 {len(entries)} 個")
+                return
+            except sqlite3.Error as e:
+                logger.error(f"保存用戶 {user_id} 的自訂關鍵字失敗，只保留在本進程: {str(e)}")
+        cached = self._cached_user(user_id)
+        entries = (cached[0] if cached else []) + entries
+        self._rebuild_user(user_id, entries)
+        logger.info(f"用戶 {user_id} 的自訂關鍵字已更新，共 {len(entries)} 個")
+
+    def _rebuild_user(self, user_id, entries):
+        """以完整的關鍵字列表重建用戶的自動機，超過 max_users 時淘汰最久未使用的用戶"""
+        automaton = KeywordAutomaton(entries) if entries else None
+        with self._lock:
+            self._users[user_id] = (entries, automaton)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            if automaton is not None:
+                self.rebuilds += 1
+        return automaton
+
+    def _cached_user(self, user_id):
+        """本進程保留的 (關鍵字列表, 自動機)，不存在時返回 None"""
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None:
+                self._users.move_to_end(user_id)
+            return cached
+
+    def _user_automaton(self, user_id):
+        """用戶的自動機，未保留在本進程或距離上次讀取超過 reload_seconds 時從共用檔案讀取"""
+        cached = self._cached_user(user_id)
+        reload = self._loaded.add(user_id)
+        if self.store is not None and (reload or cached is None):
+            try:
+                entries = self.store.load(user_id)
+            except sqlite3.Error as e:
+                logger.error(f"讀取用戶 {user_id} 的自訂關鍵字失敗: {str(e)}")
+                entries = None
+            if entries is not None and (cached is None or entries != cached[0]):
+                return self._rebuild_user(user_id, entries)
+        return cached[1] if cached else None
+
+    def add_user_category(self, user_id, name, keywords=(), weight=None):
+        """新增用戶自訂類別，類別名稱本身也作為關鍵字"""
+        entries = [(keyword, ('category', name), weight) for keyword in (name,) + tuple(keywords)]
+        self.add_user_keywords(user_id, entries)
+
+    def scores(self, text, user_id=None):
+        """各標籤的分數，包含該用戶的自訂關鍵字"""
+        scores = self._base.scores(text)
+        user_automaton = self._user_automaton(user_id) if user_id else None
+        if user_automaton is not None:
+            user_automaton.scores(text, scores)
+        return scores
+
+    def classify(self, text, user_id=None):
+        """依種類分組的分數
+
+        Returns:
+            dict: 種類 -> [(名稱, 分數), ...]，依分數由高到低排序（同分時依註冊順序）
+        """
+        order = self._order
+        grouped = {}
+        for (kind, name), score in self.scores(text, user_id).items():
+            grouped.setdefault(kind, []).append((name, score))
+        for kind, items in grouped.items():
+            items.sort(key=lambda item: (-item[1], order.get((kind, item[0]), len(order))))
+        return grouped
+
+    def best(self, text, kind, user_id=None, default=None):
+        """指定種類中分數最高的名稱，沒有符合的關鍵字時返回 default"""
+        items = self.classify(text, user_id).get(kind)
+        return items[0][0] if items else default
+
+    @staticmethod
+    def _label_order(entries):
+        """標籤的註冊順序（同分時的排序依據）"""
+        order = {}
+        for _, label, _ in entries:
+            order.setdefault(label, len(order))
+        return order
+
+    def stats(self):
+        """關鍵字數量與重建次數"""
+        with self._lock:
+            automata = [automaton for _, automaton in self._users.values() if automaton is not None]
+            return {
+                'keywords': self._base.size,
+                'users': len(automata),
+                'user_keywords': sum(automaton.size for automaton in automata),
+                'rebuilds': self.rebuilds
+            }
+
+
+_user_keyword_store = None
+_user_keyword_store_lock = threading.Lock()
+
+
+def get_user_keyword_store():
+    """取得本進程共用的自訂關鍵字儲存
+
+    USER_KEYWORDS_PATH 為空字串時返回 None（自訂關鍵字只保存在本進程記憶體）。
+    """
+    global _user_keyword_store
+    path = os.environ.get('USER_KEYWORDS_PATH', DEFAULT_USER_KEYWORDS_PATH)
+    if not path:
+        return None
+    if _user_keyword_store is None:
+        with _user_keyword_store_lock:
+            if _user_keyword_store is None:
+                _user_keyword_store = UserKeywordStore(path)
+    return _user_keyword_store
@@ -0,0 +1,116 @@
+"""
+關鍵字路由模組
+啟動時把固定命令（主選單、help、初始化等）與前綴命令建成雜湊表與前綴樹，
+訊息先查表直接找到處理函數，只有自由輸入的訊息才交給正則表達式解析；
+並記錄每則訊息由哪一條路由處理
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 路由層級：BEFORE_FLOW 在多步驟流程之前比對（任何時候都可使用的命令），
+# AFTER_FLOW 在流程之後比對（流程進行中時輸入交給流程處理）
+BEFORE_FLOW = 0
+AFTER_FLOW = 1
+
+# 本進程建立的路由器（運維統計用）
+_routers = []
+
+
+def normalize(text):
+    """比對用的訊息正規化（不區分大小寫）"""
+    return (text or '').lower()
+
+
+class Route:
+    """一條路由"""
+
+    def __init__(self, name, handler, tier):
+        self.name = name
+        self.handler = handler
+        self.tier = tier
+
+
+class KeywordRouter:
+    """完全比對的雜湊表加上前綴樹的訊息路由器"""
+
+    def __init__(self):
+        self._exact = {}
+        self._trie = {}
+        self._lock = threading.Lock()
+        self.counts = {}
+        _routers.append(self)
+
+    def route(self, name, keywords=(), prefixes=(), tier=BEFORE_FLOW):
+        """註冊處理函數的裝飾器
+
+        Args:
+            name: 路由名稱（統計用）
+            keywords: 完全相符（不區分大小寫）時使用此路由的訊息
+            prefixes: 以這些文字開頭（不區分大小寫）時使用此路由
+            tier: 路由層級，BEFORE_FLOW 或 AFTER_FLOW
+
+        處理函數的參數為 (user_id, message_text)。
+        """
+        def decorator(handler):
+            route = Route(name, handler, tier)
+            for keyword in keywords:
+                self._exact[normalize(keyword)] = route
+            for prefix in prefixes:
+                node = self._trie
+                for char in normalize(prefix):
+                    node = node.setdefault(char, {})
+                node[None] = route
+            self.counts.setdefault(name, 0)
+            return handler
+        return decorator
+
+    def match(self, text, tier=BEFORE_FLOW):
+        """取得訊息在指定層級的路由：先完全比對，再取最長的相符前綴
+
+        Returns:
+            Route: 沒有相符的路由時返回 None
+        """
+        key = normalize(text)
+        route = self._exact.get(key)
+        if route is not None and route.tier == tier:
+            return route
+
+        found = None
+        node = self._trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(None)
+            if route is not None and route.tier == tier:
+                found = route
+        return found
+
+    def record(self, name):
+        """記錄一則訊息由指定路由處理（包含正則解析等非關鍵字路由）"""
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def serve(self, route, user_id, text):
+        """以路由的處理函數處理訊息，處理函數返回 None 時視為未處理、不記錄"""
+        response = route.handler(user_id, text)
+        if response is not None:
+            self.record(route.name)
+        return response
+
+    def stats(self):
+        """各路由處理的訊息數，依數量排序"""
+        with self._lock:
+            counts = dict(self.counts)
+        return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+
+def get_route_stats():
+    """本進程所有路由器的統計"""
+    stats = {}
+    for router in _routers:
+        for name, count in router.stats().items():
+            stats[name] = stats.get(name, 0) + count
+    return stats
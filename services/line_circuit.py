@@ -0,0 +1,249 @@
+"""
+LINE API 熔斷模組
+記錄各端點類別的請求延遲分佈；連續失敗或回應過慢達門檻時開啟熔斷，
+熔斷期間請求立即失敗（push 暫存於推送佇列稍後發送），不再佔用處理執行緒等待逾時
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+
+from services.outbound_sender import classify_url
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 延遲分佈的區間上限（秒）
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class CircuitOpenError(Exception):
+    """熔斷開啟中，請求未發送"""
+
+    def __init__(self, retry_in):
+        super().__init__(f"LINE API 熔斷中，{retry_in:.1f} 秒後再試")
+        self.retry_in = retry_in
+
+
+class LatencyHistogram:
+    """固定區間的延遲分佈（執行緒安全）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """記錄一次請求的耗時"""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, ratio):
+        """估計百分位數，返回所在區間的上限（秒）"""
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+            maximum = self.max
+        if not count:
+            return 0.0
+        target = ratio * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else maximum
+        return maximum
+
+    def snapshot(self):
+        """延遲分佈與摘要"""
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+            total = self.total
+            maximum = self.max
+        labels = [f"le_{bucket}" for bucket in self.buckets] + ['le_inf']
+        return {
+            'count': count,
+            'avg': round(total / count, 4) if count else 0.0,
+            'max': round(maximum, 4),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip(labels, counts))
+        }
+
+
+class CircuitBreaker:
+    """熔斷器
+
+    連續失敗（連線錯誤、逾時、5xx 或超過 slow_call_seconds 的慢回應）達 failure_threshold 次時開啟；
+    開啟 reset_timeout 秒後進入半開狀態，只放行一個試探請求，成功則關閉，失敗則重新開啟。
+    """
+
+    def __init__(self, failure_threshold=5, slow_call_seconds=3.0, reset_timeout=30):
+        """初始化
+
+        Args:
+            failure_threshold: 開啟熔斷的連續失敗次數
+            slow_call_seconds: 耗時超過此值（秒）的請求視為失敗
+            reset_timeout: 熔斷開啟後多久進入半開狀態（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.counts = {'opened': 0, 'rejected': 0, 'failures': 0, 'slow_calls': 0}
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_in(self):
+        """熔斷開啟時距離可以試探的秒數，未開啟時返回 0"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def is_open(self):
+        """熔斷是否開啟中（半開狀態下已有試探請求時也視為開啟）"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() < self.opened_at + self.reset_timeout
+            return self.state == HALF_OPEN and self._probing
+
+    def before_call(self):
+        """請求前檢查，熔斷開啟時拋出 CircuitOpenError"""
+        with self._lock:
+            if self.state == OPEN:
+                retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    self.counts['rejected'] += 1
+                    raise CircuitOpenError(retry_in)
+                self.state = HALF_OPEN
+                self._probing = False
+                logger.info("LINE API 熔斷進入半開狀態，發送試探請求")
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    self.counts['rejected'] += 1
+                    raise CircuitOpenError(0.0)
+                self._probing = True
+
+    def record(self, success, elapsed):
+        """記錄請求結果
+
+        Args:
+            success: 是否得到非 5xx 回應
+            elapsed: 耗時（秒）
+        """
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if slow:
+                self.counts['slow_calls'] += 1
+            if success and not slow:
+                if self.state != CLOSED:
+                    logger.info("LINE API 已恢復，熔斷關閉")
+                self.state = CLOSED
+                self.failures = 0
+                self._probing = False
+                return
+
+            self.counts['failures'] += 1
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+                self.counts['opened'] += 1
+                logger.warning(
+                    f"LINE API 連續 {self.failures} 次失敗或過慢，熔斷開啟 {self.reset_timeout} 秒"
+                )
+
+    def stats(self):
+        """熔斷狀態與計數"""
+        stats = dict(self.counts)
+        stats['state'] = self.state
+        stats['consecutive_failures'] = self.failures
+        stats['retry_in'] = round(self.retry_in(), 1)
+        return stats
+
+
+class LineCircuit:
+    """LINE API 請求的延遲記錄與熔斷（整個 API 共用一個熔斷器）"""
+
+    def __init__(self, breaker=None):
+        self.breaker = breaker or CircuitBreaker()
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, endpoint_class):
+        histogram = self.histograms.get(endpoint_class)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(endpoint_class, LatencyHistogram())
+        return histogram
+
+    def is_open(self):
+        """熔斷是否開啟中"""
+        return self.breaker.is_open()
+
+    def call(self, url, request):
+        """檢查熔斷後發送請求，並記錄耗時與結果
+
+        Args:
+            url: 請求網址
+            request: 發送請求的函數，返回 requests.Response
+
+        Returns:
+            requests.Response: 回應
+
+        Raises:
+            CircuitOpenError: 熔斷開啟中，請求未發送
+        """
+        self.breaker.before_call()
+        start = time.monotonic()
+        success = False
+        try:
+            response = request()
+            success = response.status_code < 500
+            return response
+        finally:
+            elapsed = time.monotonic() - start
+            self.histogram(classify_url(url)).observe(elapsed)
+            self.breaker.record(success, elapsed)
+
+    def stats(self):
+        """熔斷狀態與各端點類別的延遲分佈"""
+        return {
+            'breaker': self.breaker.stats(),
+            'latency': {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())}
+        }
+
+
+_circuit = None
+_circuit_lock = threading.Lock()
+
+
+def get_line_circuit():
+    """取得本進程共用的 LINE API 熔斷器"""
+    global _circuit
+    if _circuit is None:
+        with _circuit_lock:
+            if _circuit is None:
+                _circuit = LineCircuit(CircuitBreaker(
+                    failure_threshold=int(os.environ.get('LINE_CIRCUIT_FAILURES', '5')),
+                    slow_call_seconds=float(os.environ.get('LINE_CIRCUIT_SLOW_SECONDS', '3')),
+                    reset_timeout=float(os.environ.get('LINE_CIRCUIT_RESET_TIMEOUT', '30'))
+                ))
+    return _circuit
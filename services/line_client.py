@@ -0,0 +1,159 @@
+"""
+LINE API 客戶端模組
+整個進程共用一個 LineBotApi 與 keep-alive 連線池，避免每次呼叫重新建立 TLS 連線
+"""
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from linebot import LineBotApi
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+from services.outbound_sender import get_outbound_sender
+from services.line_circuit import get_line_circuit
+
+logger = logging.getLogger(__name__)
+
+
+def get_http_timeout():
+    """LINE API 的逾時設定：LINE_HTTP_TIMEOUT 為讀取逾時，LINE_HTTP_CONNECT_TIMEOUT 為連線逾時"""
+    connect_timeout = float(os.environ.get('LINE_HTTP_CONNECT_TIMEOUT', '3'))
+    read_timeout = float(os.environ.get('LINE_HTTP_TIMEOUT', '10'))
+    return (connect_timeout, read_timeout)
+
+
+class PooledHttpClient(RequestsHttpClient):
+    """使用共用 requests.Session 的 HttpClient
+
+    請求經由 OutboundSender 依端點類別限速並處理 429 與重試，
+    每次實際發送都經過熔斷檢查並記錄延遲。
+    所有實例共用同一個連線池；gunicorn fork 後連線不能跨進程使用，
+    因此以進程 ID 判斷，在新進程中第一次使用時重新建立。
+    """
+
+    _lock = threading.Lock()
+    _session = None
+    _pid = None
+
+    @staticmethod
+    def get_session():
+        """取得本進程的共用 Session"""
+        pid = os.getpid()
+        if PooledHttpClient._pid != pid:
+            with PooledHttpClient._lock:
+                if PooledHttpClient._pid != pid:
+                    pool_size = int(os.environ.get('LINE_HTTP_POOL_SIZE', '20'))
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    PooledHttpClient._session = session
+                    PooledHttpClient._pid = pid
+                    logger.info(f"LINE API 連線池已建立，大小: {pool_size}")
+        return PooledHttpClient._session
+
+    def _send(self, method, url, headers, timeout, **kwargs):
+        """經由外發請求控制（速率限制與重試）發送請求"""
+        session = self.get_session()
+        timeout = self.timeout if timeout is None else timeout
+        circuit = get_line_circuit()
+
+        def request(request_headers):
+            return circuit.call(
+                url, lambda: session.request(method, url, headers=request_headers, timeout=timeout, **kwargs)
+            )
+
+        return RequestsHttpResponse(get_outbound_sender().send(method, url, headers, request))
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._send('GET', url, headers, timeout, params=params, stream=stream)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._send('POST', url, headers, timeout, data=data)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._send('DELETE', url, headers, timeout, data=data)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._send('PUT', url, headers, timeout, data=data)
+
+    @staticmethod
+    def stats():
+        """連線重用統計，來自 urllib3 各主機連線池的計數"""
+        session = PooledHttpClient._session
+        if session is None or PooledHttpClient._pid != os.getpid():
+            return {'hosts': {}, 'connections': 0, 'requests': 0, 'reuse_rate': 0.0}
+
+        hosts = {}
+        adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                hosts[f"{pool.scheme}://{pool.host}"] = {
+                    'connections': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle': pool.pool.qsize() if pool.pool is not None else 0
+                }
+
+        connections = sum(host['connections'] for host in hosts.values())
+        total_requests = sum(host['requests'] for host in hosts.values())
+        return {
+            'hosts': hosts,
+            'connections': connections,
+            'requests': total_requests,
+            'reuse_rate': round(1 - connections / total_requests, 4) if total_requests else 0.0
+        }
+
+
+class LineClient:
+    """LINE API 客戶端工廠"""
+
+    _lock = threading.Lock()
+    _clients = {}
+
+    @staticmethod
+    def get_line_bot_api(channel_access_token=None):
+        """取得共用的 LineBotApi
+
+        Args:
+            channel_access_token: Channel Access Token，預設讀取環境變數 LINE_CHANNEL_ACCESS_TOKEN
+
+        Returns:
+            LineBotApi: 同一個 token 在同一進程內返回同一個實例
+        """
+        if channel_access_token is None:
+            channel_access_token = os.environ.get('LINE_CHANNEL_ACCESS_TOKEN', '')
+
+        client = LineClient._clients.get(channel_access_token)
+        if client is None:
+            with LineClient._lock:
+                client = LineClient._clients.get(channel_access_token)
+                if client is None:
+                    client = LineBotApi(
+                        channel_access_token,
+                        endpoint=os.environ.get('LINE_API_ENDPOINT', LineBotApi.DEFAULT_API_ENDPOINT),
+                        data_endpoint=os.environ.get('LINE_API_DATA_ENDPOINT', LineBotApi.DEFAULT_API_DATA_ENDPOINT),
+                        timeout=get_http_timeout(),
+                        http_client=PooledHttpClient
+                    )
+                    LineClient._clients[channel_access_token] = client
+        return client
+
+    @staticmethod
+    def stats():
+        """連線池統計"""
+        return PooledHttpClient.stats()
+
+    @staticmethod
+    def is_available():
+        """LINE API 是否可用（熔斷未開啟）"""
+        return not get_line_circuit().is_open()
+
+
+def get_line_bot_api(channel_access_token=None):
+    """取得共用的 LineBotApi（LineClient.get_line_bot_api 的簡寫）"""
+    return LineClient.get_line_bot_api(channel_access_token)
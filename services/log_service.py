@@ -0,0 +1,240 @@
+"""
+日誌服務模組
+以 QueueHandler/QueueListener 將日誌格式化與輸出移出請求執行緒，
+支援依 logger 抽樣，並以環形緩衝區保留最近的請求內容，發生錯誤時才輸出
+"""
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+logger = logging.getLogger(__name__)
+
+
+def parse_sample_rates(value):
+    """解析抽樣設定，格式為 "logger名稱=比例,..."，例如 "message_handler=0.1"
+
+    Returns:
+        dict: logger 名稱 -> 保留比例（0~1）
+    """
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, rate = item.split('=', 1)
+        try:
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """依 logger 名稱抽樣低於 WARNING 的日誌
+
+    以最長前綴比對設定，例如 "services" 的設定也套用到 "services.finance_service"。
+    以計數器取樣（比例 0.1 表示每 10 筆保留 1 筆），結果可預期且不需亂數。
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._counters = {}
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def _rate_for(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+
+        with self._lock:
+            count = self._counters.get(record.name, 0) + 1
+            self._counters[record.name] = count
+        return int(count * rate) != int((count - 1) * rate)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """將日誌記錄原樣放入佇列，格式化交給 QueueListener 的執行緒
+
+    佇列只在本進程內使用，因此不需要像標準 QueueHandler 一樣先格式化。
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        LogService.ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LogService.dropped += 1
+
+
+class BodyRingBuffer:
+    """保留最近請求內容的環形緩衝區"""
+
+    def __init__(self, capacity=50, max_length=4000):
+        """初始化
+
+        Args:
+            capacity: 保留的請求數
+            max_length: 每筆請求內容保留的最大字元數
+        """
+        self.max_length = max_length
+        self._items = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def append(self, body, label=''):
+        with self._lock:
+            self._items.append((time.time(), label, body[:self.max_length]))
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class LogService:
+    """日誌服務"""
+
+    _lock = threading.Lock()
+    _queue = None
+    _listener = None
+    _handlers = []
+    _pid = None
+    _bodies = BodyRingBuffer(
+        capacity=int(os.environ.get('LOG_BODY_BUFFER_SIZE', '50'))
+    )
+    _last_dump = 0.0
+    dropped = 0
+
+    @staticmethod
+    def setup(level=None):
+        """設定根 logger，可重複呼叫，只有第一次生效
+
+        Args:
+            level: 日誌等級，預設讀取環境變數 LOG_LEVEL
+        """
+        with LogService._lock:
+            if LogService._queue is not None:
+                return
+
+            formatter = logging.Formatter(LOG_FORMAT)
+            handlers = [logging.StreamHandler(sys.stdout)]
+            log_file = os.environ.get('LOG_FILE')
+            if log_file:
+                handlers.append(RotatingFileHandler(
+                    log_file,
+                    maxBytes=int(os.environ.get('LOG_FILE_MAX_BYTES', str(10 * 1024 * 1024))),
+                    backupCount=int(os.environ.get('LOG_FILE_BACKUPS', '3')),
+                    encoding='utf-8'
+                ))
+            for handler in handlers:
+                handler.setFormatter(formatter)
+
+            LogService._queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', '10000')))
+            LogService._handlers = handlers
+            queue_handler = DeferredQueueHandler(LogService._queue)
+            queue_handler.addFilter(SamplingFilter(parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES'))))
+
+            root = logging.getLogger()
+            for existing in list(root.handlers):
+                root.removeHandler(existing)
+            root.addHandler(queue_handler)
+            root.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO'))
+            atexit.register(LogService.stop)
+
+        LogService.ensure_listener()
+
+    @staticmethod
+    def ensure_listener():
+        """確保本進程的輸出執行緒在運行（gunicorn fork 後需要重新啟動）"""
+        pid = os.getpid()
+        if LogService._pid == pid or LogService._queue is None:
+            return
+        with LogService._lock:
+            if LogService._pid == pid:
+                return
+            LogService._listener = QueueListener(
+                LogService._queue, *LogService._handlers, respect_handler_level=True
+            )
+            LogService._listener.start()
+            LogService._pid = pid
+
+    @staticmethod
+    def stop():
+        """停止輸出執行緒，並輸出佇列中剩餘的日誌"""
+        with LogService._lock:
+            if LogService._listener is not None and LogService._pid == os.getpid():
+                LogService._listener.stop()
+            LogService._listener = None
+            LogService._pid = None
+
+    @staticmethod
+    def record_body(body, label='webhook'):
+        """記錄請求內容到環形緩衝區（取代在 INFO 等級輸出完整內容）
+
+        Args:
+            body: 請求內容
+            label: 來源標籤
+        """
+        LogService._bodies.append(body, label)
+        logger.debug("請求內容（%s）: %s", label, body)
+
+    @staticmethod
+    def dump_recent_bodies(reason='', min_interval=None):
+        """發生錯誤時輸出最近的請求內容
+
+        Args:
+            reason: 輸出原因
+            min_interval: 兩次輸出的最短間隔（秒），避免大量錯誤時重複輸出
+        """
+        if min_interval is None:
+            min_interval = float(os.environ.get('LOG_DUMP_INTERVAL', '60'))
+        now = time.time()
+        with LogService._lock:
+            if now - LogService._last_dump < min_interval:
+                return
+            LogService._last_dump = now
+
+        items = LogService._bodies.snapshot()
+        logger.error(f"輸出最近 {len(items)} 筆請求內容（{reason}）")
+        for received_at, label, body in items:
+            timestamp = time.strftime('%H:%M:%S', time.localtime(received_at))
+            logger.error(f"[{timestamp}] {label}: {body}")
+
+    @staticmethod
+    def stats():
+        """日誌佇列狀態"""
+        return {
+            'queued': LogService._queue.qsize() if LogService._queue is not None else 0,
+            'dropped': LogService.dropped,
+            'buffered_bodies': len(LogService._bodies)
+        }
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 import re
 import logging
 from models import db, Note, Tag, Reminder
+from services.time_parser import resolve_time
 
 logger = logging.getLogger(__name__)
 
@@ -394,25 +395,7 @@ class NoteService:
             
             # 解析時間
             try:
-                if ' ' in time_str:  # 包含時間
-                    date_part, time_part = time_str.split(' ')
-                    date_parts = date_part.split('-')
-                    time_parts = time_part.split(':')
-                    
-                    year = int(date_parts[0])
-                    month = int(date_parts[1])
-                    day = int(date_parts[2])
-                    hour = int(time_parts[0])
-                    minute = int(time_parts[1])
-                    
-                    reminder_time = datetime(year, month, day, hour, minute)
-                else:  # 只有日期
-                    date_parts = time_str.split('-')
-                    year = int(date_parts[0])
-                    month = int(date_parts[1])
-                    day = int(date_parts[2])
-                    
-                    reminder_time = datetime(year, month, day, 9, 0)  # 默認早上9點
+                reminder_time = resolve_time(time_str)  # 只有日期時為早上9點
                 
                 # 轉換重複類型
                 repeat_mapping = {
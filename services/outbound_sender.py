@@ -0,0 +1,287 @@
+"""
+外發請求控制模組
+依 LINE API 端點類別以令牌桶限制發送速率，遵守 429 回應的 Retry-After，
+並對可安全重試的 push 類請求以帶抖動的指數退避重試
+"""
+import os
+import time
+import uuid
+import random
+import logging
+import threading
+import requests
+
+logger = logging.getLogger(__name__)
+
+RETRY_KEY_HEADER = 'X-Line-Retry-Key'
+ACCEPTED_REQUEST_HEADER = 'X-Line-Accepted-Request-Id'
+
+# 可帶 X-Line-Retry-Key 重試的端點類別
+RETRYABLE_CLASSES = ('push', 'multicast', 'narrowcast', 'broadcast')
+
+# 端點路徑與類別
+ENDPOINT_CLASSES = (
+    ('/v2/bot/message/reply', 'reply'),
+    ('/v2/bot/message/push', 'push'),
+    ('/v2/bot/message/multicast', 'multicast'),
+    ('/v2/bot/message/narrowcast', 'narrowcast'),
+    ('/v2/bot/message/broadcast', 'broadcast'),
+    ('/v2/bot/profile', 'profile'),
+    ('/v2/bot/info', 'bot_info'),
+    ('/v2/bot/richmenu', 'richmenu'),
+    ('/v2/bot/user', 'richmenu'),
+)
+
+# 每秒請求數的預設上限（低於 LINE 公布的上限，保留餘裕）
+DEFAULT_RATE_LIMITS = {
+    'reply': 1000,
+    'push': 1000,
+    'multicast': 100,
+    'narrowcast': 10,
+    'broadcast': 10,
+    'profile': 1000,
+    'bot_info': 100,
+    'richmenu': 100,
+    'other': 100,
+}
+
+
+def classify_url(url):
+    """依網址判斷端點類別"""
+    for prefix, endpoint_class in ENDPOINT_CLASSES:
+        if prefix in url:
+            return endpoint_class
+    return 'other'
+
+
+def parse_rate_limits(value):
+    """解析速率設定，格式為 "類別=每秒請求數,..."，例如 "push=50,multicast=10" """
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, rate = item.split('=', 1)
+        try:
+            limits[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return limits
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 標頭（秒數），無法解析時返回 None"""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """令牌桶（執行緒安全）"""
+
+    def __init__(self, rate, capacity=None):
+        """初始化
+
+        Args:
+            rate: 每秒補充的令牌數
+            capacity: 桶容量（允許的突發量），預設等於 rate
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, timeout=None):
+        """取得一個令牌，必要時等待
+
+        Args:
+            timeout: 最長等待秒數，None 表示一直等待
+
+        Returns:
+            float: 等待的秒數；超過 timeout 時返回 None
+        """
+        start = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now >= self.blocked_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        return now - start
+                    wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+                if timeout is not None and time.monotonic() + wait - start > timeout:
+                    return None
+                time.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def block(self, seconds):
+        """暫停發放令牌（收到 429 時使用）"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class OutboundSender:
+    """LINE API 外發請求控制"""
+
+    def __init__(self, rate_limits=None, max_retries=4, base_delay=0.5, max_delay=30,
+                 reply_max_wait=3):
+        """初始化
+
+        Args:
+            rate_limits: 端點類別 -> 每秒請求數
+            max_retries: 最大重試次數
+            base_delay: 指數退避的基準延遲（秒）
+            max_delay: 單次延遲上限（秒）
+            reply_max_wait: reply 類請求最多等待的秒數（reply token 有時效）
+        """
+        self.rate_limits = rate_limits or dict(DEFAULT_RATE_LIMITS)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.reply_max_wait = reply_max_wait
+        self._buckets = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, endpoint_class):
+        bucket = self._buckets.get(endpoint_class)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(endpoint_class)
+                if bucket is None:
+                    rate = self.rate_limits.get(endpoint_class, self.rate_limits['other'])
+                    bucket = TokenBucket(rate)
+                    self._buckets[endpoint_class] = bucket
+        return bucket
+
+    def _count(self, endpoint_class, name, amount=1):
+        with self._lock:
+            counts = self._counts.setdefault(endpoint_class, {
+                'requests': 0, 'throttled': 0, 'throttle_wait': 0.0,
+                'rate_limited': 0, 'retries': 0, 'failed': 0
+            })
+            counts[name] += amount
+
+    def backoff(self, attempt):
+        """帶完整抖動的指數退避延遲"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def send(self, method, url, headers, request):
+        """發送請求
+
+        Args:
+            method: HTTP 方法
+            url: 請求網址
+            headers: 請求標頭（push 類請求會加入 X-Line-Retry-Key）
+            request: 實際發送請求的函數，接收 headers，返回 requests.Response
+
+        Returns:
+            requests.Response: 最後一次的回應
+        """
+        endpoint_class = classify_url(url)
+        retryable = method == 'POST' and endpoint_class in RETRYABLE_CLASSES
+        if retryable:
+            headers = dict(headers or {})
+            headers.setdefault(RETRY_KEY_HEADER, str(uuid.uuid4()))
+        max_wait = self.reply_max_wait if endpoint_class == 'reply' else None
+
+        bucket = self.bucket(endpoint_class)
+        attempt = 0
+        while True:
+            waited = bucket.acquire(timeout=max_wait)
+            if waited is None:
+                self._count(endpoint_class, 'failed')
+                raise requests.exceptions.Timeout(f"等待 {endpoint_class} 發送額度逾時")
+            self._count(endpoint_class, 'requests')
+            if waited > 0.001:
+                self._count(endpoint_class, 'throttled')
+                self._count(endpoint_class, 'throttle_wait', waited)
+
+            try:
+                response = request(headers)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # 連線失敗時只有帶 retry key 的請求可以安全重試
+                if not retryable or attempt >= self.max_retries:
+                    self._count(endpoint_class, 'failed')
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"{endpoint_class} 請求失敗，{delay:.2f} 秒後重試: {str(e)}")
+            else:
+                if response.status_code == 409 and attempt > 0 and response.headers.get(ACCEPTED_REQUEST_HEADER):
+                    # 先前的嘗試已被接受（逾時後重試的情況），視為成功
+                    return accepted_response(response)
+
+                if response.status_code == 429:
+                    self._count(endpoint_class, 'rate_limited')
+                    delay = parse_retry_after(response.headers.get('Retry-After'))
+                    if delay is None:
+                        delay = self.backoff(attempt)
+                    bucket.block(delay)
+                    # 429 表示請求未被處理，所有類別都可重試，但 reply 受時效限制
+                    if attempt >= self.max_retries or (max_wait is not None and delay > max_wait):
+                        self._count(endpoint_class, 'failed')
+                        return response
+                    logger.warning(f"{endpoint_class} 請求被限流，{delay:.2f} 秒後重試")
+                elif response.status_code >= 500 and retryable and attempt < self.max_retries:
+                    delay = self.backoff(attempt)
+                    logger.warning(f"{endpoint_class} 請求返回 {response.status_code}，{delay:.2f} 秒後重試")
+                else:
+                    if response.status_code >= 400:
+                        self._count(endpoint_class, 'failed')
+                    return response
+
+            self._count(endpoint_class, 'retries')
+            attempt += 1
+            time.sleep(delay)
+
+    def stats(self):
+        """各端點類別的發送統計，waiting 為正在等待額度的請求數"""
+        with self._lock:
+            stats = {name: dict(counts) for name, counts in self._counts.items()}
+        for name, counts in stats.items():
+            bucket = self._buckets.get(name)
+            counts['throttle_wait'] = round(counts['throttle_wait'], 3)
+            counts['waiting'] = bucket.waiting if bucket else 0
+            counts['rate_limit'] = bucket.rate if bucket else None
+        return stats
+
+
+def accepted_response(response):
+    """將「已接受」的 409 回應轉為 200，讓 SDK 不拋出錯誤"""
+    accepted = requests.Response()
+    accepted.status_code = 200
+    accepted.headers = response.headers
+    accepted.url = response.url
+    accepted._content = b'{}'
+    return accepted
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_outbound_sender():
+    """取得本進程共用的外發請求控制器"""
+    global _sender
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                _sender = OutboundSender(
+                    rate_limits=parse_rate_limits(os.environ.get('OUTBOUND_RATE_LIMITS')),
+                    max_retries=int(os.environ.get('OUTBOUND_MAX_RETRIES', '4')),
+                    reply_max_wait=float(os.environ.get('OUTBOUND_REPLY_MAX_WAIT', '3'))
+                )
+    return _sender
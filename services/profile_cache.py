@@ -0,0 +1,217 @@
+"""
+用戶資料快取模組
+快取 LINE 用戶資料與 Bot 資訊，同一鍵同時未命中時只呼叫一次 API，
+並可將快取保存到檔案，重新啟動後直接使用
+"""
+import os
+import json
+import time
+import atexit
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from linebot.models import Profile, BotInfo
+
+from services.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+BOT_INFO_KEY = 'bot_info'
+PROFILE_PREFIX = 'profile:'
+
+
+class ProfileCache:
+    """LINE 用戶資料與 Bot 資訊快取"""
+
+    def __init__(self, max_size=10000, profile_ttl=86400, bot_info_ttl=600, path=None, save_interval=60):
+        """初始化
+
+        Args:
+            max_size: 最大快取項目數
+            profile_ttl: 用戶資料快取時間（秒）
+            bot_info_ttl: Bot 資訊快取時間（秒）
+            path: 保存快取的 JSON 檔案路徑，None 表示不保存
+            save_interval: 兩次保存的最短間隔（秒）
+        """
+        self.profile_ttl = profile_ttl
+        self.bot_info_ttl = bot_info_ttl
+        self.path = path
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._cache = TTLCache(max_size=max_size, ttl=profile_ttl)
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+        self._last_save = time.time()
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def get_profile(self, line_bot_api, user_id):
+        """取得用戶資料
+
+        Args:
+            line_bot_api: LineBotApi 實例
+            user_id: LINE 用戶 ID
+
+        Returns:
+            Profile: 用戶資料
+        """
+        return self._get(PROFILE_PREFIX + user_id, lambda: line_bot_api.get_profile(user_id), self.profile_ttl)
+
+    def get_bot_info(self, line_bot_api):
+        """取得 Bot 資訊"""
+        return self._get(BOT_INFO_KEY, line_bot_api.get_bot_info, self.bot_info_ttl)
+
+    async def get_bot_info_async(self, line_bot_api):
+        """取得 Bot 資訊（AsyncLineBotApi）"""
+        return await self._get_async(BOT_INFO_KEY, line_bot_api.get_bot_info, self.bot_info_ttl)
+
+    async def get_profile_async(self, line_bot_api, user_id):
+        """取得用戶資料（AsyncLineBotApi）"""
+        return await self._get_async(
+            PROFILE_PREFIX + user_id, lambda: line_bot_api.get_profile(user_id), self.profile_ttl
+        )
+
+    def invalidate(self, user_id=None):
+        """清除指定用戶的快取，未指定時清除 Bot 資訊"""
+        self._cache.delete(PROFILE_PREFIX + user_id if user_id else BOT_INFO_KEY)
+
+    def _get(self, key, fetch, ttl):
+        value = self._cache.get(key, MISSING)
+        if value is not MISSING:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        # 同一鍵只由第一個未命中的執行緒呼叫 API，其他執行緒等待結果
+        with self._lock:
+            self.misses += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = fetch()
+            self._cache.set(key, value, ttl=ttl)
+            future.set_result(value)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        self._maybe_save()
+        return value
+
+    async def _get_async(self, key, fetch, ttl):
+        value = self._cache.get(key, MISSING)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        task = self._async_inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fetch())
+        self._async_inflight[key] = task
+        try:
+            value = await task
+            self._cache.set(key, value, ttl=ttl)
+        finally:
+            self._async_inflight.pop(key, None)
+
+        self._maybe_save()
+        return value
+
+    def _maybe_save(self):
+        if self.path and time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """將快取保存到檔案"""
+        if not self.path:
+            return
+        self._last_save = time.time()
+        items = []
+        for key, value, expires_at in self._cache.items():
+            items.append({'key': key, 'value': value.as_json_dict(), 'expires_at': expires_at})
+
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"保存用戶資料快取失敗: {str(e)}")
+
+    def load(self):
+        """從檔案載入未過期的快取"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"載入用戶資料快取失敗: {str(e)}")
+            return
+
+        now = time.time()
+        loaded = 0
+        # 檔案依最近使用排序，反向寫入讓最近使用的項目留在快取尾端
+        for item in reversed(items):
+            remaining = item['expires_at'] - now
+            if remaining <= 0:
+                continue
+            model = BotInfo if item['key'] == BOT_INFO_KEY else Profile
+            self._cache.set(item['key'], model.new_from_json_dict(item['value']), ttl=remaining)
+            loaded += 1
+        logger.info(f"已載入 {loaded} 筆用戶資料快取")
+
+    def stats(self):
+        """命中統計"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'cached': len(self._cache)
+        }
+
+
+_profile_cache = None
+_profile_cache_lock = threading.Lock()
+
+
+def get_profile_cache():
+    """取得本進程共用的用戶資料快取"""
+    global _profile_cache
+    if _profile_cache is None:
+        with _profile_cache_lock:
+            if _profile_cache is None:
+                _profile_cache = ProfileCache(
+                    max_size=int(os.environ.get('PROFILE_CACHE_SIZE', '10000')),
+                    profile_ttl=int(os.environ.get('PROFILE_CACHE_TTL', '86400')),
+                    bot_info_ttl=int(os.environ.get('BOT_INFO_CACHE_TTL', '600')),
+                    path=os.environ.get('PROFILE_CACHE_PATH') or None
+                )
+    return _profile_cache
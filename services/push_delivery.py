@@ -0,0 +1,260 @@
+"""
+主動推送模組
+將 push 訊息暫存後批次發送：同一用戶的多則訊息合併為一次請求（最多 5 則），
+相同內容的訊息合併為 multicast（每次最多 500 位用戶）；
+LINE API 熔斷期間訊息留在佇列中，恢復後再發送
+"""
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import Future
+
+from services.line_client import get_line_bot_api
+from services.line_circuit import get_line_circuit, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# LINE Messaging API 的限制
+MAX_MESSAGES_PER_REQUEST = 5
+MAX_MULTICAST_RECIPIENTS = 500
+
+
+def message_key(message):
+    """訊息內容的比對鍵"""
+    return json.dumps(message.as_json_dict(), sort_keys=True, ensure_ascii=False)
+
+
+def is_user_id(target):
+    """multicast 只接受用戶 ID，群組（C 開頭）與聊天室（R 開頭）需個別 push"""
+    return target.startswith('U')
+
+
+class PushDeliveryQueue:
+    """批次推送佇列
+
+    訊息先依用戶暫存，達到數量門檻或等待時間後一起發送：
+    每位用戶的訊息依順序每 5 則分為一組，內容相同的組合併為 multicast。
+    """
+
+    def __init__(self, line_bot_api=None, flush_interval=1.0, max_pending=MAX_MULTICAST_RECIPIENTS):
+        """初始化
+
+        Args:
+            line_bot_api: LineBotApi 實例，預設使用共用客戶端
+            flush_interval: 第一則訊息進入後最多等待多久發送（秒）
+            max_pending: 暫存的用戶數達到此值時立即發送
+        """
+        self.line_bot_api = line_bot_api
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.counts = {'messages': 0, 'push_calls': 0, 'multicast_calls': 0, 'failed': 0, 'held': 0}
+        self._pending = {}
+        self._first_at = None
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def enqueue(self, user_id, messages):
+        """加入待發送訊息
+
+        Args:
+            user_id: LINE 用戶、群組或聊天室 ID
+            messages: 單則訊息或訊息列表
+
+        Returns:
+            Future: 發送完成時結束，發送失敗時帶有例外
+        """
+        if not isinstance(messages, (list, tuple)):
+            messages = [messages]
+
+        future = Future()
+        with self._condition:
+            self._ensure_thread()
+            entries = self._pending.setdefault(user_id, [])
+            entries.extend((message, future) for message in messages)
+            self.counts['messages'] += len(messages)
+            if self._first_at is None:
+                # 喚醒閒置中的背景執行緒開始計時
+                self._first_at = time.time()
+                self._condition.notify()
+            elif len(self._pending) >= self.max_pending or len(entries) >= MAX_MESSAGES_PER_REQUEST:
+                self._condition.notify()
+        return future
+
+    def broadcast(self, user_ids, messages):
+        """發送相同訊息給多位用戶
+
+        Returns:
+            list: 每位用戶的 Future
+        """
+        return [self.enqueue(user_id, messages) for user_id in user_ids]
+
+    def stats(self):
+        """推送統計，api_calls 為實際呼叫 LINE API 的次數"""
+        stats = dict(self.counts)
+        stats['api_calls'] = stats['push_calls'] + stats['multicast_calls']
+        stats['pending_users'] = len(self._pending)
+        return stats
+
+    def flush(self):
+        """立即發送所有暫存的訊息"""
+        with self._condition:
+            pending = self._pending
+            self._pending = {}
+            self._first_at = None
+        if pending:
+            self._deliver(pending)
+
+    def stop(self, timeout=5):
+        """停止背景執行緒，並發送剩餘的訊息"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='push-delivery', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    if self._first_at is not None:
+                        remaining = self._first_at + self.flush_interval - time.time()
+                        full = len(self._pending) >= self.max_pending or any(
+                            len(entries) >= MAX_MESSAGES_PER_REQUEST for entries in self._pending.values()
+                        )
+                        if remaining <= 0 or full:
+                            # LINE API 熔斷中，等到可以試探時再發送
+                            hold = get_line_circuit().breaker.retry_in()
+                            if hold <= 0:
+                                break
+                            self._condition.wait(hold)
+                            continue
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._stopping:
+                    return
+                pending = self._pending
+                self._pending = {}
+                self._first_at = None
+
+            try:
+                self._deliver(pending)
+            except Exception as e:
+                logger.error(f"批次推送失敗: {str(e)}", exc_info=True)
+
+    def _requeue(self, held):
+        """將因熔斷未發送的訊息放回佇列，排在之後加入的訊息之前"""
+        with self._condition:
+            for user_id, entries in held.items():
+                self._pending[user_id] = entries + self._pending.get(user_id, [])
+                self.counts['held'] += len(entries)
+            if self._first_at is None:
+                self._first_at = time.time()
+            self._condition.notify()
+
+    def _deliver(self, pending):
+        """將暫存訊息分組後發送"""
+        # 每位用戶的訊息依順序每 5 則一組，以組的內容分組用戶
+        groups = {}
+        for user_id, entries in pending.items():
+            for start in range(0, len(entries), MAX_MESSAGES_PER_REQUEST):
+                chunk = entries[start:start + MAX_MESSAGES_PER_REQUEST]
+                key = (start, tuple(message_key(message) for message, _ in chunk))
+                group = groups.setdefault(key, {'messages': [message for message, _ in chunk], 'recipients': {}})
+                group['recipients'].setdefault(user_id, set()).update(future for _, future in chunk)
+
+        line_bot_api = self.line_bot_api or get_line_bot_api()
+        # 依組的順序發送，記錄每位用戶已處理到第幾則訊息
+        processed = {}
+        held = {}
+        try:
+            for key in sorted(groups, key=lambda item: item[0]):
+                group = groups[key]
+                user_ids = [target for target in group['recipients'] if is_user_id(target)]
+                batches = [user_ids[start:start + MAX_MULTICAST_RECIPIENTS]
+                           for start in range(0, len(user_ids), MAX_MULTICAST_RECIPIENTS)]
+                batches.extend([target] for target in group['recipients'] if not is_user_id(target))
+                for batch in batches:
+                    self._send_batch(line_bot_api, batch, group)
+                    for user_id in batch:
+                        processed[user_id] = key[0] + len(group['messages'])
+        except CircuitOpenError:
+            # 熔斷中：尚未發送的訊息依原順序放回佇列
+            for user_id, entries in pending.items():
+                remaining = entries[processed.get(user_id, 0):]
+                if remaining:
+                    held[user_id] = remaining
+            logger.warning(f"LINE API 熔斷中，{len(held)} 位用戶的推送延後發送")
+            self._requeue(held)
+
+        # 所有相關請求都成功的訊息標記為完成（仍有訊息放回佇列的不標記）
+        held_futures = {future for entries in held.values() for _, future in entries}
+        for entries in pending.values():
+            for _, future in entries:
+                if not future.done() and future not in held_futures:
+                    future.set_result(True)
+
+    def _send_batch(self, line_bot_api, batch, group):
+        """發送一組訊息給一批用戶，熔斷時拋出 CircuitOpenError，其他錯誤設定到對應的 Future"""
+        try:
+            if len(batch) == 1:
+                line_bot_api.push_message(batch[0], group['messages'])
+                self.counts['push_calls'] += 1
+            else:
+                line_bot_api.multicast(batch, group['messages'])
+                self.counts['multicast_calls'] += 1
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            self.counts['failed'] += len(batch)
+            logger.error(f"推送給 {len(batch)} 位用戶失敗: {str(e)}")
+            for user_id in batch:
+                for future in group['recipients'][user_id]:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class PushDelivery:
+    """本進程共用的批次推送佇列"""
+
+    _lock = threading.Lock()
+    _queue = None
+    _pid = None
+
+    @staticmethod
+    def get_queue():
+        """取得本進程的推送佇列（gunicorn fork 後重新建立）"""
+        pid = os.getpid()
+        if PushDelivery._pid != pid:
+            with PushDelivery._lock:
+                if PushDelivery._pid != pid:
+                    PushDelivery._queue = PushDeliveryQueue(
+                        flush_interval=float(os.environ.get('PUSH_FLUSH_INTERVAL', '1.0')),
+                        max_pending=int(os.environ.get('PUSH_MAX_PENDING', str(MAX_MULTICAST_RECIPIENTS)))
+                    )
+                    PushDelivery._pid = pid
+        return PushDelivery._queue
+
+    @staticmethod
+    def send(user_id, messages):
+        """排入一則或多則推送訊息，返回 Future"""
+        return PushDelivery.get_queue().enqueue(user_id, messages)
+
+    @staticmethod
+    def broadcast(user_ids, messages):
+        """排入發送給多位用戶的相同訊息"""
+        return PushDelivery.get_queue().broadcast(user_ids, messages)
+
+    @staticmethod
+    def stats():
+        """推送統計"""
+        return PushDelivery.get_queue().stats()
@@ -0,0 +1,220 @@
+"""
+回覆期限模組
+追蹤每個事件 reply token 的有效期限，期限將至時改用 push_message 發送，
+並依處理路徑統計改用 push 的次數，找出需要優化的指令；
+LINE API 熔斷期間不等待 reply，改排入推送佇列稍後發送
+"""
+import os
+import time
+import logging
+import threading
+from linebot.exceptions import LineBotApiError
+
+from services.ttl_cache import TTLCache
+from services.line_client import LineClient
+from services.line_circuit import CircuitOpenError
+from services.push_delivery import PushDelivery
+
+logger = logging.getLogger(__name__)
+
+
+def get_reply_token_ttl():
+    """reply token 的有效時間（秒）"""
+    return float(os.environ.get('REPLY_TOKEN_TTL', '60'))
+
+
+def get_reply_margin():
+    """剩餘時間低於此值（秒）時不再嘗試 reply，直接改用 push"""
+    return float(os.environ.get('REPLY_DEADLINE_MARGIN', '5'))
+
+
+def deadline_for(event, received_at=None):
+    """計算事件 reply token 的到期時間
+
+    以 LINE 產生事件的時間與本服務收到請求的時間中較早者起算；
+    重送的事件視為 reply token 已過期。
+
+    Args:
+        event: 事件的 JSON 字典
+        received_at: 收到請求的時間戳記，預設為現在
+
+    Returns:
+        float: 到期時間戳記，事件沒有 reply token 時返回 None
+    """
+    if not event.get('replyToken'):
+        return None
+
+    received_at = received_at or time.time()
+    if (event.get('deliveryContext') or {}).get('isRedelivery'):
+        return received_at
+
+    start = received_at
+    if event.get('timestamp'):
+        start = min(start, event['timestamp'] / 1000.0)
+    return start + get_reply_token_ttl()
+
+
+def get_push_target(event):
+    """取得 push 的對象（群組或聊天室事件推送到群組或聊天室）"""
+    source = event.source
+    return getattr(source, 'group_id', None) or getattr(source, 'room_id', None) or source.user_id
+
+
+def closed_path(kind, name, known):
+    """組成統計用的處理路徑，名稱不在已知集合內時歸入 <kind>:other
+
+    處理路徑會出現在 /metrics，只能使用程式定義的路由、命令、流程步驟名稱，不能包含用戶輸入的文字。
+
+    Args:
+        kind: 路徑類別，例如 message、flow、postback
+        name: 處理函數名稱
+        known: 已知名稱的集合
+    """
+    return f"{kind}:{name if name in known else 'other'}"
+
+
+def is_invalid_reply_token(error):
+    """LINE 是否因 reply token 無效或過期而拒絕回覆"""
+    message = getattr(error.error, 'message', '') or ''
+    return error.status_code == 400 and 'reply token' in message.lower()
+
+
+OTHER_PATH = 'other'
+
+# 統計的處理路徑數上限，超過時歸入 other（處理路徑應為固定集合，此上限只是保護）
+MAX_STATS_PATHS = 200
+
+
+class ReplyDeadline:
+    """回覆期限追蹤與 push 後備"""
+
+    _lock = threading.Lock()
+    _deadlines = TTLCache(max_size=10000, ttl=300)
+    _stats = {}
+
+    @staticmethod
+    def track(events, received_at=None):
+        """記錄一批事件的 reply token 到期時間
+
+        Args:
+            events: 事件 JSON 字典列表
+            received_at: 收到請求的時間戳記
+        """
+        for event in events:
+            deadline = deadline_for(event, received_at)
+            if deadline is not None:
+                ReplyDeadline._deadlines.set(event['replyToken'], deadline)
+
+    @staticmethod
+    def remaining(event):
+        """事件 reply token 的剩餘秒數，未記錄時以事件時間推算"""
+        deadline = ReplyDeadline._deadlines.get(event.reply_token)
+        if deadline is None:
+            if event.timestamp:
+                deadline = event.timestamp / 1000.0 + get_reply_token_ttl()
+            else:
+                return get_reply_token_ttl()
+        return deadline - time.time()
+
+    @staticmethod
+    def should_push(event):
+        """是否應直接改用 push"""
+        if not event.reply_token:
+            return True
+        return ReplyDeadline.remaining(event) < get_reply_margin()
+
+    @staticmethod
+    def reply(line_bot_api, event, messages, path='unknown'):
+        """在期限內以 reply 回應，否則改用 push；LINE API 熔斷中時排入推送佇列
+
+        Args:
+            line_bot_api: LineBotApi 實例
+            event: LINE 事件
+            messages: 要發送的訊息
+            path: 統計用的處理路徑
+        """
+        if not LineClient.is_available():
+            PushDelivery.send(get_push_target(event), messages)
+            ReplyDeadline._record(event, path, 'deferred')
+            return
+
+        if ReplyDeadline.should_push(event):
+            line_bot_api.push_message(get_push_target(event), messages)
+            ReplyDeadline._record(event, path, 'expired')
+            return
+
+        try:
+            line_bot_api.reply_message(event.reply_token, messages)
+        except CircuitOpenError:
+            PushDelivery.send(get_push_target(event), messages)
+            ReplyDeadline._record(event, path, 'deferred')
+            return
+        except LineBotApiError as e:
+            if not is_invalid_reply_token(e):
+                raise
+            line_bot_api.push_message(get_push_target(event), messages)
+            ReplyDeadline._record(event, path, 'rejected')
+            return
+        ReplyDeadline._record(event, path, None)
+
+    @staticmethod
+    async def reply_async(line_bot_api, event, messages, path='unknown'):
+        """reply 的非同步版本，用於 AsyncLineBotApi"""
+        if ReplyDeadline.should_push(event):
+            await line_bot_api.push_message(get_push_target(event), messages)
+            ReplyDeadline._record(event, path, 'expired')
+            return
+
+        try:
+            await line_bot_api.reply_message(event.reply_token, messages)
+        except LineBotApiError as e:
+            if not is_invalid_reply_token(e):
+                raise
+            await line_bot_api.push_message(get_push_target(event), messages)
+            ReplyDeadline._record(event, path, 'rejected')
+            return
+        ReplyDeadline._record(event, path, None)
+
+    @staticmethod
+    def _record(event, path, fallback):
+        """記錄回覆結果
+
+        Args:
+            event: LINE 事件
+            path: 處理路徑
+            fallback: None 表示成功 reply；'expired' 為期限將至直接 push；'rejected' 為 LINE 拒絕後 push；
+                'deferred' 為熔斷中排入推送佇列
+        """
+        elapsed = None
+        if event.timestamp:
+            elapsed = max(time.time() - event.timestamp / 1000.0, 0.0)
+        if event.reply_token:
+            ReplyDeadline._deadlines.delete(event.reply_token)
+
+        with ReplyDeadline._lock:
+            if path not in ReplyDeadline._stats and len(ReplyDeadline._stats) >= MAX_STATS_PATHS:
+                path = OTHER_PATH
+            stats = ReplyDeadline._stats.setdefault(path, {
+                'replied': 0, 'expired': 0, 'rejected': 0, 'deferred': 0, 'max_elapsed': 0.0
+            })
+            stats[fallback or 'replied'] += 1
+            if elapsed is not None:
+                stats['max_elapsed'] = max(stats['max_elapsed'], round(elapsed, 3))
+
+        if fallback:
+            elapsed_text = f"{elapsed:.2f} 秒" if elapsed is not None else "未知"
+            logger.warning(f"reply token 無法使用（{fallback}），已改用 push: {path}，事件已經過 {elapsed_text}")
+
+    @staticmethod
+    def stats():
+        """各處理路徑的回覆統計，依改用 push 的次數排序"""
+        with ReplyDeadline._lock:
+            snapshot = {path: dict(stats) for path, stats in ReplyDeadline._stats.items()}
+        for stats in snapshot.values():
+            fallbacks = stats['expired'] + stats['rejected'] + stats['deferred']
+            stats['fallback_rate'] = round(fallbacks / (stats['replied'] + fallbacks), 4)
+        return dict(sorted(
+            snapshot.items(),
+            key=lambda item: item[1]['expired'] + item[1]['rejected'] + item[1]['deferred'],
+            reverse=True
+        ))
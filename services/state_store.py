@@ -0,0 +1,397 @@
+"""
+對話狀態儲存模組
+保存用戶進行中的對話流程（等待輸入金額、備註等），狀態閒置逾時或超過數量上限時移除；
+SQLite 後端讓多個 gunicorn 工作進程共用同一份狀態，用戶的訊息落在任一進程都能接續流程
+"""
+import os
+import abc
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from services.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+# 預設狀態檔案位置（與資料庫同放在 data 目錄）
+DEFAULT_STATE_PATH = os.path.join('data', 'user_states.db')
+
+
+class StateStore(abc.ABC):
+    """對話狀態儲存介面
+
+    以 dict 的方式使用（get、in、[]、del），值為可轉為 JSON 的字典。
+    讀取返回的是副本，修改狀態後需重新寫入。
+    存活時間為閒置時間：每次讀取或寫入都會重新計算；狀態數超過上限時淘汰最久未使用的狀態。
+    過期或被淘汰的狀態留下墓碑，用戶之後回來接續時可以告知流程已逾時。
+    """
+
+    def __init__(self, ttl=1800, max_entries=10000, tombstone_ttl=86400):
+        """初始化
+
+        Args:
+            ttl: 狀態的預設閒置存活時間（秒）
+            max_entries: 最大狀態數
+            tombstone_ttl: 墓碑保留時間（秒）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.tombstone_ttl = tombstone_ttl
+        self.counts = {'expired': 0, 'evicted': 0}
+        # 狀態逾時或被淘汰時呼叫，參數為 (key, state, reason)
+        self.on_expire = None
+
+    @abc.abstractmethod
+    def get(self, key, default=None):
+        """讀取狀態並延長存活時間，不存在或已過期時返回 default"""
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl=None):
+        """寫入狀態
+
+        Args:
+            key: 用戶 ID
+            value: 狀態字典
+            ttl: 閒置存活時間（秒），預設使用 self.ttl
+        """
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """刪除狀態（流程完成），返回是否存在"""
+
+    @abc.abstractmethod
+    def pop_expired(self, key):
+        """取出並移除用戶最近一次因逾時或淘汰而失效的狀態
+
+        Returns:
+            dict: 失效的狀態，沒有時返回 None
+        """
+
+    @abc.abstractmethod
+    def stats(self):
+        """狀態數、序列化後的位元組數與過期、淘汰次數"""
+
+    @abc.abstractmethod
+    def __len__(self):
+        """未過期的狀態數"""
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def pop(self, key, default=None):
+        """讀取並刪除狀態"""
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            return default
+        self.delete(key)
+        return value
+
+
+class MemoryStateStore(StateStore):
+    """本進程記憶體中的狀態儲存（單一工作進程時使用）
+
+    狀態以 JSON 字串保存，依最近使用排序，方便計算記憶體用量與淘汰。
+    """
+
+    def __init__(self, ttl=1800, max_entries=10000, tombstone_ttl=86400):
+        super().__init__(ttl, max_entries, tombstone_ttl)
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._tombstones = TTLCache(max_size=max_entries, ttl=tombstone_ttl)
+        self._lock = threading.Lock()
+
+    def _remove(self, key, reason=None):
+        """移除狀態（需持有鎖），reason 為 'expired' 或 'evicted' 時留下墓碑"""
+        data, _, _ = self._data.pop(key)
+        self.bytes -= len(data)
+        if reason:
+            self.counts[reason] += 1
+            self._tombstones.set(key, data)
+            if self.on_expire is not None:
+                self.on_expire(key, json.loads(data), reason)
+
+    def _sweep(self, now):
+        """從最久未使用的一端清除過期狀態（需持有鎖）"""
+        while self._data:
+            key, (_, expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            self._remove(key, 'expired')
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            data, expires_at, ttl = item
+            if expires_at <= now:
+                self._remove(key, 'expired')
+                return default
+            self._data[key] = (data, now + ttl, ttl)
+            self._data.move_to_end(key)
+        return json.loads(data)
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        ttl = ttl or self.ttl
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (data, now + ttl, ttl)
+            self.bytes += len(data)
+            self._tombstones.delete(key)
+            self._sweep(now)
+            while len(self._data) > self.max_entries:
+                self._remove(next(iter(self._data)), 'evicted')
+
+    def delete(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False
+            self._remove(key)
+            return item[1] > time.time()
+
+    def pop_expired(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] <= time.time():
+                self._remove(key, 'expired')
+        data = self._tombstones.get(key)
+        if data is None:
+            return None
+        self._tombstones.delete(key)
+        return json.loads(data)
+
+    def stats(self):
+        with self._lock:
+            self._sweep(time.time())
+            stats = {'entries': len(self._data), 'bytes': self.bytes}
+        stats.update(self.counts)
+        stats['tombstones'] = len(self._tombstones)
+        stats['max_entries'] = self.max_entries
+        return stats
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStateStore(StateStore):
+    """以 SQLite 檔案（WAL 模式）儲存的狀態，同一台機器上的工作進程共用"""
+
+    def __init__(self, path=DEFAULT_STATE_PATH, ttl=1800, max_entries=10000, tombstone_ttl=86400):
+        """初始化
+
+        Args:
+            path: SQLite 檔案路徑
+            ttl: 狀態的預設閒置存活時間（秒）
+            max_entries: 最大狀態數
+            tombstone_ttl: 墓碑保留時間（秒）
+        """
+        super().__init__(ttl, max_entries, tombstone_ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS user_states ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL,'
+                ' ttl REAL)'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(user_states)')]
+            if 'ttl' not in columns:
+                conn.execute('ALTER TABLE user_states ADD COLUMN ttl REAL')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_user_states_expires ON user_states (expires_at)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS expired_states ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' expired_at REAL NOT NULL)'
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key, default=None):
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT value FROM user_states WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    'UPDATE user_states SET expires_at = ? + COALESCE(ttl, ?) WHERE key = ?',
+                    (now, self.ttl, key)
+                )
+        finally:
+            conn.close()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        ttl = ttl or self.ttl
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO user_states (key, value, expires_at, ttl) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value, ensure_ascii=False), now + ttl, ttl)
+            )
+            conn.execute('DELETE FROM expired_states WHERE key = ?', (key,))
+            self._purge(conn, now)
+        finally:
+            conn.close()
+
+    def delete(self, key):
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'DELETE FROM user_states WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            )
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def pop_expired(self, key):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self._bury(conn, 'key = ? AND expires_at <= ?', (key, now), now, 'expired')
+            row = conn.execute(
+                'SELECT value FROM expired_states WHERE key = ? AND expired_at > ?',
+                (key, now - self.tombstone_ttl)
+            ).fetchone()
+            conn.execute('DELETE FROM expired_states WHERE key = ?', (key,))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def _bury(self, conn, where, params, now, reason):
+        """將符合條件的狀態移到墓碑表
+
+        Args:
+            where: 篩選狀態的 SQL 條件
+            params: 條件參數
+            now: 目前時間
+            reason: 'expired' 或 'evicted'
+        """
+        rows = conn.execute(f'SELECT key, value FROM user_states WHERE {where}', params).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            'INSERT OR REPLACE INTO expired_states (key, value, expired_at) VALUES (?, ?, ?)',
+            [(key, value, now) for key, value in rows]
+        )
+        conn.executemany('DELETE FROM user_states WHERE key = ?', [(key,) for key, _ in rows])
+        with self._lock:
+            self.counts[reason] += len(rows)
+        if self.on_expire is not None:
+            for key, value in rows:
+                self.on_expire(key, json.loads(value), reason)
+
+    def _purge(self, conn, now):
+        """每寫入一定數量後清除過期狀態、淘汰超過上限的狀態並清除舊墓碑"""
+        with self._lock:
+            self._writes += 1
+            if self._writes % 100:
+                return
+        self._bury(conn, 'expires_at <= ?', (now,), now, 'expired')
+        # 閒置存活時間相同時，到期時間越早表示越久未使用
+        self._bury(
+            conn,
+            'key IN (SELECT key FROM user_states ORDER BY expires_at LIMIT '
+            'MAX((SELECT COUNT(*) FROM user_states) - ?, 0))',
+            (self.max_entries,), now, 'evicted'
+        )
+        conn.execute('DELETE FROM expired_states WHERE expired_at <= ?', (now - self.tombstone_ttl,))
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            entries, size = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) '
+                'FROM user_states WHERE expires_at > ?', (time.time(),)
+            ).fetchone()
+            tombstones = conn.execute('SELECT COUNT(*) FROM expired_states').fetchone()[0]
+        finally:
+            conn.close()
+        stats = {'entries': entries, 'bytes': size}
+        stats.update(self.counts)
+        stats['tombstones'] = tombstones
+        stats['max_entries'] = self.max_entries
+        return stats
+
+    def __len__(self):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'SELECT COUNT(*) FROM user_states WHERE expires_at > ?', (time.time(),)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store():
+    """取得本進程使用的對話狀態儲存
+
+    STATE_STORE_BACKEND=sqlite 時使用 STATE_STORE_PATH 的共用檔案，否則使用本進程記憶體。
+    """
+    global _state_store
+    if _state_store is None:
+        with _state_store_lock:
+            if _state_store is None:
+                options = {
+                    'ttl': int(os.environ.get('STATE_TTL', '1800')),
+                    'max_entries': int(os.environ.get('STATE_MAX_ENTRIES', '10000')),
+                    'tombstone_ttl': int(os.environ.get('STATE_TOMBSTONE_TTL', '86400'))
+                }
+                backend = os.environ.get('STATE_STORE_BACKEND', 'memory').lower()
+                if backend == 'sqlite':
+                    path = os.environ.get('STATE_STORE_PATH', DEFAULT_STATE_PATH)
+                    _state_store = SQLiteStateStore(path, **options)
+                    logger.info(f"對話狀態使用共用 SQLite 儲存: {path}")
+                else:
+                    _state_store = MemoryStateStore(**options)
+    return _state_store
@@ -0,0 +1,183 @@
+"""
+時間表達式解析模組
+解析「明天早上9點」、「下午3點半」、「14:30」、「2023-5-20 14:30」等中文日期時間，
+正則表達式預先編譯，正規化後的輸入以 LRU 快取解析結果；
+任務提醒、筆記提醒與記帳查詢的時間範圍共用
+"""
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from collections import namedtuple
+
+# 相對日期，依序比對（「大後天」等未列出的說法視為包含的詞）
+RELATIVE_DAYS = (('今天', 0), ('明天', 1), ('後天', 2))
+
+# 時段關鍵字
+MORNING_WORDS = ('早上', '上午', '凌晨')
+AFTERNOON_WORDS = ('下午', '傍晚')
+EVENING_WORDS = ('晚上', '夜晚')
+
+DEFAULT_HOUR = 9
+DEFAULT_AFTERNOON_HOUR = 15
+DEFAULT_EVENING_HOUR = 20
+
+DATE_PATTERN = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+HOUR_MINUTE_PATTERN = re.compile(r'(\d+):(\d+)')
+HOUR_PATTERN = re.compile(r'([0-9]+)[點時:]')
+MINUTE_PATTERN = re.compile(r'([0-9]+)分')
+
+# 全形數字與冒號轉為半形
+FULLWIDTH_TABLE = str.maketrans('０１２３４５６７８９：', '0123456789:')
+
+# 記帳查詢的時間範圍與顯示名稱
+PERIOD_LABELS = {
+    'today': '今天',
+    'yesterday': '昨天',
+    'week': '本週',
+    'month': '本月'
+}
+
+# 台灣時間與 UTC 的時差（小時）
+TAIWAN_UTC_OFFSET = 8
+
+TimeSpec = namedtuple('TimeSpec', ['date', 'days', 'hour', 'minute'])
+TimeSpec.__doc__ = """解析結果：date 為 (年, 月, 日) 或 None，days 為相對今天的天數或 None（未指定日期）"""
+
+
+def normalize_time_text(text):
+    """快取與比對用的正規化：去除前後空白，全形數字轉半形"""
+    return (text or '').strip().translate(FULLWIDTH_TABLE)
+
+
+def _parse_minute(text):
+    minute_match = MINUTE_PATTERN.search(text)
+    if minute_match:
+        return int(minute_match.group(1))
+    if '半' in text:
+        return 30
+    return 0
+
+
+@lru_cache(maxsize=1024)
+def _parse_normalized(text):
+    date = None
+    days = None
+    date_match = DATE_PATTERN.search(text)
+    if date_match:
+        date = tuple(int(part) for part in date_match.groups())
+        # 去掉日期部分，避免日期中的數字被當成時間
+        text = text[:date_match.start()] + text[date_match.end():]
+    else:
+        for word, offset in RELATIVE_DAYS:
+            if word in text:
+                days = offset
+                break
+
+    # HH:MM 優先，其次為「N點/N時」加上「M分」或「半」
+    hour = None
+    minute = 0
+    hour_minute_match = HOUR_MINUTE_PATTERN.search(text)
+    if hour_minute_match:
+        hour = int(hour_minute_match.group(1))
+        minute = int(hour_minute_match.group(2))
+    else:
+        hour_match = HOUR_PATTERN.search(text)
+        if hour_match:
+            hour = int(hour_match.group(1))
+            minute = _parse_minute(text)
+
+    if any(word in text for word in MORNING_WORDS):
+        # 早上、凌晨的時間保持不變
+        if hour is None:
+            hour, minute = DEFAULT_HOUR, _parse_minute(text)
+    elif any(word in text for word in AFTERNOON_WORDS):
+        if hour is None:
+            hour, minute = DEFAULT_AFTERNOON_HOUR, _parse_minute(text)
+        elif 1 <= hour <= 11:
+            hour += 12  # 下午轉為 24 小時制，12 點為中午
+    elif any(word in text for word in EVENING_WORDS):
+        if hour is None:
+            hour, minute = DEFAULT_EVENING_HOUR, _parse_minute(text)
+        elif hour == 12:
+            hour = 0  # 晚上 12 點為午夜
+        elif 1 <= hour <= 11:
+            hour += 12
+    elif hour is None:
+        hour = DEFAULT_HOUR
+
+    return TimeSpec(date, days, hour, minute)
+
+
+def parse_time_spec(text):
+    """解析時間表達式，不套用目前時間
+
+    Args:
+        text: 時間文字，例如「明天早上9點」、「下午3點半」、「14:30」、「2023-5-20 14:30」
+
+    Returns:
+        TimeSpec: 未指定時間時為早上 9 點（只有下午、晚上時為 15、20 點）
+    """
+    return _parse_normalized(normalize_time_text(text))
+
+
+def resolve_time(text, now=None, default_days=1):
+    """將時間表達式轉為具體時間
+
+    Args:
+        text: 時間文字
+        now: 目前時間，預設為 datetime.now()
+        default_days: 未指定日期時相對今天的天數，預設為明天
+
+    Returns:
+        datetime: 秒數為 0 的時間
+
+    Raises:
+        ValueError: 日期或時間不存在（例如 2023-2-30、25點）
+    """
+    spec = parse_time_spec(text)
+    if spec.date is not None:
+        base = datetime(*spec.date)
+    else:
+        now = now or datetime.now()
+        base = now + timedelta(days=default_days if spec.days is None else spec.days)
+    return base.replace(hour=spec.hour, minute=spec.minute, second=0, microsecond=0)
+
+
+def period_start(period, utc_now=None):
+    """記帳查詢時間範圍的起點（以台灣時間計算日期，返回 UTC 時間）
+
+    Args:
+        period: today、yesterday、week 或 month
+        utc_now: 目前的 UTC 時間，預設為 datetime.utcnow()
+
+    Returns:
+        datetime: 範圍起點的 UTC 時間；不支援的範圍返回 None
+    """
+    taiwan_now = (utc_now or datetime.utcnow()) + timedelta(hours=TAIWAN_UTC_OFFSET)
+    if period == 'today':
+        start = datetime(taiwan_now.year, taiwan_now.month, taiwan_now.day)
+    elif period == 'yesterday':
+        yesterday = taiwan_now - timedelta(days=1)
+        start = datetime(yesterday.year, yesterday.month, yesterday.day)
+    elif period == 'week':
+        # 本週一
+        monday = taiwan_now - timedelta(days=taiwan_now.weekday())
+        start = datetime(monday.year, monday.month, monday.day)
+    elif period == 'month':
+        start = datetime(taiwan_now.year, taiwan_now.month, 1)
+    else:
+        return None
+    return start - timedelta(hours=TAIWAN_UTC_OFFSET)
+
+
+def get_parse_cache_stats():
+    """解析快取的命中統計"""
+    info = _parse_normalized.cache_info()
+    total = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': round(info.hits / total, 4) if total else 0.0
+    }
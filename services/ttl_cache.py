@@ -0,0 +1,107 @@
+"""
+快取模組
+提供有容量上限與存活時間的 LRU 快取
+"""
+import time
+import threading
+from collections import OrderedDict
+
+# 區分「未命中」與「快取值為 None」
+MISSING = object()
+
+
+class TTLCache:
+    """LRU + TTL 快取（執行緒安全）
+
+    超過容量時淘汰最久未使用的項目，超過存活時間的項目在讀取時視為不存在。
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        """初始化
+
+        Args:
+            max_size: 最大項目數
+            ttl: 項目存活時間（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """讀取項目，過期或不存在時返回 default"""
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is MISSING:
+                return default
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """寫入項目
+
+        Args:
+            key: 鍵
+            value: 值
+            ttl: 本項目的存活時間，預設使用快取設定
+        """
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def add(self, key, value=True, ttl=None):
+        """僅在項目不存在（或已過期）時寫入
+
+        Returns:
+            bool: 是否寫入
+        """
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is not MISSING and item[1] > now:
+                self._data.move_to_end(key)
+                return False
+            self._data[key] = (value, now + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        """刪除項目
+
+        Returns:
+            bool: 項目是否存在（且未過期）
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item is not None and item[1] > time.time()
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """未過期項目的快照
+
+        Returns:
+            list: (鍵, 值, 到期時間戳記) 列表，依最近使用排序
+        """
+        now = time.time()
+        with self._lock:
+            return [(key, value, expires_at) for key, (value, expires_at) in self._data.items()
+                    if expires_at > now]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
@@ -0,0 +1,298 @@
+"""
+Webhook 服務模組
+統一各入口的 LINE Webhook 處理流程
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from linebot.exceptions import InvalidSignatureError
+
+from services.event_queue import SQLiteEventQueue, EventWorkerPool, DEFAULT_QUEUE_PATH, dispatch_event
+from services.event_dispatcher import UserOrderedDispatcher
+from services.event_dedup import EventDeduplicator
+from services.reply_deadline import ReplyDeadline, get_reply_margin
+from services.admission_control import AdmissionController
+from services.affinity_router import AffinityRouter
+
+logger = logging.getLogger(__name__)
+
+
+def is_async_mode():
+    """是否啟用非同步模式（先回應 200，再由背景工作執行緒處理事件）"""
+    return os.environ.get('WEBHOOK_ASYNC_MODE', '').lower() in ('1', 'true', 'yes')
+
+
+def is_affinity_mode():
+    """是否啟用用戶親和路由（依用戶把事件轉給固定的工作進程處理）"""
+    return os.environ.get('WEBHOOK_AFFINITY', '').lower() in ('1', 'true', 'yes')
+
+
+class WebhookService:
+    """Webhook 處理服務"""
+
+    _lock = threading.RLock()
+    _queue = None
+    _pools = {}
+    _dispatcher = None
+    _deduplicator = None
+    _admission = None
+    _router = None
+    _pid = None
+
+    @staticmethod
+    def handle_webhook(handler, body, signature, app=None):
+        """處理 Webhook 請求
+
+        已處理過的事件（LINE 重送）會先被略過，過載時低價值事件會被延後或丟棄。
+        同步模式下依用戶分片並行處理同一批事件，處理完成後返回；
+        非同步模式下驗證簽名後將事件寫入佇列即返回；
+        親和路由模式下將事件轉給負責該用戶的工作進程後返回。
+
+        Args:
+            handler: WebhookHandler 實例
+            body: 請求內容
+            signature: X-Line-Signature 請求頭
+            app: Flask 應用，背景處理事件時用於建立應用上下文
+
+        Raises:
+            InvalidSignatureError: 簽名無效
+        """
+        if not handler.parser.signature_validator.validate(body, signature):
+            raise InvalidSignatureError('Invalid signature. signature=' + signature)
+
+        received_at = time.time()
+        payload = json.loads(body)
+        events = WebhookService.get_deduplicator().filter_events(payload.get('events', []))
+        if not events:
+            return
+
+        ReplyDeadline.track(events, received_at)
+        destination = payload.get('destination')
+
+        events, deferred = WebhookService.get_admission().partition(events)
+        if deferred:
+            WebhookService._enqueue(handler, app, deferred, destination, received_at,
+                                    delay=float(os.environ.get('ADMISSION_DEFER_SECONDS', '30')))
+        if not events:
+            return
+
+        if is_affinity_mode() and not is_async_mode():
+            try:
+                WebhookService.get_router(handler, app).route(events, destination)
+            except Exception:
+                WebhookService.get_deduplicator().release(events)
+                raise
+            return
+
+        if not is_async_mode():
+            WebhookService._dispatch_now(handler, events, destination, app)
+            return
+
+        WebhookService._enqueue(handler, app, events, destination, received_at)
+
+    @staticmethod
+    def _enqueue(handler, app, events, destination, received_at, delay=0):
+        """將事件寫入佇列並通知背景工作執行緒"""
+        queue = WebhookService.get_queue()
+        try:
+            count = queue.put(events, destination=destination, received_at=received_at, delay=delay)
+        except Exception:
+            # 未寫入佇列的事件取消去重記錄，讓 LINE 重送時重新處理
+            WebhookService.get_deduplicator().release(events)
+            raise
+        WebhookService._get_pool(handler, app).notify()
+        if delay:
+            logger.info(f"已將 {count} 個事件延後 {delay} 秒處理")
+        else:
+            logger.info(f"已將 {count} 個事件排入佇列")
+
+    @staticmethod
+    def _dispatch_now(handler, events, destination, app):
+        """在請求執行緒內處理事件，多個事件時依用戶分派到處理通道
+
+        處理失敗的事件取消去重記錄並拋出例外（Webhook 回應 500），LINE 重送時只重新處理這些事件。
+        """
+        admission = WebhookService.get_admission()
+        deduplicator = WebhookService.get_deduplicator()
+        dispatcher = WebhookService.get_dispatcher()
+        if dispatcher is None or len(events) == 1:
+            for index, event in enumerate(events):
+                try:
+                    with admission.track():
+                        dispatch_event(handler, event, destination)
+                except Exception:
+                    deduplicator.release(events[index:])
+                    raise
+            return
+
+        futures = dispatcher.dispatch(events, WebhookService._dispatch_tracked(handler, destination, app))
+        failed = [(event, future.exception()) for event, future in zip(events, futures)
+                  if future.exception() is not None]
+        if failed:
+            deduplicator.release([event for event, _ in failed])
+            raise failed[0][1]
+
+    @staticmethod
+    def _dispatch_tracked(handler, destination, app):
+        """建立在應用上下文中處理單一事件、並計入准入控制的函數"""
+        admission = WebhookService.get_admission()
+
+        def dispatch(event):
+            with admission.track():
+                if app is not None:
+                    with app.app_context():
+                        dispatch_event(handler, event, destination)
+                else:
+                    dispatch_event(handler, event, destination)
+
+        return dispatch
+
+    @staticmethod
+    def get_router(handler, app):
+        """取得本進程的親和路由器，首次使用時建立 socket
+
+        本進程負責的事件（包含其他進程轉來的事件）依用戶分派到處理通道，不等待處理完成；
+        處理失敗的事件取消去重記錄，讓 LINE 重送時重新處理。
+        """
+        WebhookService._reset_after_fork()
+        if WebhookService._router is None:
+            with WebhookService._lock:
+                if WebhookService._router is None:
+                    lanes = max(int(os.environ.get('WEBHOOK_DISPATCH_LANES', '4')), 1)
+                    dispatcher = UserOrderedDispatcher(lanes, name='affinity')
+
+                    def handle_events(events, destination):
+                        futures = dispatcher.dispatch(
+                            events, WebhookService._dispatch_tracked(handler, destination, app), wait=False
+                        )
+                        for event, future in zip(events, futures):
+                            future.add_done_callback(WebhookService._release_on_failure(event))
+
+                    socket_dir = os.environ.get('WEBHOOK_AFFINITY_DIR') or os.path.join(
+                        tempfile.gettempdir(), 'linebot-affinity'
+                    )
+                    router = AffinityRouter(socket_dir, handle_events)
+                    router.start()
+                    WebhookService._router = router
+        return WebhookService._router
+
+    @staticmethod
+    def _release_on_failure(event):
+        """建立 Future 完成時的回呼：事件處理失敗時記錄錯誤並取消去重記錄"""
+        def callback(future):
+            error = future.exception() if not future.cancelled() else 'cancelled'
+            if error is None:
+                return
+            logger.error(f"事件 {event.get('webhookEventId')} 處理失敗，已取消去重記錄等待 LINE 重送: {str(error)}")
+            WebhookService.get_deduplicator().release([event])
+
+        return callback
+
+    @staticmethod
+    def get_dispatcher():
+        """取得本進程的事件分派器，通道數設為 1 以下時停用"""
+        WebhookService._reset_after_fork()
+        lanes = int(os.environ.get('WEBHOOK_DISPATCH_LANES', '4'))
+        if lanes <= 1:
+            return None
+        if WebhookService._dispatcher is None:
+            with WebhookService._lock:
+                if WebhookService._dispatcher is None:
+                    WebhookService._dispatcher = UserOrderedDispatcher(lanes, name='webhook')
+        return WebhookService._dispatcher
+
+    @staticmethod
+    def affinity_stats():
+        """親和路由統計，本進程尚未啟用時返回 None"""
+        router = WebhookService._router
+        if router is None or WebhookService._pid != os.getpid():
+            return None
+        return router.stats()
+
+    @staticmethod
+    def get_deduplicator():
+        """取得本進程的事件去重器，設定 WEBHOOK_DEDUP_PATH 時跨工作進程共用"""
+        WebhookService._reset_after_fork()
+        if WebhookService._deduplicator is None:
+            with WebhookService._lock:
+                if WebhookService._deduplicator is None:
+                    WebhookService._deduplicator = EventDeduplicator(
+                        max_size=int(os.environ.get('WEBHOOK_DEDUP_SIZE', '10000')),
+                        ttl=int(os.environ.get('WEBHOOK_DEDUP_TTL', '3600')),
+                        db_path=os.environ.get('WEBHOOK_DEDUP_PATH') or None
+                    )
+        return WebhookService._deduplicator
+
+    @staticmethod
+    def get_admission():
+        """取得本進程的准入控制器，佇列深度在佇列建立後才計入"""
+        WebhookService._reset_after_fork()
+        if WebhookService._admission is None:
+            with WebhookService._lock:
+                if WebhookService._admission is None:
+                    WebhookService._admission = AdmissionController(
+                        max_in_flight=int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '20')),
+                        max_queue_depth=int(os.environ.get('ADMISSION_MAX_QUEUE_DEPTH', '200')),
+                        defer_threshold=float(os.environ.get('ADMISSION_DEFER_THRESHOLD', '0.8')),
+                        queue_depth=WebhookService._queue_depth
+                    )
+        return WebhookService._admission
+
+    @staticmethod
+    def _queue_depth():
+        queue = WebhookService._queue
+        return queue.qsize() if queue is not None else 0
+
+    @staticmethod
+    def get_queue():
+        """取得本進程的事件佇列"""
+        WebhookService._reset_after_fork()
+        if WebhookService._queue is None:
+            with WebhookService._lock:
+                if WebhookService._queue is None:
+                    path = os.environ.get('WEBHOOK_QUEUE_PATH', DEFAULT_QUEUE_PATH)
+                    WebhookService._queue = SQLiteEventQueue(path, deadline_margin=get_reply_margin())
+        return WebhookService._queue
+
+    @staticmethod
+    def _get_pool(handler, app):
+        """取得處理指定 handler 事件的工作執行緒池，首次使用時啟動"""
+        key = id(handler)
+        pool = WebhookService._pools.get(key)
+        if pool is None:
+            with WebhookService._lock:
+                pool = WebhookService._pools.get(key)
+                if pool is None:
+                    admission = WebhookService.get_admission()
+
+                    def dispatch(queued_event):
+                        with admission.track():
+                            if app is not None:
+                                with app.app_context():
+                                    dispatch_event(handler, queued_event.event, queued_event.destination)
+                            else:
+                                dispatch_event(handler, queued_event.event, queued_event.destination)
+
+                    workers = int(os.environ.get('WEBHOOK_WORKERS', '4'))
+                    pool = EventWorkerPool(WebhookService.get_queue(), dispatch, workers=workers)
+                    pool.start()
+                    WebhookService._pools[key] = pool
+        return pool
+
+    @staticmethod
+    def _reset_after_fork():
+        """gunicorn fork 後執行緒不會被繼承，需要重新建立"""
+        pid = os.getpid()
+        if WebhookService._pid != pid:
+            with WebhookService._lock:
+                if WebhookService._pid != pid:
+                    WebhookService._queue = None
+                    WebhookService._pools = {}
+                    WebhookService._dispatcher = None
+                    WebhookService._deduplicator = None
+                    WebhookService._admission = None
+                    WebhookService._router = None
+                    WebhookService._pid = pid
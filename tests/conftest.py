@@ -0,0 +1,14 @@
+"""
+測試共用設定
+將專案根目錄與 linebot-ai 目錄加入 Python 路徑（與各應用入口相同），
+模組層級建立的分類器不寫入共用的自訂關鍵字檔案（需要時測試自行建立）
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'linebot-ai')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault('USER_KEYWORDS_PATH', '')
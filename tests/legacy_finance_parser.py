@@ -0,0 +1,83 @@
+"""
+舊版記帳命令解析函數（逐一嘗試多個正則表達式）的凍結副本，不要修改
+作為 services/command_parser 等價性測試的基準，benchmarks/bench_finance_parser.py 也以此比較吞吐量
+"""
+import re
+
+# 舊版快速支出實際使用的分隔符號（「\ 到 －」的字元範圍，包含所有中文字與小寫字母）
+LEGACY_QUICK_EXPENSE_SEPARATOR = r'[\\-－]'
+
+
+def legacy_parse_transaction_command(text):
+    """舊版 FinanceService.parse_transaction_command"""
+    expense_pattern1 = r'^([\u4e00-\u9fa5a-zA-Z]+)-(\d+)(?:\s+(.+))?$'
+    expense_pattern2 = r'^([\u4e00-\u9fa5a-zA-Z]+)(\d+)(?:\s+(.+))?$'
+    expense_match1 = re.match(expense_pattern1, text)
+    expense_match2 = re.match(expense_pattern2, text)
+    income_pattern1 = r'^([\u4e00-\u9fa5a-zA-Z]+)\+(\d+)(?:\s+(.+))?$'
+    income_pattern2 = r'^收入(\d+)(?:\s+(.+))?$'
+    income_match1 = re.match(income_pattern1, text)
+    income_match2 = re.match(income_pattern2, text)
+    query_pattern = r'^(今天|昨天|本週|本月)$'
+    query_match = re.match(query_pattern, text)
+    monthly_pattern = r'^月報(?:(\d{4})-(\d{1,2}))?$'
+    monthly_match = re.match(monthly_pattern, text)
+    quick_expense_pattern = r'^([\u4e00-\u9fa5a-zA-Z]+)-(\d+)$'
+    quick_expense_match = re.match(quick_expense_pattern, text)
+
+    if quick_expense_match:
+        return {'type': 'quick_expense', 'category': quick_expense_match.group(1),
+                'amount': int(quick_expense_match.group(2))}
+    if expense_match1:
+        return {'type': 'expense', 'category': expense_match1.group(1),
+                'amount': int(expense_match1.group(2)), 'note': expense_match1.group(3)}
+    elif expense_match2:
+        return {'type': 'expense', 'category': expense_match2.group(1),
+                'amount': int(expense_match2.group(2)), 'note': expense_match2.group(3)}
+    elif income_match1:
+        return {'type': 'income', 'category': income_match1.group(1),
+                'amount': int(income_match1.group(2)), 'note': income_match1.group(3)}
+    elif income_match2:
+        return {'type': 'income', 'amount': int(income_match2.group(1)), 'note': income_match2.group(2)}
+    elif query_match:
+        period_mapping = {'今天': 'today', '昨天': 'yesterday', '本週': 'week', '本月': 'month'}
+        return {'type': 'query', 'period': period_mapping[query_match.group(1)]}
+    elif monthly_match:
+        year = int(monthly_match.group(1)) if monthly_match.group(1) else None
+        month = int(monthly_match.group(2)) if monthly_match.group(2) else None
+        return {'type': 'monthly', 'year': year, 'month': month}
+    return None
+
+
+def legacy_parse_quick_expense_command(text, separator=r'[-－]'):
+    """舊版 FinanceService.parse_quick_expense_command
+
+    舊版的字元類別寫成 [\\\\-－]，實際上是「\\ 到 －」的範圍（包含所有中文字與小寫字母），
+    新版修正為只接受 - 與 －；比對等價性時使用修正後的分隔符號
+    """
+    match = re.match(r'^(.+?)' + separator + r'([0-9,]+)$', text)
+    if match:
+        category_keyword = match.group(1).strip()
+        try:
+            amount = float(match.group(2).replace(',', ''))
+            return {'category_keyword': category_keyword, 'amount': amount, 'note': category_keyword}
+        except ValueError:
+            return None
+    return None
+
+
+def legacy_parse_amount_input(text):
+    """舊版 process_message 中的金額輸入解析"""
+    text_note_match = re.match(r'^([^\d]+)(\d[\d,.]+)$', text)
+    if text_note_match:
+        return float(text_note_match.group(2).replace(',', '')), text_note_match.group(1).strip()
+    return float(text), None
+
+
+def legacy_parse_message(text):
+    """舊版 process_message 的解析順序：先檢查快速支出，再解析記帳命令"""
+    quick_expense = legacy_parse_quick_expense_command(text)
+    if quick_expense:
+        return ('quick_expense', quick_expense['category_keyword'], quick_expense['amount'], quick_expense['note'])
+    command = legacy_parse_transaction_command(text)
+    return ('finance', command) if command else None
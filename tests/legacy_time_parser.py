@@ -0,0 +1,92 @@
+"""
+舊版提醒時間解析（每個時段分支重複 re.search）的凍結副本，不要修改
+作為 services/time_parser 等價性測試的基準，benchmarks/bench_time_parser.py 也以此比較吞吐量
+"""
+import re
+from datetime import datetime, timedelta
+
+
+def legacy_resolve_time(time_text, now):
+    """舊版 process_message 任務詳情分支中的提醒時間解析"""
+    reminder_time = now + timedelta(days=1)
+    hour = 9
+    minute = 0
+
+    if '今天' in time_text:
+        reminder_time = now
+    elif '明天' in time_text:
+        reminder_time = now + timedelta(days=1)
+    elif '後天' in time_text:
+        reminder_time = now + timedelta(days=2)
+
+    if '早上' in time_text or '上午' in time_text or '凌晨' in time_text:
+        hour_match = re.search(r'([0-9]+)[點時:]', time_text)
+        if hour_match:
+            hour = int(hour_match.group(1))
+        else:
+            hour = 9
+        minute_match = re.search(r'([0-9]+)分', time_text)
+        if minute_match:
+            minute = int(minute_match.group(1))
+        elif '半' in time_text:
+            minute = 30
+    elif '下午' in time_text or '傍晚' in time_text:
+        hour_match = re.search(r'([0-9]+)[點時:]', time_text)
+        if hour_match:
+            hour = int(hour_match.group(1))
+            if hour >= 1 and hour <= 12:
+                if hour == 12:
+                    hour = 12
+                else:
+                    hour += 12
+        else:
+            hour = 15
+        minute_match = re.search(r'([0-9]+)分', time_text)
+        if minute_match:
+            minute = int(minute_match.group(1))
+        elif '半' in time_text:
+            minute = 30
+    elif '晚上' in time_text or '夜晚' in time_text:
+        hour_match = re.search(r'([0-9]+)[點時:]', time_text)
+        if hour_match:
+            hour = int(hour_match.group(1))
+            if hour >= 1 and hour <= 12:
+                if hour == 12:
+                    hour = 0
+                else:
+                    hour += 12
+        else:
+            hour = 20
+        minute_match = re.search(r'([0-9]+)分', time_text)
+        if minute_match:
+            minute = int(minute_match.group(1))
+        elif '半' in time_text:
+            minute = 30
+    else:
+        hour_minute_match = re.search(r'(\d+):(\d+)', time_text)
+        if hour_minute_match:
+            hour = int(hour_minute_match.group(1))
+            minute = int(hour_minute_match.group(2))
+        else:
+            hour_match = re.search(r'([0-9]+)[點時:]', time_text)
+            if hour_match:
+                hour = int(hour_match.group(1))
+                minute_match = re.search(r'([0-9]+)分', time_text)
+                if minute_match:
+                    minute = int(minute_match.group(1))
+                elif '半' in time_text:
+                    minute = 30
+
+    return reminder_time.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+def legacy_note_reminder_time(time_str):
+    """舊版 NoteService.parse_note_command 的提醒時間解析（YYYY-MM-DD[ HH:MM]）"""
+    if ' ' in time_str:
+        date_part, time_part = time_str.split(' ')
+        date_parts = date_part.split('-')
+        time_parts = time_part.split(':')
+        return datetime(int(date_parts[0]), int(date_parts[1]), int(date_parts[2]),
+                        int(time_parts[0]), int(time_parts[1]))
+    date_parts = time_str.split('-')
+    return datetime(int(date_parts[0]), int(date_parts[1]), int(date_parts[2]), 9, 0)
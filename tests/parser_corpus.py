@@ -0,0 +1,67 @@
+"""
+解析器語料
+parser_corpus.jsonl 中的繁體中文訊息與預期解析結果，由 tests/test_parser_corpus.py 檢查，
+benchmarks/bench_parsers.py 也以同一份語料測量吞吐量
+
+語料格式（每行一個 JSON）:
+    {"parser": "finance_transaction", "text": "午餐120 麥當勞", "expected": {...}, "note": "選填說明"}
+
+注意：載入 linebot-ai 的 message_processor 時會建立 linebot-ai/data/notes.json（與執行該應用相同）。
+"""
+import os
+import json
+from datetime import datetime
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_corpus.jsonl')
+
+
+def to_json_value(value):
+    """將解析結果轉為可與語料比較的 JSON 值（datetime 轉為 ISO 字串，tuple 轉為 list）"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    return value
+
+
+def load_parsers():
+    """各解析器的名稱與呼叫方式，返回的結果都轉為 JSON 值"""
+    from services.finance_service import FinanceService
+    from services.note_service import NoteService
+    from services.command_parser import parse_message_command, parse_batch
+    from services.time_parser import parse_time_spec
+    from src.message_processor import parse_note_command
+    from src.services.ai_service import analyze_message
+
+    def message_command(text):
+        command = parse_message_command(text)
+        return dict(command._asdict()) if command else None
+
+    def finance_batch(text):
+        commands = parse_batch(text)
+        return [command.as_dict() for command in commands] if commands else None
+
+    return {
+        'finance_transaction': FinanceService.parse_transaction_command,
+        'finance_quick_expense': FinanceService.parse_quick_expense_command,
+        'message_command': message_command,
+        'finance_batch': finance_batch,
+        'note_command': NoteService.parse_note_command,
+        'time_expression': parse_time_spec,
+        'linebot_ai_note': parse_note_command,
+        'ai_analyze': lambda text: json.loads(analyze_message(text)),
+    }
+
+
+def load_corpus(path):
+    """讀取語料，依解析器分組"""
+    corpus = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                corpus.setdefault(item['parser'], []).append(item)
+    return corpus
@@ -0,0 +1,128 @@
+"""
+用戶親和路由測試
+"""
+import os
+import json
+import socket
+import threading
+
+import pytest
+
+from services.affinity_router import AffinityRouter, PeerConnection, SOCKET_PREFIX, SOCKET_SUFFIX
+
+
+def message_event(event_id, user_id='U1'):
+    return {
+        'type': 'message',
+        'source': {'type': 'user', 'userId': user_id},
+        'webhookEventId': event_id,
+        'message': {'id': '1', 'type': 'text', 'text': '早餐50'},
+    }
+
+
+class FakePeer:
+    """假的對方工作進程：記錄收到的每批事件，依 ack 決定回覆確認、直接斷線或不回應"""
+
+    def __init__(self, path, ack='ok'):
+        self.path = path
+        self.ack = ack
+        self.received = []
+        self._conns = []
+        self._closed = threading.Event()
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen(8)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            self._conns.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile('rb') as reader:
+            for line in reader:
+                self.received.append(json.loads(line)['events'])
+                if self.ack == 'ok':
+                    conn.sendall(b'ok\n')
+                elif self.ack == 'close':
+                    return
+                else:
+                    self._closed.wait(5)
+                    return
+
+    def close(self):
+        self._closed.set()
+        for conn in [self._server] + self._conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._server.close()
+
+
+@pytest.fixture
+def peer_router(tmp_path):
+    """只有一個對方工作進程的路由器：本進程未啟動 socket，所有用戶都歸對方負責"""
+    peers = []
+
+    def build(ack='ok'):
+        # 檔名中的進程 ID 必須存活，借用父進程的 ID
+        peer = FakePeer(str(tmp_path / f"{SOCKET_PREFIX}{os.getppid()}{SOCKET_SUFFIX}"), ack)
+        peers.append(peer)
+        handled = []
+        router = AffinityRouter(str(tmp_path), lambda events, destination: handled.append(events))
+        router._peers[peer.path] = PeerConnection(peer.path, timeout=0.5)
+        return router, peer, handled
+
+    yield build
+    for peer in peers:
+        peer.close()
+
+
+def test_forwards_to_owner(peer_router):
+    router, peer, handled = peer_router()
+    router.route([message_event('E1')], 'Ubot')
+    assert peer.received == [[message_event('E1')]]
+    assert handled == []
+    assert router.stats()['forwarded'] == 1
+
+
+@pytest.mark.parametrize('ack', ['close', 'timeout'])
+def test_lost_ack_is_not_processed_twice(peer_router, ack):
+    router, peer, handled = peer_router(ack)
+    router.route([message_event('E1')], 'Ubot')
+    # 對方已收到事件：不重送，也不在本進程處理
+    assert peer.received == [[message_event('E1')]]
+    assert handled == []
+    stats = router.stats()
+    assert stats['unconfirmed'] == 1
+    assert stats['fallback'] == 0
+
+
+def test_stale_connection_is_retried(peer_router):
+    router, peer, handled = peer_router()
+    router.route([message_event('E1')], 'Ubot')
+    # 對方重新啟動，原本的連線失效
+    peer.close()
+    os.unlink(peer.path)
+    restarted = FakePeer(peer.path)
+    try:
+        router.route([message_event('E2')], 'Ubot')
+        assert restarted.received == [[message_event('E2')]]
+        assert handled == []
+    finally:
+        restarted.close()
+
+
+def test_unreachable_owner_falls_back_to_local(peer_router):
+    router, peer, handled = peer_router()
+    peer.close()
+    router.route([message_event('E1')], 'Ubot')
+    assert peer.received == []
+    assert handled == [[message_event('E1')]]
+    assert router.stats()['fallback'] == 1
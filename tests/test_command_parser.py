@@ -0,0 +1,47 @@
+"""
+命令解析測試
+"""
+from services.command_parser import (
+    Command, parse_batch, parse_message_command, parse_message_commands
+)
+
+
+def test_single_line_commands():
+    assert parse_message_command('午餐120 麥當勞') == Command('expense', '午餐', 120, '麥當勞')
+    assert parse_message_command('薪資+33000') == Command('income', '薪資', 33000)
+    assert parse_message_command('早餐-500') == Command('quick_expense', '早餐', 500, '早餐')
+    assert parse_message_command('本月') == Command('query', period='month')
+    assert parse_message_command('你好') is None
+
+
+def test_batch_lines():
+    batch = parse_batch('早餐50\n午餐120 麥當勞\n 咖啡-65 \n\n薪資+1000')
+    assert [(command.type, command.category, command.amount) for command in batch] == [
+        ('expense', '早餐', 50), ('expense', '午餐', 120), ('expense', '咖啡', 65), ('income', '薪資', 1000)
+    ]
+    assert batch[1].note == '麥當勞'
+
+
+def test_batch_requires_every_line_to_parse():
+    assert parse_batch('早餐50') is None
+    assert parse_batch('早餐50\n今天') is None
+    assert parse_batch('早餐50\n你好') is None
+
+
+def test_two_line_batch_is_not_a_note():
+    # 單一命令的備註會跨行，兩行的訊息必須先以批次記帳解析
+    assert parse_message_command('早餐50\n午餐120').note == '午餐120'
+
+    command, batch = parse_message_commands('早餐50\n午餐120')
+    assert command is None
+    assert [(entry.category, entry.amount, entry.note) for entry in batch] == [('早餐', 50, None), ('午餐', 120, None)]
+
+
+def test_single_command_is_not_a_batch():
+    command, batch = parse_message_commands('午餐120 麥當勞')
+    assert command == Command('expense', '午餐', 120, '麥當勞')
+    assert batch is None
+
+    command, batch = parse_message_commands('午餐120\n麥當勞')
+    assert command == Command('expense', '午餐', 120, '麥當勞')
+    assert batch is None
@@ -0,0 +1,176 @@
+"""
+事件去重測試
+"""
+import json
+import time
+
+import pytest
+from linebot import WebhookHandler
+from linebot.models import MessageEvent, TextMessage
+
+from services.event_dedup import EventDeduplicator
+from services.event_queue import sign_body
+from services.webhook_service import WebhookService
+
+CHANNEL_SECRET = 'test-secret'
+
+
+def message_event(event_id, text='早餐50', user_id='U1'):
+    return {
+        'type': 'message',
+        'mode': 'active',
+        'timestamp': 1700000000000,
+        'source': {'type': 'user', 'userId': user_id},
+        'webhookEventId': event_id,
+        'deliveryContext': {'isRedelivery': False},
+        'replyToken': 'reply-token',
+        'message': {'id': '1', 'type': 'text', 'text': text},
+    }
+
+
+def test_second_delivery_is_duplicate():
+    deduplicator = EventDeduplicator()
+    assert not deduplicator.is_duplicate('E1')
+    assert deduplicator.is_duplicate('E1')
+    assert not deduplicator.is_duplicate(None)
+
+
+def test_forget_allows_reprocessing():
+    deduplicator = EventDeduplicator()
+    deduplicator.is_duplicate('E1')
+    deduplicator.forget('E1')
+    assert not deduplicator.is_duplicate('E1')
+
+
+def test_shared_file_across_processes(tmp_path):
+    path = str(tmp_path / 'dedup.db')
+    first = EventDeduplicator(db_path=path)
+    second = EventDeduplicator(db_path=path)
+    assert not first.is_duplicate('E1')
+    assert second.is_duplicate('E1')
+
+    # 取消記錄後，其他工作進程（未快取此事件）重新處理
+    first.release([{'webhookEventId': 'E1'}])
+    assert not EventDeduplicator(db_path=path).is_duplicate('E1')
+
+
+def test_filter_events_skips_duplicates():
+    deduplicator = EventDeduplicator()
+    events = [message_event('E1'), message_event('E1'), message_event('E2')]
+    assert [event['webhookEventId'] for event in deduplicator.filter_events(events)] == ['E1', 'E2']
+
+
+@pytest.fixture(params=['1', '4'], ids=['sequential', 'lanes'])
+def sync_webhook(request, monkeypatch):
+    """同步模式的 WebhookService（依序處理或分派到處理通道），每個測試使用新的去重器"""
+    monkeypatch.delenv('WEBHOOK_ASYNC_MODE', raising=False)
+    monkeypatch.delenv('WEBHOOK_AFFINITY', raising=False)
+    monkeypatch.delenv('WEBHOOK_DEDUP_PATH', raising=False)
+    monkeypatch.setenv('WEBHOOK_DISPATCH_LANES', request.param)
+    # 下一次取得服務元件時全部重新建立
+    monkeypatch.setattr(WebhookService, '_pid', None)
+    yield request.param
+    WebhookService._pid = None
+
+
+def post(handler, events):
+    body = json.dumps({'destination': 'Ubot', 'events': events}, ensure_ascii=False)
+    WebhookService.handle_webhook(handler, body, sign_body(handler, body))
+
+
+def test_failed_dispatch_is_processed_on_redelivery(sync_webhook):
+    handler = WebhookHandler(CHANNEL_SECRET)
+    calls = []
+
+    @handler.add(MessageEvent, message=TextMessage)
+    def handle(event):
+        calls.append(event.webhook_event_id)
+        if len(calls) == 1:
+            raise RuntimeError('database unavailable')
+
+    with pytest.raises(RuntimeError):
+        post(handler, [message_event('E1')])
+
+    # LINE 在 500 後重送同一事件，應重新處理而不是被當作重複事件略過
+    redelivered = message_event('E1')
+    redelivered['deliveryContext']['isRedelivery'] = True
+    post(handler, [redelivered])
+    assert calls == ['E1', 'E1']
+
+    # 成功處理後的重送仍然略過
+    post(handler, [redelivered])
+    assert calls == ['E1', 'E1']
+
+
+def test_only_failed_events_are_released(sync_webhook):
+    handler = WebhookHandler(CHANNEL_SECRET)
+    calls = []
+
+    @handler.add(MessageEvent, message=TextMessage)
+    def handle(event):
+        calls.append(event.webhook_event_id)
+        if event.webhook_event_id == 'E2' and calls.count('E2') == 1:
+            raise RuntimeError('database unavailable')
+
+    events = [message_event('E1'), message_event('E2'), message_event('E3', user_id='U2')]
+    with pytest.raises(RuntimeError):
+        post(handler, events)
+    first_round = sorted(calls)
+
+    # 重送整批：已處理的 E1 略過，失敗的 E2 與（依序處理時）尚未處理的 E3 重新處理
+    post(handler, events)
+    if sync_webhook == '1':
+        assert first_round == ['E1', 'E2']
+        assert calls[2:] == ['E2', 'E3']
+    else:
+        assert first_round == ['E1', 'E2', 'E3']
+        assert calls[3:] == ['E2']
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, '等待逾時'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def affinity_webhook(monkeypatch, tmp_path):
+    """親和路由模式的 WebhookService，只有本進程一個工作進程"""
+    monkeypatch.delenv('WEBHOOK_ASYNC_MODE', raising=False)
+    monkeypatch.delenv('WEBHOOK_DEDUP_PATH', raising=False)
+    monkeypatch.setenv('WEBHOOK_AFFINITY', '1')
+    monkeypatch.setenv('WEBHOOK_AFFINITY_DIR', str(tmp_path))
+    monkeypatch.setenv('WEBHOOK_DISPATCH_LANES', '4')
+    monkeypatch.setattr(WebhookService, '_pid', None)
+    yield
+    if WebhookService._router is not None:
+        WebhookService._router.stop()
+    WebhookService._pid = None
+
+
+def test_affinity_failed_event_is_processed_on_redelivery(affinity_webhook):
+    handler = WebhookHandler(CHANNEL_SECRET)
+    calls = []
+
+    @handler.add(MessageEvent, message=TextMessage)
+    def handle(event):
+        calls.append(event.webhook_event_id)
+        if len(calls) == 1:
+            raise RuntimeError('database unavailable')
+
+    # 親和路由不等待處理完成，Webhook 已回應 200；失敗的事件在背景取消去重記錄
+    post(handler, [message_event('E1')])
+    deduplicator = WebhookService.get_deduplicator()
+    wait_until(lambda: deduplicator._cache.get('E1') is None)
+
+    redelivered = message_event('E1')
+    redelivered['deliveryContext']['isRedelivery'] = True
+    post(handler, [redelivered])
+    wait_until(lambda: len(calls) == 2)
+
+    # 成功處理後的重送仍然略過
+    hits = deduplicator.hits
+    post(handler, [redelivered])
+    assert deduplicator.hits == hits + 1
+    assert calls == ['E1', 'E1']
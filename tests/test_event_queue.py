@@ -0,0 +1,70 @@
+"""
+Webhook 事件佇列測試
+"""
+import time
+
+import pytest
+
+from services.event_queue import SQLiteEventQueue
+
+
+def event(user_id, text='早餐50'):
+    return {
+        'type': 'message',
+        'source': {'type': 'user', 'userId': user_id},
+        'message': {'id': '1', 'type': 'text', 'text': text},
+    }
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteEventQueue(path=str(tmp_path / 'queue.db'), lease_seconds=0.1, max_attempts=2, retry_delay=0)
+
+
+def test_claim_and_ack(queue):
+    assert queue.put([event('U1')], destination='D') == 1
+    claimed = queue.claim()
+    assert claimed.event['source']['userId'] == 'U1'
+    assert claimed.destination == 'D'
+    assert claimed.attempts == 1
+
+    queue.ack(claimed.id)
+    assert queue.claim() is None
+    assert queue.qsize() == 0
+
+
+def test_expired_lease_is_claimed_again(queue):
+    queue.put([event('U1')])
+    claimed = queue.claim()
+    # 租約期間不會被其他工作執行緒取出
+    assert queue.claim() is None
+
+    # 處理中的進程當機，租約到期後重新取出
+    time.sleep(0.15)
+    reclaimed = queue.claim()
+    assert reclaimed.id == claimed.id
+    assert reclaimed.attempts == 2
+
+
+def test_events_of_one_user_are_claimed_in_order(queue):
+    queue.put([event('U1', '第一筆'), event('U1', '第二筆'), event('U2')])
+    first = queue.claim()
+    other = queue.claim()
+    assert first.event['message']['text'] == '第一筆'
+    assert other.event['source']['userId'] == 'U2'
+    # U1 的第一筆完成前不取出第二筆
+    assert queue.claim() is None
+
+    queue.ack(first.id)
+    assert queue.claim().event['message']['text'] == '第二筆'
+
+
+def test_failed_event_is_retried_then_marked_failed(queue):
+    queue.put([event('U1')])
+    queue.nack(queue.claim())
+    retried = queue.claim()
+    assert retried.attempts == 2
+
+    queue.nack(retried)
+    assert queue.claim() is None
+    assert queue.qsize() == 0
@@ -0,0 +1,118 @@
+"""
+記帳命令解析的等價性測試
+services/command_parser 的解析結果必須與舊版解析函數（tests/legacy_finance_parser）相同，
+唯一刻意的差異是快速支出的分隔符號只接受 - 與 －
+"""
+import random
+
+import pytest
+
+from services.command_parser import (
+    parse_finance_command, parse_quick_expense, parse_message_command, parse_amount_input
+)
+from tests.legacy_finance_parser import (
+    LEGACY_QUICK_EXPENSE_SEPARATOR, legacy_parse_transaction_command, legacy_parse_quick_expense_command,
+    legacy_parse_amount_input, legacy_parse_message
+)
+
+
+# ---- 新版解析結果轉為舊版的格式 ----
+
+def new_parse_transaction_command(text):
+    command = parse_finance_command(text)
+    return command.as_dict() if command else None
+
+
+def new_parse_quick_expense_command(text):
+    command = parse_quick_expense(text)
+    if command:
+        return {'category_keyword': command.category, 'amount': command.amount, 'note': command.note}
+    return None
+
+
+def new_parse_message(text):
+    command = parse_message_command(text)
+    if command is None:
+        return None
+    if command.type == 'quick_expense' and command.note is not None:
+        return ('quick_expense', command.category, command.amount, command.note)
+    return ('finance', command.as_dict())
+
+
+PARSERS = [
+    ('parse_transaction_command', legacy_parse_transaction_command, new_parse_transaction_command),
+    ('parse_quick_expense_command', legacy_parse_quick_expense_command, new_parse_quick_expense_command),
+    ('process_message', legacy_parse_message, new_parse_message),
+    ('parse_amount_input', legacy_parse_amount_input, parse_amount_input),
+]
+
+
+def call(parse, text):
+    """執行解析函數，例外以類型名稱表示以便比對"""
+    try:
+        return parse(text)
+    except Exception as e:
+        return type(e).__name__
+
+
+def mismatches(samples):
+    """新舊解析結果不一致的項目"""
+    return [
+        (name, text, call(legacy, text), call(new, text))
+        for text in samples
+        for name, legacy, new in PARSERS
+        if call(legacy, text) != call(new, text)
+    ]
+
+
+# ---- 測試樣本 ----
+
+FIXED_SAMPLES = [
+    '早餐-50', '早餐-500', '午餐120', '午餐120 麥當勞', '早餐-50 麥當勞', '晚餐 120', 'lunch88', 'Coffee-65',
+    '薪資+33000', '獎金+5000 年終', '收入5000', '收入5000 薪資', '收入+100',
+    '今天', '昨天', '本週', '本月', '今天 ', '本月報',
+    '月報', '月報2023-5', '月報2024-12', '月報2024-123', '月報-5',
+    '星巴克－1,200', '計程車-1,2,3', '早餐-,', '午餐120 a-,', '早 餐-50', '早餐--50', '早餐-50\n',
+    '1-2', '-500', '餐-', '交通-５０', '交通５０', '交通50  公車',
+    'help', '幫助', '初始化', '記錄', '任務：開會 提醒：明天9點', '', ' ', '50', '12.5', '1,234.56',
+    '早餐500', '咖啡 85', 'abc123', '早餐5O0',
+]
+
+ALPHABET = ['早', '餐', '午', '薪', '資', '收', '入', '月', '報', '今', '天', 'a', 'B', 'z',
+            '0', '1', '5', '9', '-', '－', '+', ',', '.', ' ', '\n', '：', '@']
+
+
+def random_samples(count, seed):
+    """由少量字元隨機組成的訊息，涵蓋分隔符號、空白、逗號等邊界情況"""
+    rng = random.Random(seed)
+    return [''.join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+@pytest.mark.parametrize('text', FIXED_SAMPLES)
+def test_fixed_samples_match_legacy(text):
+    assert mismatches([text]) == []
+
+
+@pytest.mark.parametrize('seed', [42, 7])
+def test_random_samples_match_legacy(seed):
+    assert mismatches(random_samples(10000, seed)) == []
+
+
+# ---- 刻意的差異：快速支出的分隔符號 ----
+
+@pytest.mark.parametrize('text, expected', [
+    ('早餐-500', ('早餐', 500.0)),
+    ('星巴克－1,200', ('星巴克', 1200.0)),
+    ('早餐--50', ('早餐-', 50.0)),
+])
+def test_quick_expense_separators(text, expected):
+    command = parse_quick_expense(text)
+    assert (command.category, command.amount) == expected
+
+
+@pytest.mark.parametrize('text', ['午餐120', 'lunch88', '早餐500', '收入5000'])
+def test_quick_expense_separator_is_not_a_character_range(text):
+    # 舊版的 [\\-－] 是「\ 到 －」的範圍，把「午餐120」當成關鍵字「午」的快速支出
+    assert legacy_parse_quick_expense_command(text, LEGACY_QUICK_EXPENSE_SEPARATOR) is not None
+    assert parse_quick_expense(text) is None
+    assert parse_message_command(text).type != 'quick_expense'
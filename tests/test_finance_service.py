@@ -0,0 +1,54 @@
+"""
+記帳服務測試（使用記憶體中的 SQLite 資料庫）
+"""
+import pytest
+from flask import Flask
+
+from models import db, Transaction, Account
+from services.command_parser import parse_message_commands
+from services.finance_service import FinanceService
+
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+def recorded(user_id):
+    return [(transaction.category.name, transaction.amount, transaction.note)
+            for transaction in Transaction.query.filter_by(user_id=user_id).order_by(Transaction.id)]
+
+
+@pytest.mark.parametrize('text', ['早餐50', '午餐120 麥當勞', '計程車250', '雜項30', '薪資+1000'])
+def test_same_category_alone_or_in_batch(app_context, text):
+    command, _ = parse_message_commands(text)
+    FinanceService.execute_command(command, 'alone')
+
+    _, batch = parse_message_commands(f"{text}\n咖啡65")
+    FinanceService.add_transactions_batch('batched', batch)
+
+    assert recorded('alone')[0] == recorded('batched')[0]
+
+
+def test_keyword_category_keeps_original_text_as_note(app_context):
+    FinanceService.add_transaction('U1', 50, '早餐')
+    FinanceService.add_transaction('U1', 30, '雜項', note='無')
+    FinanceService.add_transaction('U1', 200, '交通', note='加油')
+    assert recorded('U1') == [('餐飲', 50, '早餐'), ('其他', 30, '雜項'), ('交通', 200, '加油')]
+
+
+def test_batch_is_one_commit(app_context):
+    _, batch = parse_message_commands('早餐50\n午餐120\n薪資+1000')
+    response = FinanceService.add_transactions_batch('U1', batch)
+
+    assert response.startswith('已記錄 3 筆交易')
+    assert len(recorded('U1')) == 3
+    assert Account.query.filter_by(user_id='U1', name='默認').one().balance == 830
@@ -0,0 +1,92 @@
+"""
+對話流程引擎測試
+"""
+import time
+
+import pytest
+
+from services.flow_engine import FlowEngine
+from services.state_store import MemoryStateStore
+
+
+@pytest.fixture
+def engine():
+    """記帳流程：輸入金額（無效時重新輸入）→ 輸入備註 → 完成"""
+    flows = FlowEngine(MemoryStateStore())
+
+    @flows.step('transaction', 'amount')
+    def amount(ctx):
+        try:
+            value = float(ctx.text)
+        except ValueError:
+            return ctx.retry('請輸入有效的金額')
+        return ctx.next('note', '請輸入備註', amount=value)
+
+    @flows.step('transaction', 'note')
+    def note(ctx):
+        return ctx.done(f"已記錄 {ctx.state['category']} ${ctx.state['amount']:g}，備註：{ctx.text}")
+
+    @flows.step('account', 'account_name')
+    def account_name(ctx):
+        if ctx.text == '失敗':
+            raise RuntimeError('database unavailable')
+        return ctx.hold('請選擇帳戶類型', name=ctx.text)
+
+    return flows
+
+
+def test_steps_advance_and_finish(engine):
+    engine.start('U1', 'transaction', 'amount', category='餐飲')
+    assert engine.handle('U1', 'abc') == '請輸入有效的金額'
+    assert engine.store.get('U1')['waiting_for'] == 'amount'
+
+    assert engine.handle('U1', '120') == '請輸入備註'
+    state = engine.store.get('U1')
+    assert (state['flow'], state['waiting_for'], state['amount'], state['category']) == \
+        ('transaction', 'note', 120.0, '餐飲')
+
+    assert engine.handle('U1', '麥當勞') == '已記錄 餐飲 $120，備註：麥當勞'
+    assert 'U1' not in engine.store
+
+
+def test_user_without_flow_is_not_handled(engine):
+    assert engine.handle('U1', '120') is None
+    assert engine.handle('U1', '120', {'waiting_for': 'unknown_step'}) is None
+
+
+def test_legacy_state_without_flow_name(engine):
+    # 流程引擎之前寫入的狀態只有 waiting_for，依步驟名稱找到流程
+    engine.store.set('U1', {'waiting_for': 'note', 'category': '交通', 'amount': 35})
+    assert engine.handle('U1', '捷運') == '已記錄 交通 $35，備註：捷運'
+
+
+def test_hold_keeps_data_without_waiting_for_input(engine):
+    engine.start('U1', 'account', 'account_name')
+    assert engine.handle('U1', '信用卡') == '請選擇帳戶類型'
+    assert engine.store.get('U1') == {'name': '信用卡'}
+    assert engine.handle('U1', '其他文字') is None
+
+
+def test_handler_error_keeps_state(engine):
+    engine.start('U1', 'account', 'account_name')
+    with pytest.raises(RuntimeError):
+        engine.handle('U1', '失敗')
+    assert engine.store.get('U1')['waiting_for'] == 'account_name'
+    assert engine.stats()['account:account_name']['errors'] == 1
+
+
+def test_stats_count_retries_and_abandoned_steps(engine):
+    engine.start('U1', 'transaction', 'amount', category='餐飲')
+    engine.handle('U1', 'abc')
+    engine.handle('U1', '50')
+    engine.store.set('U2', dict(engine.store.get('U1'), amount=80), ttl=0.05)
+    time.sleep(0.06)
+    # 逾時的狀態在下次讀取時移除，計入所在步驟的放棄次數
+    assert engine.store.get('U2') is None
+
+    stats = engine.stats()
+    assert stats['transaction:amount']['retried'] == 1
+    assert stats['transaction:amount']['completed'] == 1
+    assert stats['transaction:note']['abandoned'] == 1
+    assert stats['transaction:note']['abandon_rate'] == 1.0
+    assert list(stats)[0] == 'transaction:note'
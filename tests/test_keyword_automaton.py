@@ -0,0 +1,87 @@
+"""
+關鍵字自動機與自訂類別測試
+"""
+import pytest
+
+from services.keyword_automaton import KeywordAutomaton, KeywordClassifier, UserKeywordStore
+
+ENTRIES = [
+    ('餐', ('category', '餐飲'), None),
+    ('咖啡', ('category', '餐飲'), None),
+    ('車', ('category', '交通'), None),
+    ('計程車', ('category', '交通'), None),
+]
+
+
+def test_automaton_finds_overlapping_keywords():
+    automaton = KeywordAutomaton([('he', 'a', None), ('she', 'b', None), ('hers', 'c', None)])
+    assert sorted(keyword for _, keyword, _, _ in automaton.find_all('USHERS')) == ['he', 'hers', 'she']
+
+
+def test_classifier_ranks_by_weight():
+    classifier = KeywordClassifier(ENTRIES)
+    assert classifier.classify('計程車去吃早餐')['category'] == [('交通', 4), ('餐飲', 1)]
+    assert classifier.best('買書', 'category', default='其他') == '其他'
+
+
+def test_user_category_only_applies_to_that_user():
+    classifier = KeywordClassifier(ENTRIES)
+    classifier.add_user_category('U1', '寵物', ('貓砂',))
+    assert classifier.best('貓砂', 'category', 'U1') == '寵物'
+    assert classifier.best('貓砂', 'category', 'U2') is None
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UserKeywordStore(str(tmp_path / 'keywords.db'))
+
+
+def test_user_categories_survive_restart(store):
+    KeywordClassifier(ENTRIES, store=store).add_user_category('U1', '寵物')
+    restarted = KeywordClassifier(ENTRIES, store=store)
+    assert restarted.best('寵物飼料', 'category', 'U1') == '寵物'
+
+
+def test_categories_are_shared_between_classifiers(store):
+    # 記帳機器人與 linebot-ai 的分類器標籤不同，但讀取同一份自訂類別
+    finance = KeywordClassifier(ENTRIES, store=store, reload_seconds=0)
+    ai = KeywordClassifier([('food', ('category', 'food'), None)], store=store, reload_seconds=0)
+    assert ai.best('寵物', 'category', 'U1') is None
+
+    finance.add_user_category('U1', '寵物')
+    assert ai.best('寵物', 'category', 'U1') == '寵物'
+
+
+def test_other_workers_see_new_categories_after_reload(store):
+    worker = KeywordClassifier(ENTRIES, store=store, reload_seconds=60)
+    assert worker.best('健身', 'category', 'U1') is None
+
+    KeywordClassifier(ENTRIES, store=store).add_user_category('U1', '健身')
+    # 重新讀取的間隔內沿用已載入的關鍵字
+    assert worker.best('健身', 'category', 'U1') is None
+    worker._loaded.delete('U1')
+    assert worker.best('健身', 'category', 'U1') == '健身'
+
+
+def test_least_recently_used_users_are_evicted(store):
+    classifier = KeywordClassifier(ENTRIES, store=store, max_users=2)
+    classifier.add_user_category('U1', '寵物')
+    classifier.add_user_category('U2', '健身')
+    classifier.best('寵物', 'category', 'U1')
+    classifier.add_user_category('U3', '園藝')
+    # U2 最久未使用而被淘汰，本進程最多保留 max_users 個用戶
+    assert len(classifier._users) == 2
+    assert 'U2' not in classifier._users
+    assert classifier.stats()['users'] == 2
+
+    # 被淘汰的用戶下次使用時從共用檔案重新讀取
+    assert classifier.best('健身', 'category', 'U2') == '健身'
+    assert len(classifier._users) == 2
+
+
+def test_duplicate_keywords_are_stored_once(store):
+    classifier = KeywordClassifier(ENTRIES, store=store)
+    classifier.add_user_category('U1', '寵物')
+    classifier.add_user_category('U1', '寵物')
+    assert len(store.load('U1')) == 1
+    assert classifier.classify('寵物', 'U1')['category'] == [('寵物', 2)]
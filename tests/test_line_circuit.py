@@ -0,0 +1,100 @@
+"""
+LINE API 熔斷測試
+"""
+import time
+from collections import namedtuple
+
+import pytest
+
+from services.line_circuit import (
+    CircuitBreaker, CircuitOpenError, LatencyHistogram, LineCircuit, CLOSED, OPEN, HALF_OPEN
+)
+
+Response = namedtuple('Response', ['status_code'])
+
+PUSH_URL = 'https://api.line.me/v2/bot/message/push'
+
+
+def connection_reset():
+    raise ConnectionError('connection reset')
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record(False, 0.01)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record(False, 0.01)
+    breaker.record(False, 0.01)
+    # 成功的請求重設連續失敗次數
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+
+    open_breaker(breaker)
+    assert breaker.state == OPEN
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=0.5)
+    breaker.record(True, 1.0)
+    breaker.record(True, 1.0)
+    assert breaker.state == OPEN
+    assert breaker.stats()['slow_calls'] == 2
+
+
+def test_half_open_allows_one_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # 試探請求完成前其他請求立即失敗
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+
+    breaker.before_call()
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+    assert breaker.stats()['opened'] == 2
+
+
+def test_line_circuit_records_server_errors():
+    circuit = LineCircuit(CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    assert circuit.call(PUSH_URL, lambda: Response(400)).status_code == 400
+    circuit.call(PUSH_URL, lambda: Response(500))
+    with pytest.raises(ConnectionError):
+        circuit.call(PUSH_URL, connection_reset)
+
+    assert circuit.is_open()
+    with pytest.raises(CircuitOpenError):
+        circuit.call(PUSH_URL, lambda: Response(200))
+    latency = circuit.stats()['latency']
+    assert sum(histogram['count'] for histogram in latency.values()) == 3
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram(buckets=(0.1, 1))
+    for seconds in (0.05, 0.05, 0.05, 0.5, 3):
+        histogram.observe(seconds)
+    assert histogram.percentile(0.5) == 0.1
+    assert histogram.percentile(0.8) == 1
+    assert histogram.percentile(1.0) == 3
+    assert histogram.snapshot()['buckets'] == {'le_0.1': 3, 'le_1': 1, 'le_inf': 1}
@@ -0,0 +1,19 @@
+"""
+linebot-ai 共用模組路徑測試
+只有 linebot-ai 目錄在 Python 路徑中時（與各應用入口相同），載入 src 套件即可使用上層的 services 模組
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_src_bootstraps_shared_services():
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONPATH'}
+    env['USER_KEYWORDS_PATH'] = ''
+    result = subprocess.run(
+        [sys.executable, '-c', 'import src.services.ai_service, services.webhook_service'],
+        cwd=os.path.join(ROOT, 'linebot-ai'), env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,87 @@
+"""
+模型後端測試：批次、快取與錯誤處理（以假的後端取代模型伺服器）
+"""
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.services.model_backend import (
+    ModelBackend, ModelBackendError, ModelClient, normalize_text, parse_model_output
+)
+
+
+class FakeBackend(ModelBackend):
+    """以提示詞最後一行的輸入產生結果，記錄每次呼叫的批次"""
+
+    def __init__(self, latency=0.02, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def complete_batch(self, prompts):
+        with self._lock:
+            self.batches.append(len(prompts))
+        time.sleep(self.latency)
+        if self.fail:
+            raise ModelBackendError('model server unavailable')
+        return [json.dumps({'type': 'accounting', 'details': {'input': prompt.splitlines()[-1]}})
+                for prompt in prompts]
+
+
+def test_model_backend_is_abstract():
+    with pytest.raises(TypeError):
+        ModelBackend()
+
+
+def test_parse_model_output():
+    assert parse_model_output('結果：```json\n{"type": "task"}\n```') == {'type': 'task', 'details': {}}
+    with pytest.raises(ModelBackendError):
+        parse_model_output('無法判斷')
+    with pytest.raises(ModelBackendError):
+        parse_model_output('{"content": "午餐"}')
+
+
+def test_normalize_text():
+    assert normalize_text('  午餐１２０  ') == normalize_text('午餐120') == '午餐120'
+    assert normalize_text('Lunch  120') == 'lunch 120'
+
+
+def test_concurrent_requests_are_batched_and_cached():
+    backend = FakeBackend()
+    client = ModelClient(backend, max_batch=8, batch_wait=0.05)
+    texts = [f"午餐{amount}" for amount in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(client.analyze, texts))
+
+    assert [result['content'] for result in results] == texts
+    assert sum(backend.batches) == 8
+    assert len(backend.batches) < 8
+
+    # 相同訊息（正規化後）命中快取，不再呼叫模型
+    calls = len(backend.batches)
+    assert client.analyze('午餐０').get('content') == '午餐０'
+    assert len(backend.batches) == calls
+    assert client.stats()['hits'] == 1
+
+
+def test_lone_request_does_not_wait_for_timeout():
+    client = ModelClient(FakeBackend(latency=0), batch_wait=0.02, timeout=5)
+    client.analyze('早餐50')
+    started = time.perf_counter()
+    client.analyze('晚餐200')
+    assert time.perf_counter() - started < 1
+
+
+def test_backend_failure_is_raised_and_not_cached():
+    backend = FakeBackend(fail=True)
+    client = ModelClient(backend, batch_wait=0.01)
+    with pytest.raises(ModelBackendError):
+        client.analyze('午餐120')
+
+    backend.fail = False
+    assert client.analyze('午餐120')['type'] == 'accounting'
+    assert client.stats()['errors'] == 1
@@ -0,0 +1,56 @@
+"""
+解析器語料測試
+每則語料訊息的解析結果必須與預期相同；KNOWN_MISMATCHES 為語料中記錄的已知差異（預期結果為應有的行為），
+修正後必須從清單中移除
+"""
+import os
+import shutil
+
+import pytest
+
+from tests.parser_corpus import CORPUS_PATH, load_corpus, load_parsers, to_json_value
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'linebot-ai', 'data')
+
+# (解析器, 訊息)
+KNOWN_MISMATCHES = {
+    ('finance_transaction', '收入5000'),
+    ('finance_transaction', '收入5000 兼職'),
+    ('note_command', '筆記 12'),
+}
+
+CORPUS = [
+    pytest.param(name, item, id=f"{name}:{item['text']}")
+    for name, items in load_corpus(CORPUS_PATH).items()
+    for item in items
+]
+
+
+@pytest.fixture(scope='module')
+def parsers():
+    # 載入 message_processor 會建立 linebot-ai/data，測試結束後移除測試建立的目錄
+    created = not os.path.exists(DATA_DIR)
+    yield load_parsers()
+    if created:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+def parse(parser, text):
+    try:
+        return to_json_value(parser(text))
+    except Exception as e:
+        return {'error': type(e).__name__}
+
+
+@pytest.mark.parametrize('name, item', CORPUS)
+def test_corpus(parsers, name, item):
+    actual = parse(parsers[name], item['text'])
+    if (name, item['text']) in KNOWN_MISMATCHES:
+        assert actual != item['expected'], '已知差異已修正，請從 KNOWN_MISMATCHES 移除'
+    else:
+        assert actual == item['expected']
+
+
+def test_every_corpus_parser_is_registered(parsers):
+    assert set(load_corpus(CORPUS_PATH)) <= set(parsers)
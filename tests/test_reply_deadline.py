@@ -0,0 +1,31 @@
+"""
+回覆期限統計測試
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from services.reply_deadline import ReplyDeadline, closed_path, MAX_STATS_PATHS, OTHER_PATH
+
+
+@pytest.fixture(autouse=True)
+def empty_stats(monkeypatch):
+    monkeypatch.setattr(ReplyDeadline, '_stats', {})
+
+
+def event():
+    return SimpleNamespace(timestamp=None, reply_token=None)
+
+
+def test_unknown_names_share_other_bucket():
+    assert closed_path('flow', 'amount', {'amount'}) == 'flow:amount'
+    assert closed_path('postback', '早餐50', ('record',)) == 'postback:other'
+    assert closed_path('postback', '', ('record',)) == 'postback:other'
+
+
+def test_stats_paths_are_bounded():
+    for index in range(MAX_STATS_PATHS + 50):
+        ReplyDeadline._record(event(), f"message:{index}", None)
+    stats = ReplyDeadline.stats()
+    assert len(stats) == MAX_STATS_PATHS + 1
+    assert stats[OTHER_PATH]['replied'] == 50
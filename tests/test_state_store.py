@@ -0,0 +1,83 @@
+"""
+對話狀態儲存測試（記憶體與 SQLite 後端）
+"""
+import time
+
+import pytest
+
+from services.state_store import StateStore, MemoryStateStore, SQLiteStateStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(**options):
+        if request.param == 'sqlite':
+            return SQLiteStateStore(str(tmp_path / 'states.db'), **options)
+        return MemoryStateStore(**options)
+    return make
+
+
+def test_state_store_is_abstract():
+    with pytest.raises(TypeError):
+        StateStore()
+
+
+def test_dict_interface(make_store):
+    store = make_store()
+    store['U1'] = {'waiting_for': 'amount', 'type': 'expense'}
+    assert 'U1' in store
+    assert store['U1']['waiting_for'] == 'amount'
+    assert len(store) == 1
+
+    # 讀取返回副本，修改後需重新寫入
+    store.get('U1')['waiting_for'] = 'note'
+    assert store['U1']['waiting_for'] == 'amount'
+
+    assert store.pop('U1')['type'] == 'expense'
+    assert 'U1' not in store
+    with pytest.raises(KeyError):
+        del store['U1']
+
+
+def test_idle_ttl_is_extended_on_read(make_store):
+    store = make_store(ttl=0.3)
+    store.set('U1', {'step': 1})
+    time.sleep(0.2)
+    assert store.get('U1') == {'step': 1}
+    time.sleep(0.2)
+    # 距離寫入已超過存活時間，但讀取延長了閒置時間
+    assert store.get('U1') == {'step': 1}
+    time.sleep(0.4)
+    assert store.get('U1') is None
+
+
+def test_expired_state_leaves_tombstone(make_store):
+    store = make_store(ttl=60)
+    store.set('U1', {'waiting_for': 'amount'}, ttl=0.05)
+    time.sleep(0.06)
+    assert store.get('U1') is None
+    assert store.pop_expired('U1') == {'waiting_for': 'amount'}
+    # 墓碑只取出一次
+    assert store.pop_expired('U1') is None
+
+
+def test_completed_state_has_no_tombstone(make_store):
+    store = make_store()
+    store.set('U1', {'waiting_for': 'amount'})
+    assert store.delete('U1')
+    assert store.pop_expired('U1') is None
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryStateStore(max_entries=2)
+    expired = []
+    store.on_expire = lambda key, state, reason: expired.append((key, reason))
+    store.set('U1', {'step': 1})
+    store.set('U2', {'step': 2})
+    store.get('U1')
+    store.set('U3', {'step': 3})
+
+    assert 'U2' not in store
+    assert expired == [('U2', 'evicted')]
+    assert store.pop_expired('U2') == {'step': 2}
+    assert store.stats()['evicted'] == 1
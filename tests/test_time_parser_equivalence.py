@@ -0,0 +1,93 @@
+"""
+時間表達式解析的等價性測試
+services/time_parser 的結果必須與舊版解析（tests/legacy_time_parser）相同，以下為刻意改變的行為：
+    - 時段與 HH:MM 並用時採用分鐘數，例如「下午3:30」舊版為 15:00，新版為 15:30
+    - 全形數字視同半形，例如「明天９點」
+"""
+import re
+import random
+from datetime import datetime
+
+import pytest
+
+from services.time_parser import resolve_time
+from tests.legacy_time_parser import legacy_resolve_time, legacy_note_reminder_time
+
+NOW = datetime(2024, 3, 15, 10, 20, 30)
+
+
+def call(function, *args):
+    """執行解析函數，例外以類型名稱表示以便比對"""
+    try:
+        return function(*args)
+    except Exception as e:
+        return type(e).__name__
+
+
+DAYS = ['', '今天', '明天', '後天', '大後天']
+PERIODS = ['', '早上', '上午', '凌晨', '下午', '傍晚', '晚上', '夜晚']
+CLOCKS = ['', '{h}點', '{h}時', '{h}點半', '{h}點{m}分', '{h}:{m:02d}', '{h}點{m}']
+
+
+def task_samples(count, seed):
+    """任務提醒的時間文字：相對日期 + 時段 + 時間的組合"""
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(count):
+        clock = rng.choice(CLOCKS).format(h=rng.randint(0, 23), m=rng.choice([0, 5, 15, 30, 45]))
+        samples.append(rng.choice(DAYS) + rng.choice(PERIODS) + clock)
+    samples += ['明天早上9點', '下午3點半', '14:30', '晚上12點', '今天', '', '下午12點', '晚上25點', '早上']
+    return samples
+
+
+def note_samples(count, seed):
+    """筆記提醒的日期時間文字"""
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(count):
+        date = f"{rng.randint(2023, 2025)}-{rng.randint(1, 13)}-{rng.randint(1, 31)}"
+        if rng.random() < 0.6:
+            date += f" {rng.randint(0, 24)}:{rng.randint(0, 59)}"
+        samples.append(date)
+    return samples
+
+
+def is_intentional_change(text):
+    """新版刻意改變行為的輸入"""
+    has_period = any(word in text for word in ('早上', '上午', '凌晨', '下午', '傍晚', '晚上', '夜晚'))
+    return has_period and re.search(r'\d+:\d+', text) is not None
+
+
+@pytest.mark.parametrize('seed', [42, 7])
+def test_task_times_match_legacy(seed):
+    mismatches = [
+        (text, call(legacy_resolve_time, text, NOW), call(resolve_time, text, NOW))
+        for text in task_samples(5000, seed)
+        if not is_intentional_change(text) and call(legacy_resolve_time, text, NOW) != call(resolve_time, text, NOW)
+    ]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize('seed', [42, 7])
+def test_note_times_match_legacy(seed):
+    mismatches = [
+        (text, call(legacy_note_reminder_time, text), call(resolve_time, text, NOW))
+        for text in note_samples(1000, seed)
+        if call(legacy_note_reminder_time, text) != call(resolve_time, text, NOW)
+    ]
+    assert mismatches == []
+
+
+# ---- 刻意改變的行為 ----
+
+@pytest.mark.parametrize('text, legacy, expected', [
+    ('下午3:30', datetime(2024, 3, 16, 15, 0), datetime(2024, 3, 16, 15, 30)),
+    ('明天早上8:45', datetime(2024, 3, 16, 8, 0), datetime(2024, 3, 16, 8, 45)),
+])
+def test_period_with_minutes_keeps_minutes(text, legacy, expected):
+    assert legacy_resolve_time(text, NOW) == legacy
+    assert resolve_time(text, NOW) == expected
+
+
+def test_full_width_digits():
+    assert resolve_time('明天９點', NOW) == resolve_time('明天9點', NOW) == datetime(2024, 3, 16, 9, 0)